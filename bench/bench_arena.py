@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Many programs kept alive as symbol trees and as Arenas."""
+
+import gc
+import pickle
+import tracemalloc
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.arena
+import thicc.generator
+from common import makeSource, timeit
+
+def measure(make, copies):
+    # Memory held by copies objects from make(), and the time for a full
+    # collection while they are alive.
+    gc.collect()
+    tracemalloc.start()
+    held = [make() for i in range(copies)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    t = timeit(gc.collect)
+    return held, size, t
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark the arena AST store.")
+    ap.add_argument("--size", type=float, default=0.2,
+                    help="Source size in MB")
+    ap.add_argument("--copies", type=int, default=5,
+                    help="Number of programs kept alive")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 2**20))
+    toks = thicc.lexer.Lexer(output="buffer").tokenize(text)
+    parser = thicc.parser.Parser()
+    ast = parser.parse(toks)
+
+    def makeTree():
+        return pickle.loads(pickle.dumps(ast, pickle.HIGHEST_PROTOCOL))
+
+    def makeArena():
+        return thicc.arena.fromAST(ast)
+
+    for name, make in [("tree", makeTree), ("arena", makeArena)]:
+        held, size, t = measure(make, args.copies)
+        data = pickle.dumps(held[0], pickle.HIGHEST_PROTOCOL)
+        print("{0:>6s}: {1:8.1f} MB held  {2:8.4f} s per gc"
+              "  {3:8.1f} kB pickled".format(name, size/2**20, t,
+                                                len(data)/1024))
+        del held
+    print("fromAST: {0:8.4f} s".format(timeit(makeArena)))
+    arena = makeArena()
+    print("  toAST: {0:8.4f} s".format(timeit(arena.toAST)))
+
+    def generate(tree):
+        return thicc.generator.Generator_x86_64().generate(tree)
+
+    print("generate tree: {0:8.4f} s".format(timeit(generate, ast)))
+    print("generate arena: {0:8.4f} s".format(timeit(generate, arena)))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Memory held by a parsed AST, in bytes per node."""
+
+import gc
+import tracemalloc
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.symbol
+from common import makeSource
+
+def countNodes(ast):
+    # Nodes in the tree, found by walking it as validate() does.
+    n = 0
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        n += 1
+        stack.extend(node.check())
+    return n
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Measure memory used by the AST.")
+    ap.add_argument("--size", type=float, default=1.0,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 1024 * 1024))
+    # Tokens come from a buffer made beforehand, so only the tree and the
+    # Identifier and Constant tokens made for it are counted.
+    toks = thicc.lexer.Lexer(output="buffer").tokenize(text)
+    parser = thicc.parser.Parser()
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    ast = parser.parse(toks)
+    after = tracemalloc.get_traced_memory()[0]
+    # The same without the tokens made for the tree's leaves.
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, "*tokenbuffer.py"),
+                    tracemalloc.Filter(False, "*token.py")])
+    tracemalloc.stop()
+    nodes = sum([stat.size for stat in snapshot.statistics("filename")])
+
+    n = countNodes(ast)
+    print("nodes:            {0:d}".format(n))
+    print("bytes per node:   {0:.1f}".format((after-before)/n))
+    print("  without tokens: {0:.1f}".format(nodes/n))
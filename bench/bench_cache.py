@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Parsing with and without the parse cache, in memory and on disk."""
+
+import argparse as ag
+import tempfile
+import thicc.compiler
+import thicc.cache
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark the parse cache.")
+    ap.add_argument("--size", type=float, default=0.2,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 2**20))
+
+    with tempfile.TemporaryDirectory() as d:
+        cache = thicc.cache.ParseCache(directory=d)
+        compiler = thicc.compiler.Compiler(cache=cache)
+        compiler.parse(text)
+
+        def parseCold():
+            thicc.compiler.Compiler().parse(text)
+
+        def parseDisk():
+            cache.clear()
+            compiler.parse(text)
+
+        def parseMemory():
+            compiler.parse(text)
+
+        for name, func in [("no cache", parseCold), ("disk hit", parseDisk),
+                            ("memory hit", parseMemory)]:
+            t = timeit(func)
+            print("{0:>10s}: {1:8.4f} s".format(name, t))
+        print(cache.stats())
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Parsing and code generation of deeply nested expressions."""
+
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.generator
+from common import timeit
+
+SHAPES = {
+    "parens": lambda n: "(" * n + "a" + ")" * n,
+    "unary": lambda n: "-!" * (n//2) + "a",
+    "binop": lambda n: "(a + " * n + "b" + ")" * n,
+    "ternary": lambda n: "a ? b : " * n + "c"}
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark deep expressions.")
+    ap.add_argument("--depth", type=int, nargs="+",
+                    default=[10000, 100000, 200000],
+                    help="Nesting depths to time")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    lexer = thicc.lexer.Lexer(output="buffer")
+    parser = thicc.parser.Parser()
+    generator = thicc.generator.Generator_x86_64()
+
+    for name, shape in SHAPES.items():
+        for depth in args.depth:
+            text = "int main() { int a = 1; int b = 2; int c = 3; return "\
+                    + shape(depth) + "; }"
+            toks = lexer.tokenize(text)
+            tParse = timeit(parser.parse, toks, repeat=args.repeat)
+            ast = parser.parse(toks)
+            tGen = timeit(generator.generate, ast, repeat=args.repeat)
+            print("{0:>8s} {1:7d}: parse {2:7.3f} s ({3:6.2f} us/level)"
+                  "  generate {4:7.3f} s ({5:6.2f} us/level)".format(
+                    name, depth, tParse, 1e6*tParse/depth,
+                    tGen, 1e6*tGen/depth))
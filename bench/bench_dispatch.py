@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Parser dispatch: statements and factors from a long function body."""
+
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.cursor
+from common import timeit
+
+STATEMENTS = """
+    a = b + 1;
+    if (a) b = -a; else b = !a;
+    while (b > 0) b--;
+    for (c = 0; c < 10; c++) ;
+    do { a += ~b; } while (a < 0);
+    {}
+    return a ? b : c;
+"""
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark parser dispatch.")
+    ap.add_argument("--count", type=int, default=5000,
+                    help="Repeats of the statement block")
+    args = ap.parse_args()
+
+    toks = thicc.lexer.Lexer(output="buffer").tokenize(
+                                                STATEMENTS * args.count)
+    parser = thicc.parser.Parser()
+
+    def parseAll():
+        tokens = thicc.cursor.TokenCursor(toks)
+        while tokens.peek() is not None:
+            parser.parseStatement(tokens)
+
+    t = timeit(parseAll, repeat=10)
+    print("statements: {0:8.3f} s  {1:10.0f} tok/s".format(t, len(toks)/t))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Expression parsing on long flat and deeply nested expressions."""
+
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.cursor
+from common import timeit
+
+OPS = ["||", "&&", "|", "^", "&", "==", "!=", "<", "<=", ">", ">=", "<<",
+        ">>", "+", "-", "*", "/", "%"]
+
+def flat(n):
+    # a0 op a1 op a2 ... with the operators cycling through all levels.
+    parts = ["a0"]
+    for i in range(1, n):
+        parts.append(OPS[i % len(OPS)])
+        parts.append("a{0:d}".format(i))
+    return " ".join(parts)
+
+def nested(depth):
+    # (a0 op (a1 op (a2 op ...))) nested depth deep.
+    return "".join(["(a{0:d} {1:s} ".format(i, OPS[i % len(OPS)])
+                    for i in range(depth)]) + "b" + ")" * depth
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark expression parsing.")
+    ap.add_argument("--terms", type=int, default=20000,
+                    help="Operands in the flat expression")
+    ap.add_argument("--depth", type=int, default=50,
+                    help="Nesting depth of the nested expressions")
+    ap.add_argument("--count", type=int, default=200,
+                    help="Number of nested expressions")
+    args = ap.parse_args()
+
+    lexer = thicc.lexer.Lexer(output="buffer")
+    parser = thicc.parser.Parser()
+
+    def parseAll(toks, n):
+        tokens = thicc.cursor.TokenCursor(toks)
+        for i in range(n):
+            parser.parseExpression(tokens)
+            tokens.advance()
+
+    for name, text, n in [
+            ("flat", flat(args.terms) + ";", 1),
+            ("nested", (nested(args.depth) + ";") * args.count, args.count)]:
+        toks = lexer.tokenize(text)
+        t = timeit(parseAll, toks, n)
+        print("{0:>7s}: {1:8.3f} s  {2:10.0f} tok/s".format(
+                name, t, len(toks)/t))
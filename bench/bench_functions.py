@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Parsing programs with very many functions, and looking them up."""
+
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+from common import timeit
+
+def makeFunctions(n):
+    # n functions, each declared before it is defined.
+    decls = ["int f{0:d}();\n".format(i) for i in range(n)]
+    defs = ["int f{0:d}() {{ return {0:d}; }}\n".format(i) for i in range(n)]
+    return "".join(decls + defs)
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark the function table.")
+    ap.add_argument("--count", type=int, default=100000,
+                    help="Number of functions")
+    args = ap.parse_args()
+
+    lexer = thicc.lexer.Lexer(output="buffer")
+    parser = thicc.parser.Parser(strict=False)
+    for n in [args.count//10, args.count]:
+        toks = lexer.tokenize(makeFunctions(n))
+        t = timeit(parser.parse, toks, repeat=3)
+        ast = parser.parse(toks)
+        names = ["f{0:d}".format(i) for i in range(n)]
+
+        def lookupAll():
+            for name in names:
+                ast.functions.lookup(name)
+
+        print("{0:7d} functions: parse {1:7.3f} s  ({2:5.2f} us each)"
+              "  lookup {3:5.3f} us".format(n, t, 1e6*t/n,
+                                            1e6*timeit(lookupAll)/n))
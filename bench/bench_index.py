@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Questions about a tree, by walking it and from an ASTIndex."""
+
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.symbol
+import thicc.index
+from common import makeSource, timeit
+
+def walkUses(ast, func, name):
+    # The references to name in func, found by walking the whole tree.
+    found = []
+    stack = [(ast, None)]
+    while stack:
+        node, inFunc = stack.pop()
+        if isinstance(node, thicc.symbol.FunctionD):
+            inFunc = node.name.val
+        elif isinstance(node, thicc.symbol.VarRefE)\
+                and inFunc == func and node.id.val == name:
+            found.append(node)
+        stack.extend([(child, inFunc)
+                        for child in thicc.symbol.nodeChildren(node)])
+    return found
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark the AST index.")
+    ap.add_argument("--size", type=float, default=1.0,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 2**20))
+    ast = thicc.parser.Parser().parse(
+                thicc.lexer.Lexer(output="buffer").tokenize(text))
+    index = thicc.index.ASTIndex(ast)
+    func = ast.declarations[len(ast.declarations)//2]
+
+    print("build index:  {0:8.4f} s".format(
+            timeit(thicc.index.ASTIndex, ast, repeat=3)))
+    print("walk query:   {0:8.4f} s".format(
+            timeit(walkUses, ast, func.name.val, "a", repeat=3)))
+    print("index query:  {0:8.6f} s".format(
+            timeit(index.uses, func.name.val, "a")))
+    print("replace body: {0:8.6f} s".format(
+            timeit(index.replaceBody, func, func.body)))
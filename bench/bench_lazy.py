@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""Parsing a large file strictly, and lazily with function bodies skipped."""
+
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark lazy function bodies.")
+    ap.add_argument("--size", type=float, default=1.0,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 2**20))
+    strict = thicc.parser.Parser()
+    lazy = thicc.parser.Parser(strict=False)
+
+    def parseOne(parser, lexer):
+        # Parse the file and use one function body.
+        ast = parser.parse(lexer.tokenize(text))
+        ast.declarations[len(ast.declarations)//2].body
+
+    for output in ["buffer", "stream"]:
+        lexer = thicc.lexer.Lexer(output=output)
+        for name, parser in [("strict", strict), ("lazy", lazy)]:
+            t = timeit(parseOne, parser, lexer, repeat=3)
+            print("{0:>6s} {1:>6s}: {2:8.3f} s  {3:8.2f} MB/s".format(
+                    output, name, t, args.size/t))
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""Lexer throughput for each engine."""
+
+import argparse as ag
+import thicc.lexer
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark the thicc lexer.")
+    ap.add_argument("--size", type=float, default=2.0,
+                    help="Source size in MB")
+    ap.add_argument("--engines", nargs='+', default=["scalar", "regex"])
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 1024 * 1024))
+    mb = len(text) / (1024.0 * 1024.0)
+
+    for engine in args.engines:
+        lexer = thicc.lexer.Lexer(engine)
+        ntok = len(lexer.tokenize(text))
+        t = timeit(lexer.tokenize, text)
+        print("{0:>8s}: {1:8.3f} s  {2:8.2f} MB/s  {3:10.0f} tok/s".format(
+                engine, t, mb/t, ntok/t))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Peak memory of lexing a file read into a str versus memory-mapped.
+
+Each mode runs in a fresh interpreter.  Mapped pages of the file are
+counted in RSS while they are resident, but they are clean and shared
+with the page cache rather than private copies.
+"""
+
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+import argparse as ag
+import thicc
+import thicc.lexer
+from common import makeSource
+
+def measure(filename, mode):
+    lexer = thicc.lexer.Lexer(output="buffer")
+    t0 = time.perf_counter()
+    if mode == "read":
+        with open(filename, "r") as f:
+            text = f.read()
+        toks = lexer.tokenize(text)
+        n = len(toks)
+    else:
+        with thicc.mapFile(filename) as text:
+            toks = lexer.tokenize(text)
+            n = len(toks)
+    t1 = time.perf_counter()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print("{0:>5s}: {1:d} tokens  {2:8.1f} MB peak RSS  {3:6.2f} s".format(
+            mode, n, peak, t1-t0))
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Compare str and mmap lexer input.")
+    ap.add_argument("--size", type=float, default=32.0,
+                    help="Source size in MB")
+    ap.add_argument("--file", default=None)
+    ap.add_argument("--mode", default=None)
+    args = ap.parse_args()
+
+    if args.mode is not None:
+        measure(args.file, args.mode)
+    else:
+        with tempfile.NamedTemporaryFile("w", suffix=".c") as f:
+            f.write(makeSource(int(args.size * 1024 * 1024)))
+            f.flush()
+            for mode in ["read", "mmap"]:
+                subprocess.run([sys.executable, __file__, "--file", f.name,
+                                "--mode", mode])
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""Where the numpy lexer engine overtakes the scalar and regex engines."""
+
+import argparse as ag
+import thicc.lexer
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Find the numpy engine crossover.")
+    ap.add_argument("--sizes", type=int, nargs='+',
+                    default=[256, 1024, 4096, 16384, 65536, 262144, 1048576],
+                    help="Source sizes in bytes")
+    ap.add_argument("--engines", nargs='+',
+                    default=["scalar", "regex", "numpy"])
+    args = ap.parse_args()
+
+    if thicc.lexer.np is None:
+        print("NumPy is not installed: the numpy engine is the regex engine.")
+
+    lexers = [thicc.lexer.Lexer(engine, output="buffer")
+                for engine in args.engines]
+    print("{0:>10s}".format("bytes") + "".join(["{0:>12s}".format(e)
+                                                for e in args.engines])
+            + "  fastest")
+    for size in args.sizes:
+        text = makeSource(size)
+        repeat = max(3, min(200, 1048576 // len(text)))
+        times = [timeit(lexer.tokenize, text, repeat=repeat)
+                    for lexer in lexers]
+        best = args.engines[times.index(min(times))]
+        print("{0:10d}".format(len(text))
+                + "".join(["{0:10.3f}ms".format(1000*t) for t in times])
+                + "  " + best)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""Parser throughput on a pre-lexed token buffer."""
+
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark the thicc parser.")
+    ap.add_argument("--size", type=float, default=1.0,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 1024 * 1024))
+    toks = thicc.lexer.Lexer(output="buffer").tokenize(text)
+    parser = thicc.parser.Parser()
+
+    t = timeit(parser.parse, toks, repeat=3)
+    print("parse: {0:8.3f} s  {1:10.0f} tok/s".format(t, len(toks)/t))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Cost of source positions relative to lexing.
+
+Tokens only store their start offset.  The line index is built on the
+first lookup and each lookup is a bisection, so both are reported as a
+fraction of the time it takes to lex the source.
+"""
+
+import random
+import argparse as ag
+import thicc.lexer
+import thicc.position
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark source positions.")
+    ap.add_argument("--size", type=float, default=2.0,
+                    help="Source size in MB")
+    ap.add_argument("--lookups", type=int, default=1000)
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 1024 * 1024))
+    lexer = thicc.lexer.Lexer(output="buffer")
+    buf = lexer.tokenize(text)
+    rng = random.Random(0)
+    idx = [rng.randrange(len(buf)) for i in range(args.lookups)]
+
+    def build(text):
+        thicc.position.LineIndex(text).build()
+
+    def lookup(buf, idx):
+        for i in idx:
+            buf.location(i)
+
+    tLex = timeit(lexer.tokenize, text)
+    tBuild = timeit(build, text)
+    buf.lines.build()
+    tLookup = timeit(lookup, buf, idx)
+
+    print("lex:               {0:8.4f} s".format(tLex))
+    print("build line index:  {0:8.4f} s  ({1:5.2f}% of lex)".format(
+            tBuild, 100*tBuild/tLex))
+    print("{0:d} lookups:     {1:8.4f} s  ({2:5.2f}% of lex)".format(
+            args.lookups, tLookup, 100*tLookup/tLex))
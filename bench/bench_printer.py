@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Printing a parsed file, as scripts/thicc --parse does."""
+
+import time
+import tracemalloc
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.printer
+from common import makeSource
+
+class Sink():
+    # Counts what is written and notes when the first line came.
+    def __init__(self):
+        self.first = None
+        self.size = 0
+
+    def write(self, text):
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.size += len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark the tree printer.")
+    ap.add_argument("--size", type=float, default=2.0,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 2**20))
+    lexer = thicc.lexer.Lexer(output="stream")
+    parser = thicc.parser.Parser(strict=False)
+
+    for jsonl in [False, True]:
+        sink = Sink()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        decs = parser.parseIter(lexer.tokenize(text))
+        thicc.printer.writeProgram(decs, sink, jsonl)
+        t1 = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{0:>5s}: first line {1:7.3f} s  total {2:7.3f} s  "
+              "{3:8.1f} MB out  {4:6.2f} MB peak".format(
+                    "jsonl" if jsonl else "text", sink.first-t0, t1-t0,
+                    sink.size/2**20, peak/2**20))
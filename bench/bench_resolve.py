@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Code generation for variables used deep inside nested blocks."""
+
+import argparse as ag
+import thicc.token as tok
+import thicc.symbol as sym
+import thicc.generator
+from common import timeit
+
+def nested(depth, uses):
+    # main() with a declared at the top and used uses times in the
+    # innermost of depth nested blocks, each declaring a variable of its
+    # own.  Built directly since the parser reads statements recursively.
+    a = tok.Identifier("a")
+    b = tok.Identifier("b")
+    expr = sym.VarRefE(a)
+    for i in range(uses-1):
+        expr = sym.BinaryOpE(tok.Add(), expr, sym.VarRefE(a))
+    stmnt = sym.CompoundS([sym.ExpressionS(sym.AssignE(a, tok.Assign(),
+                                                            expr))])
+    for i in range(depth):
+        stmnt = sym.CompoundS([sym.VariableD(b, sym.ConstantE(tok.IntC("1"))),
+                                stmnt])
+    body = sym.CompoundS([sym.VariableD(a), stmnt,
+                            sym.ReturnS(sym.VarRefE(a))])
+    return sym.Program([sym.FunctionD(tok.Identifier("main"), None, body)])
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark variable lookups.")
+    ap.add_argument("--depth", type=int, nargs="+",
+                    default=[1, 10, 100, 1000],
+                    help="Block nesting depths to time")
+    ap.add_argument("--uses", type=int, default=10000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    generator = thicc.generator.Generator_x86_64()
+
+    for depth in args.depth:
+        prog = nested(depth, args.uses)
+        t = timeit(generator.generate, prog, repeat=args.repeat)
+        print("depth {0:5d}: {1:7.3f} s ({2:6.2f} us/use)".format(
+                depth, t, 1e6*t/args.uses))
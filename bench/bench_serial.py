@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""Writing and reading an AST and its tokens with thicc.serial."""
+
+import pickle
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+import thicc.serial
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark AST serialization.")
+    ap.add_argument("--size", type=float, default=0.5,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 2**20))
+    toks = thicc.lexer.Lexer().tokenize(text)
+    ast = thicc.parser.Parser().parse(toks)
+
+    for name, obj in [("tokens", toks), ("ast", ast)]:
+        for method, dumps, loads in [
+                ("serial", thicc.serial.dumps, thicc.serial.loads),
+                ("pickle", lambda obj: pickle.dumps(obj, -1), pickle.loads)]:
+            data = dumps(obj)
+            tDump = timeit(dumps, obj, repeat=3)
+            tLoad = timeit(loads, data, repeat=3)
+            print("{0:>6s} {1:>6s}: {2:9.1f} kB  dump {3:7.3f} s"
+                  "  load {4:7.3f} s".format(name, method, len(data)/1024,
+                                                tDump, tLoad))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""Parsing with and without shared expressions, and comparing the trees."""
+
+import gc
+import tracemalloc
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+from common import makeSource, timeit
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Benchmark hash-consed expressions.")
+    ap.add_argument("--size", type=float, default=0.5,
+                    help="Source size in MB")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 2**20))
+    toks = thicc.lexer.Lexer(output="buffer").tokenize(text)
+
+    for name, share in [("plain", False), ("shared", True)]:
+        parser = thicc.parser.Parser(share=share)
+        t = timeit(parser.parse, toks, repeat=3)
+        gc.collect()
+        tracemalloc.start()
+        trees = [parser.parse(toks), parser.parse(toks)]
+        size = tracemalloc.get_traced_memory()[0] / 2
+        tracemalloc.stop()
+        eq = timeit(trees[0].__eq__, trees[1], repeat=3)
+        print("{0:>6s}: parse {1:7.3f} s  {2:6.1f} MB  compare {3:7.4f} s"
+              .format(name, t, size/2**20, eq))
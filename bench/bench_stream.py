@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Peak memory of parsing from each lexer output.
+
+The peak over what the finished AST keeps alive is the transient cost of
+the tokens; for the stream output it shouldn't grow with the source size.
+"""
+
+import tracemalloc
+import argparse as ag
+import thicc.lexer
+import thicc.parser
+from common import makeSource
+
+def measure(output, text):
+    lexer = thicc.lexer.Lexer(output=output)
+    parser = thicc.parser.Parser()
+    tracemalloc.start()
+    ast = parser.parse(lexer.tokenize(text))
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del ast
+    return peak, kept
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Compare parser peak memory.")
+    ap.add_argument("--sizes", type=float, nargs='+', default=[0.25, 1, 4],
+                    help="Source sizes in MB")
+    ap.add_argument("--outputs", nargs='+',
+                    default=["list", "buffer", "stream"])
+    args = ap.parse_args()
+
+    for size in args.sizes:
+        text = makeSource(int(size * 1024 * 1024))
+        for output in args.outputs:
+            peak, kept = measure(output, text)
+            print("{0:6.2f} MB {1:>7s}: {2:8.1f} MB peak  {3:8.1f} MB AST"
+                    "  {4:8.1f} MB transient".format(size, output,
+                    peak/2.0**20, kept/2.0**20, (peak-kept)/2.0**20))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Memory of the list and buffer lexer outputs.
+
+Each output mode is measured in a fresh interpreter so that the peak RSS
+reported is for that mode alone.
+"""
+
+import sys
+import resource
+import subprocess
+import tracemalloc
+import argparse as ag
+import thicc.lexer
+from common import makeSource, timeit
+
+def measure(output, size):
+    text = makeSource(int(size * 1024 * 1024))
+    lexer = thicc.lexer.Lexer(output=output)
+
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    toks = lexer.tokenize(text)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    n = len(toks)
+    del toks
+
+    # tracemalloc has its own overhead, so only start it after the RSS
+    # measurement.
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    toks = lexer.tokenize(text)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del toks
+
+    t = timeit(lexer.tokenize, text, repeat=3)
+
+    mb = len(text) / (1024.0 * 1024.0)
+    print("{0:>7s}: {1:9.0f} tok/MB  {2:6.1f} B/tok  {3:8.1f} MB peak RSS"
+            "  (+{4:.1f} MB)  {5:6.3f} s".format(
+            output, n/mb, (after-before)/n, peak/1024.0, (peak-base)/1024.0,
+            t))
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Compare lexer output memory.")
+    ap.add_argument("--size", type=float, default=4.0,
+                    help="Source size in MB")
+    ap.add_argument("--output", default=None)
+    args = ap.parse_args()
+
+    if args.output is not None:
+        measure(args.output, args.size)
+    else:
+        for output in ["list", "buffer"]:
+            subprocess.run([sys.executable, __file__, "--size",
+                            str(args.size), "--output", output])
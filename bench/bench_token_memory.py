@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Memory held by the lexer's token list, in bytes per token."""
+
+import gc
+import tracemalloc
+import argparse as ag
+import thicc.lexer
+from common import makeSource
+
+if __name__ == "__main__":
+
+    ap = ag.ArgumentParser(description="Measure memory used by tokens.")
+    ap.add_argument("--size", type=float, default=1.0,
+                    help="Source size in MB")
+    ap.add_argument("--engine", default="regex")
+    args = ap.parse_args()
+
+    text = makeSource(int(args.size * 1024 * 1024))
+    lexer = thicc.lexer.Lexer(args.engine)
+    lexer.tokenize("int main() { return 0; }")
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    toks = lexer.tokenize(text)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n = len(toks)
+    print("tokens:           {0:d}".format(n))
+    print("bytes per token:  {0:.1f}".format((after-before)/n))
+    print("peak per token:   {0:.1f}".format((peak-before)/n))
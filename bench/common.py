@@ -0,0 +1,44 @@
+"""Helpers shared by the benchmark scripts."""
+
+import time
+
+FUNC = """int f{0:d}() {{
+    int a = {0:d};
+    int b = 3; // a comment
+    /* a block
+       comment */
+    for (int i = 0; i < 10; i = i + 1) {{
+        a += b * (i - 2) << 1;
+        if (a >= 100 && b != 0)
+            a = a % 7;
+        else
+            b = b ^ a | 2;
+    }}
+    while (b > 0) b--;
+    return a ? a : -b;
+}}
+"""
+
+def makeSource(nbytes):
+    # Generate a C source of roughly nbytes bytes made of many small
+    # functions.
+    parts = []
+    size = 0
+    i = 0
+    while size < nbytes:
+        part = FUNC.format(i)
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+def timeit(func, *args, repeat=5):
+    # Best wall time of several runs, in seconds.
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        t1 = time.perf_counter()
+        if best is None or t1-t0 < best:
+            best = t1-t0
+    return best
@@ -3,7 +3,7 @@
 from setuptools import setup
 import imp
 
-version = imp.load_source('thicc.version', 'version.py')
+version = imp.load_source('thicc.version', 'thicc/version.py')
 
 setup(
         name = 'thicc',
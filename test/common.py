@@ -0,0 +1,37 @@
+import os
+import thicc.exception
+
+def dataFiles(path="test/data"):
+    # The name and text of each C file under path.
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            if filename[-2:] != ".c":
+                continue
+            with open(os.path.join(root, filename), "r") as f:
+                yield filename, f.read()
+
+def result(func, text):
+    # func(text), or the class of the ThiccError it raises.
+    try:
+        return func(text)
+    except thicc.exception.ThiccError as e:
+        return e.__class__
+
+
+class DataTests():
+    # A mixin for unittest.TestCase classes that run the sample programs
+    # in test/data through different pipelines.
+
+    def compareData(self, first, *others, skip=()):
+        # Check that each of others gives what first does for every file:
+        # an equal result, or an error of the same class.  Files that first
+        # fails on with an error in skip (a class or a tuple of them) are
+        # left out, for pipelines that find fewer errors or find them in
+        # another order (e.g. a lazy parse).
+        for filename, text in dataFiles():
+            expected = result(first, text)
+            if isinstance(expected, type) and issubclass(expected, skip):
+                continue
+            for other in others:
+                self.assertEqual(result(other, text), expected,
+                                    msg=filename)
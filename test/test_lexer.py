@@ -1,8 +1,13 @@
 import unittest
+import os
+import random
+import pickle
+import thicc
 import thicc.lexer
 import thicc.token as token
+from . import common
 
-class TestLexer(unittest.TestCase):
+class TestLexer(common.DataTests, unittest.TestCase):
 
     def compareSingleToken(self, txt, cls):
         lexer = thicc.lexer.Lexer()
@@ -29,6 +34,18 @@ class TestLexer(unittest.TestCase):
         lexer = thicc.lexer.Lexer()
         self.assertRaises(e, lexer.tokenize, txt)
 
+    def lexResult(self, lexer, txt):
+        try:
+            return lexer.tokenize(txt)
+        except thicc.lexer.LexError as e:
+            return (e.__class__, e.expression)
+
+    def compareEngines(self, txt, engine):
+        scalar = thicc.lexer.Lexer("scalar")
+        other = thicc.lexer.Lexer(engine)
+        self.assertEqual(self.lexResult(scalar, txt),
+                            self.lexResult(other, txt), msg=repr(txt))
+
     def test_punct_single(self):
         self.compareSingleToken(';', token.Semicolon)
         self.compareSingleToken('{', token.OpenBrace)
@@ -288,6 +305,287 @@ class TestLexer(unittest.TestCase):
                 token.Semicolon, token.ClosedBrace]
         self.compareMultiToken(txt, cls, val)
 
+    def test_punct_runs(self):
+        txt = "a+=b<<=c!=d"
+        cls = [token.Identifier, token.AssignAdd, token.Identifier,
+                token.AssignBShiftL, token.Identifier, token.NotEqual,
+                token.Identifier]
+        val = ["a", "", "b", "", "c", "", "d"]
+        self.compareMultiToken(txt, cls, val)
+        txt = "!!=<<<=>>>=&&&|||+++---"
+        cls = [token.Not, token.NotEqual, token.BitShiftL,
+                token.LessThanEqual, token.BitShiftR, token.GreaterThanEqual,
+                token.And, token.BitAnd, token.Or, token.BitOr,
+                token.Increment, token.Add, token.Decrement, token.Neg]
+        val = [""] * len(cls)
+        self.compareMultiToken(txt, cls, val)
+        self.compareEngines(txt, "regex")
+        self.compareEngines("a-/**/=b//x\n-=c", "regex")
+
+    def test_interned_tokens(self):
+        for engine in ["scalar", "regex"]:
+            lexer = thicc.lexer.Lexer(engine)
+            toks = lexer.tokenize("int a = a; int b;")
+            self.assertIs(toks[0], toks[5])
+            self.assertIs(toks[0], token.Int())
+            self.assertIs(toks[4], token.Semicolon())
+            self.assertIs(toks[1].val, toks[3].val)
+            self.assertEqual(toks[1], token.Identifier("a"))
+            self.assertNotEqual(toks[1], toks[6])
+            self.assertFalse(hasattr(toks[1], "__dict__"))
+            self.assertFalse(hasattr(toks[2], "__dict__"))
+
+    def test_categories(self):
+        for cls in token.kinds:
+            for cat, mask in token.masks.items():
+                self.assertEqual(bool(cls.category & mask),
+                                issubclass(cls, cat), msg=(cls, cat))
+        self.assertTrue(token.Neg().category & token.masks[token.UnaryOp])
+        self.assertTrue(token.Neg().category & token.masks[token.BinaryOp])
+
+    def test_buffer(self):
+        txt = "int foo() {\n  int a = 42; // c\n  return a+=1;\n}"
+        for engine in ["scalar", "regex"]:
+            toks = thicc.lexer.Lexer(engine).tokenize(txt)
+            buf = thicc.lexer.Lexer(engine, output="buffer").tokenize(txt)
+            self.assertEqual(len(buf), len(toks))
+            self.assertEqual(list(buf), toks)
+            self.assertEqual(buf[::-1], toks[::-1])
+            self.assertEqual(buf[-1], token.ClosedBrace())
+            self.assertIs(buf[0], token.Int())
+            self.assertEqual(buf.kinds[1], token.Identifier.kind)
+            self.assertEqual(buf.text(1), "foo")
+            self.assertEqual(buf.text(12), "+=")
+            self.assertEqual(buf[6], token.Identifier("a"))
+            self.assertIs(buf[6], buf[11])
+            for i in range(len(buf)):
+                self.assertEqual(buf.text(i), txt[buf.starts[i]:buf.ends[i]])
+
+    def test_stream(self):
+        txt = "int foo() {\n  int a = 42; // c\n  return a+=1;\n}"
+        toks = thicc.lexer.Lexer().tokenize(txt)
+        self.assertEqual(list(thicc.lexer.Lexer(output="stream")
+                                .tokenize(txt)), toks)
+
+        stream = thicc.lexer.Lexer(output="stream").tokenize(txt)
+        self.assertEqual(stream.peek(2), token.OpenParentheses())
+        self.assertEqual(len(stream.window), 3)
+        self.assertIs(stream.advance(), token.Int())
+        self.assertEqual(stream.advance(), token.Identifier("foo"))
+        self.assertEqual(stream.start, 4)
+        mark = stream.mark()
+        stream.advance()
+        stream.advance()
+        stream.reset(mark)
+        self.assertEqual(stream.start, 4)
+        self.assertEqual(list(stream), toks[2:])
+        self.assertIsNone(stream.peek())
+        self.assertRaises(thicc.symbol.UnexpectedEndError, stream.advance)
+
+    def test_positions(self):
+        txt = "int foo() {\n  int a = 42;\n\n  return a;\n}"
+        buf = thicc.lexer.Lexer(output="buffer").tokenize(txt)
+        self.assertEqual(buf.location(0), (1, 1))
+        self.assertEqual(buf.location(4), (1, 11))
+        self.assertEqual(buf.location(6), (2, 7))
+        self.assertEqual(buf.location(10), (4, 3))
+        self.assertEqual(buf.location(-1), (5, 1))
+
+        for engine in ["scalar", "regex"]:
+            lexer = thicc.lexer.Lexer(engine)
+            with self.assertRaises(thicc.lexer.LexIllegalCharError) as cm:
+                lexer.tokenize("int a;\n  a = $;")
+            self.assertEqual(cm.exception.location, (2, 7))
+            with self.assertRaises(thicc.lexer.LexInvalidIdentifierError) as cm:
+                lexer.tokenize("int a;\n\n a = 2x;")
+            self.assertEqual(cm.exception.location, (3, 6))
+
+    def compareRelex(self, lexer, txt, offset, deleted, inserted):
+        buf = lexer.tokenize(txt)
+        newTxt = txt[:offset] + inserted + txt[offset+deleted:]
+        new = lexer.relex(buf, offset, deleted, inserted)
+        full = lexer.tokenize(newTxt)
+        self.assertEqual(new.source, newTxt)
+        self.assertEqual(new.kinds, full.kinds, msg=repr(newTxt))
+        self.assertEqual(new.starts, full.starts, msg=repr(newTxt))
+        self.assertEqual(new.ends, full.ends, msg=repr(newTxt))
+        self.assertEqual(list(new), list(full))
+        return new
+
+    def test_relex(self):
+        txt = "int a = 1; /* c */ int b = a + 2; // d\nreturn b;"
+        for engine in ["scalar", "regex"]:
+            lexer = thicc.lexer.Lexer(engine, output="buffer")
+            self.compareRelex(lexer, txt, 4, 1, "abc")
+            self.compareRelex(lexer, txt, 5, 0, "x")
+            self.compareRelex(lexer, txt, 8, 1, "")
+            # Open, close and remove comments
+            self.compareRelex(lexer, txt, 11, 0, "/*")
+            self.compareRelex(lexer, txt, 0, 0, "/*")
+            self.compareRelex(lexer, txt, 12, 1, "")
+            self.compareRelex(lexer, txt, 16, 2, "")
+            self.compareRelex(lexer, txt, 34, 1, "")
+            self.compareRelex(lexer, txt, 39, 1, " ")
+            # Merge and split punctuators
+            self.compareRelex(lexer, txt, 6, 1, "<<")
+            self.compareRelex(lexer, txt, 30, 0, "+")
+            self.compareRelex(lexer, txt, len(txt), 0, "++")
+            self.assertRaises(thicc.lexer.LexIllegalCharError,
+                                lexer.relex, lexer.tokenize(txt), 4, 0, "$")
+
+    def test_relex_random(self):
+        frags = ["int", "a", "b1", "42", " ", "\n", "+", "=", "<", "!",
+                "/", "*", "//", "/*", "*/", "(", ")", ";", "return", "-"]
+        rng = random.Random(7)
+        for engine in ["scalar", "regex"]:
+            lexer = thicc.lexer.Lexer(engine, output="buffer")
+            for trial in range(300):
+                n = rng.randint(0, 40)
+                txt = "".join([rng.choice(frags) for i in range(n)])
+                for edit in range(5):
+                    offset = rng.randint(0, len(txt))
+                    deleted = rng.randint(0, min(4, len(txt)-offset))
+                    m = rng.randint(0, 3)
+                    inserted = "".join([rng.choice(frags) for i in range(m)])
+                    newTxt = txt[:offset] + inserted + txt[offset+deleted:]
+                    try:
+                        lexer.tokenize(txt)
+                        lexer.tokenize(newTxt)
+                    except thicc.lexer.LexError:
+                        break
+                    self.compareRelex(lexer, txt, offset, deleted, inserted)
+                    txt = newTxt
+
+    def test_bytes(self):
+        path = "test/data/stage_7/valid/"
+        for engine in ["scalar", "regex"]:
+            lexer = thicc.lexer.Lexer(engine)
+            bufLexer = thicc.lexer.Lexer(engine, output="buffer")
+            for filename in os.listdir(path):
+                with open(path+filename, "r") as f:
+                    text = f.read()
+                toks = lexer.tokenize(text)
+                data = text.encode()
+                for src in [data, bytearray(data), memoryview(data)]:
+                    self.assertEqual(lexer.tokenize(src), toks)
+                    buf = bufLexer.tokenize(src)
+                    self.assertEqual(list(buf), toks)
+                with thicc.mapFile(path+filename) as src:
+                    self.assertEqual(lexer.tokenize(src), toks)
+                    buf = bufLexer.tokenize(src)
+                    self.assertEqual(list(buf), toks)
+            buf = bufLexer.tokenize(b"int a;\nreturn a;")
+            new = bufLexer.relex(buf, 4, 1, b"bc")
+            self.assertEqual(list(new), lexer.tokenize("int bc;\nreturn a;"))
+            self.assertEqual(new.location(4), (2, 8))
+            self.assertEqual(lexer.tokenize(b""), [])
+
+            with self.assertRaises(thicc.lexer.LexIllegalCharError) as cm:
+                lexer.tokenize(b"int a;\n  a = $;")
+            self.assertEqual(cm.exception.expression, "$")
+            self.assertEqual(cm.exception.location, (2, 7))
+            with self.assertRaises(thicc.lexer.LexIllegalCharError) as cm:
+                lexer.tokenize("a = \u00e9;".encode())
+            self.assertEqual(cm.exception.expression, "\ufffd")
+            with self.assertRaises(thicc.lexer.LexInvalidIdentifierError) as cm:
+                lexer.tokenize(b"a = 2x;")
+            self.assertEqual(cm.exception.expression, "2x")
+
+    def test_engine_regex_data(self):
+        self.compareData(thicc.lexer.Lexer("scalar").tokenize,
+                            thicc.lexer.Lexer("regex").tokenize)
+
+    def test_engine_regex_random(self):
+        alphabet = list("ab1 0\n\t/*=<>!&|+-;(){}?:,%^~x9$") \
+                    + ["//", "/*", "*/", "int", "return", "do"]
+        rng = random.Random(42)
+        for i in range(5000):
+            n = rng.randint(0, 12)
+            txt = "".join([rng.choice(alphabet) for j in range(n)])
+            self.compareEngines(txt, "regex")
+
+    def test_engine_regex_exception(self):
+        lexer = thicc.lexer.Lexer("regex")
+        self.assertRaises(thicc.lexer.LexInvalidIdentifierError,
+                            lexer.tokenize, "2x")
+        self.assertRaises(thicc.lexer.LexInvalidIdentifierError,
+                            lexer.tokenize, "2x;")
+        self.assertRaises(thicc.lexer.LexIllegalCharError,
+                            lexer.tokenize, "2x$")
+        self.assertRaises(thicc.lexer.LexIllegalCharError,
+                            lexer.tokenize, "a = $;")
+
+    @unittest.skipIf(thicc.lexer.np is None, "NumPy is not installed")
+    def test_engine_numpy_data(self):
+        lexer = thicc.lexer.Lexer("numpy")
+        self.compareData(thicc.lexer.Lexer("scalar").tokenize, lexer.tokenize,
+                            lambda text: lexer.tokenize(text.encode()))
+
+    @unittest.skipIf(thicc.lexer.np is None, "NumPy is not installed")
+    def test_engine_numpy_random(self):
+        alphabet = list("ab1 0\n\t/*=<>!&|+-;(){}?:,%^~x9$\u00e9") \
+                    + ["//", "/*", "*/", "int", "return", "do"]
+        scalar = thicc.lexer.Lexer("scalar")
+        lexer = thicc.lexer.Lexer("numpy")
+        rng = random.Random(42)
+        for i in range(5000):
+            n = rng.randint(0, 12)
+            txt = "".join([rng.choice(alphabet) for j in range(n)])
+            self.compareEngines(txt, "numpy")
+            data = txt.encode('utf-8')
+            try:
+                expected = list(scalar._scanScalar(data))
+            except thicc.lexer.LexError as e:
+                expected = (e.__class__, e.expression, e.offset)
+            try:
+                result = list(lexer._scanNumpy(data))
+            except thicc.lexer.LexError as e:
+                result = (e.__class__, e.expression, e.offset)
+            self.assertEqual(expected, result, msg=repr(data))
+
+    def test_engine_numpy_fallback(self):
+        lexer = thicc.lexer.Lexer("numpy")
+        if thicc.lexer.np is None:
+            self.assertEqual(lexer.engine, "regex")
+        else:
+            self.assertEqual(lexer.engine, "numpy")
+        self.assertEqual(lexer.tokenize("int x;"),
+                        [token.Int(), token.Identifier("x"), token.Semicolon()])
+
+
+    def test_names(self):
+        text = "int main() { int b = 1; int a = b; return a + b + c; }"
+        for output in ["list", "buffer", "stream"]:
+            lexer = thicc.lexer.Lexer(output=output)
+            toks = list(lexer.tokenize(text))
+            ids = [tok for tok in toks if isinstance(tok, token.Identifier)]
+            self.assertEqual([tok.val for tok in ids],
+                                ["main", "b", "a", "b", "a", "b", "c"])
+            self.assertEqual([tok.ident for tok in ids],
+                                [0, 1, 2, 1, 2, 1, 3], msg=output)
+            # One token per name.
+            self.assertIs(ids[1], ids[3])
+            # Each tokenize() has its own table, but its tokens are equal.
+            again = list(lexer.tokenize("int c;"))
+            self.assertEqual(again[1].ident, 0)
+            self.assertEqual(again[1], ids[-1])
+            # Another table's tokens get the id of their name in this one.
+            self.assertEqual(ids[-1].table.ident(again[1]), 3)
+
+        # A buffer makes its tokens, and so its names, as they are read.
+        buf = thicc.lexer.Lexer(output="buffer").tokenize(text)
+        self.assertEqual(len(buf.names), 0)
+        list(buf)
+        self.assertEqual(len(buf.names), 4)
+        self.assertEqual(buf.names.name(2), "a")
+        self.assertIs(buf.names.identifier("a"), buf[11])
+
+        # Tokens made by hand, or unpickled, belong to no table.
+        tok = pickle.loads(pickle.dumps(buf[11]))
+        self.assertIsNone(tok.table)
+        self.assertEqual(tok, buf[11])
+        self.assertEqual(buf.names.ident(tok), 2)
+        self.assertEqual(buf.names.ident(token.Identifier("d")), 4)
 
 if __name__ == "__main__":
     unittest.main()
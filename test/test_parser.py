@@ -1,30 +1,53 @@
 import unittest
+import os
+import random
+import io
+import copy
+import json
+import pickle
+import tempfile
 import thicc.token as token
 import thicc.symbol as symbol
+import thicc.lexer
 import thicc.parser
-
-class TestParser(unittest.TestCase):
+import thicc.cursor
+import thicc.cache
+import thicc.compiler
+import thicc.generator
+import thicc.arena
+import thicc.serial
+import thicc.printer
+import thicc.index
+import thicc.context
+import thicc.resolver
+from . import common
+
+class TestParser(common.DataTests, unittest.TestCase):
 
     def compareExpression(self, toks, ast0):
         parser = thicc.parser.Parser()
-        ast = parser.parseExpression(toks[::-1])
+        ast = parser.parseExpression(thicc.cursor.TokenCursor(toks))
         self.assertEqual(ast, ast0)
 
     def compareStatement(self, toks, ast0):
         parser = thicc.parser.Parser()
-        ast = parser.parseBlockItem(toks[::-1])
+        ast = parser.parseBlockItem(thicc.cursor.TokenCursor(toks))
         self.assertEqual(ast, ast0)
 
     def compareFunction(self, toks, ast0):
         parser = thicc.parser.Parser()
-        ast = parser.parseFunctionDec(toks[::-1])
+        ast = parser.parseFunctionDec(thicc.cursor.TokenCursor(toks))
         self.assertEqual(ast, ast0)
 
     def compareProgram(self, toks, ast0):
         parser = thicc.parser.Parser()
-        ast = parser.parseProgram(toks[::-1])
+        ast = parser.parseProgram(thicc.cursor.TokenCursor(toks))
         self.assertEqual(ast, ast0)
 
+    def generateCode(self, tree):
+        # A new generator each time, so labels are numbered from the start.
+        return thicc.generator.Generator_x86_64().generate(tree)
+
     def test_expression(self):
 
         toks = [token.IntC("5")]
@@ -221,6 +244,42 @@ class TestParser(unittest.TestCase):
         self.compareExpression(toks, sym)
 
 
+    def test_binaryOp_random(self):
+        # Compare against building the tree one precedence level at a time.
+        parser = thicc.parser.Parser()
+
+        def build(operands, ops, levels):
+            if not levels:
+                return operands[0]
+            groups = [[operands[0]]]
+            joins = []
+            for op, operand in zip(ops, operands[1:]):
+                if type(op) in levels[0]:
+                    joins.append(op)
+                    groups.append([operand])
+                else:
+                    groups[-1].append((op, operand))
+            exprs = []
+            for group in groups:
+                exprs.append(build([group[0]] + [x[1] for x in group[1:]],
+                                    [x[0] for x in group[1:]], levels[1:]))
+            expr = exprs[0]
+            for op, rhs in zip(joins, exprs[1:]):
+                expr = symbol.BinaryOpE(op, expr, rhs)
+            return expr
+
+        classes = [opCls for level in parser.binOpOrder for opCls in level]
+        rng = random.Random(11)
+        for i in range(500):
+            n = rng.randint(1, 12)
+            operands = [symbol.ConstantE(token.IntC(str(j))) for j in range(n)]
+            ops = [rng.choice(classes)() for j in range(n-1)]
+            toks = [operands[0].value]
+            for op, operand in zip(ops, operands[1:]):
+                toks += [op, operand.value]
+            self.compareExpression(toks, build(operands, ops,
+                                                parser.binOpOrder))
+
     def test_assignment(self):
 
         # y
@@ -371,6 +430,56 @@ class TestParser(unittest.TestCase):
                 symbol.ConditionalE(se, sf, sg))
         self.compareExpression(toks, sym)
 
+    def test_deep_nesting(self):
+        # Far deeper than the recursion limit.  The trees are walked in
+        # loops, as == and str() on them would recurse.
+        lexer = thicc.lexer.Lexer()
+        parser = thicc.parser.Parser()
+        n = 30000
+
+        toks = lexer.tokenize("(" * n + "1" + ")" * n)
+        ast = parser.parseExpression(thicc.cursor.TokenCursor(toks))
+        self.assertEqual(ast, symbol.ConstantE(token.IntC("1")))
+
+        toks = lexer.tokenize("-!" * n + "a")
+        ast = parser.parseExpression(thicc.cursor.TokenCursor(toks))
+        for i in range(2*n):
+            self.assertIsInstance(ast, symbol.UnaryOpE)
+            ast = ast.expr
+        self.assertEqual(ast, symbol.VarRefE(token.Identifier("a")))
+
+        toks = lexer.tokenize("a ? b = 1 : " * n + "(1 + (2))")
+        ast = parser.parseExpression(thicc.cursor.TokenCursor(toks))
+        for i in range(n):
+            self.assertIsInstance(ast, symbol.ConditionalE)
+            self.assertIsInstance(ast.true, symbol.AssignE)
+            ast = ast.false
+        self.assertIsInstance(ast, symbol.BinaryOpE)
+
+        toks = lexer.tokenize("a ? " * n + "b" + " : c" * n)
+        ast = parser.parseExpression(thicc.cursor.TokenCursor(toks))
+        for i in range(n):
+            self.assertIsInstance(ast, symbol.ConditionalE)
+            self.assertEqual(ast.false, symbol.VarRefE(token.Identifier("c")))
+            ast = ast.true
+        self.assertEqual(ast, symbol.VarRefE(token.Identifier("b")))
+
+        toks = lexer.tokenize("a = " * n + "a * (b + c)")
+        ast = parser.parseExpression(thicc.cursor.TokenCursor(toks))
+        for i in range(n):
+            self.assertIsInstance(ast, symbol.AssignE)
+            ast = ast.expr
+        self.assertIsInstance(ast, symbol.BinaryOpE)
+
+        text = "int main() { return " + "(1 + " * n + "2" + ")" * n + "; }"
+        ast = parser.parse(lexer.tokenize(text))
+        self.assertIsInstance(ast, symbol.Program)
+
+        self.assertRaises(symbol.UnmatchedParenthesesError,
+                            parser.parseExpression,
+                            thicc.cursor.TokenCursor(lexer.tokenize(
+                                "(" * n + "1" + ")" * (n-1) + ";")))
+
     def test_statement(self):
 
         toks = [token.Return(), token.IntC("36"), token.Semicolon()]
@@ -422,6 +531,682 @@ class TestParser(unittest.TestCase):
 
         self.compareProgram(toks, sym)
 
+    def test_error_position(self):
+        txt = "int foo() {\n  int a = 1;\n  return a\n}"
+        lexer = thicc.lexer.Lexer(output="buffer")
+        parser = thicc.parser.Parser()
+        with self.assertRaises(symbol.MissingSemicolonError) as cm:
+            parser.parse(lexer.tokenize(txt))
+        self.assertEqual(cm.exception.location, (4, 1))
+
+        lexer = thicc.lexer.Lexer(output="stream")
+        with self.assertRaises(symbol.MissingSemicolonError) as cm:
+            parser.parse(lexer.tokenize(txt))
+        self.assertEqual(cm.exception.location, (4, 1))
+
+    def test_cursor(self):
+        toks = [token.Int(), token.Identifier("a"), token.Semicolon()]
+        tokens = thicc.cursor.TokenCursor(toks)
+        self.assertIs(tokens.peek(), toks[0])
+        self.assertIs(tokens.peek(2), toks[2])
+        self.assertIsNone(tokens.peek(3))
+        mark = tokens.mark()
+        self.assertIs(tokens.advance(), toks[0])
+        self.assertIs(tokens.expect(token.Identifier,
+                                    symbol.InvalidDeclarationError), toks[1])
+        tokens.reset(mark)
+        self.assertEqual(tokens.pos, 0)
+        self.assertRaises(symbol.MissingSemicolonError, tokens.expect,
+                            token.Semicolon, symbol.MissingSemicolonError)
+        tokens.reset(3)
+        self.assertRaises(symbol.UnexpectedEndError, tokens.advance)
+        self.assertRaises(symbol.MissingSemicolonError, tokens.expect,
+                            token.Semicolon, symbol.MissingSemicolonError)
+
+        parser = thicc.parser.Parser()
+        lexer = thicc.lexer.Lexer(output="buffer")
+        with self.assertRaises(symbol.MissingSemicolonError) as cm:
+            parser.parse(lexer.tokenize("int main() {\n  return 2"))
+        self.assertEqual(cm.exception.location, (2, 10))
+        self.assertRaises(symbol.UnexpectedEndError, parser.parse,
+                            lexer.tokenize("int main() { return 2 +"))
+        self.assertRaises(symbol.UnmatchedBraceError, parser.parse,
+                            lexer.tokenize("int main() { return 2;"))
+
+    def test_stream(self):
+        lexer = thicc.lexer.Lexer()
+        streamLexer = thicc.lexer.Lexer(output="stream")
+        parser = thicc.parser.Parser()
+        self.compareData(lambda text: parser.parse(lexer.tokenize(text)),
+                    lambda text: parser.parse(streamLexer.tokenize(text)))
+
+    def test_lazy(self):
+        textF = "int f() {\n  int a = 1;\n  { a += 2; }\n  return a;\n}\n"
+        text = textF + "int g();\nint main() {\n  return 2 +;\n}\n"
+        lexers = [thicc.lexer.Lexer(output=output)
+                    for output in ["list", "buffer", "stream"]]
+        strict = thicc.parser.Parser()
+        parser = thicc.parser.Parser(strict=False)
+        with self.assertRaises(symbol.InvalidExpressionError) as cm:
+            strict.parse(lexers[2].tokenize(text))
+        location = cm.exception.location
+
+        for lexer in lexers:
+            ast = parser.parse(lexer.tokenize(text))
+            f, g, main = ast.declarations
+            self.assertIsNotNone(f.parseBody)
+            self.assertIsNone(g.parseBody)
+            self.assertTrue(f.defined and main.defined)
+            self.assertFalse(g.defined)
+            self.assertEqual(f, strict.parse(lexer.tokenize(textF)
+                                                ).declarations[0])
+            self.assertIsNone(f.parseBody)
+            self.assertIsNone(g.body)
+            # The error in main's body comes when it is needed, every
+            # time, and from where it is in the source.
+            for i in range(2):
+                with self.assertRaises(symbol.InvalidExpressionError) as cm:
+                    main.body
+                if lexer.output != "list":
+                    self.assertEqual(cm.exception.location, location)
+            self.assertRaises(symbol.InvalidExpressionError,
+                                thicc.compiler.compileC, text, strict=False)
+
+        # Errors outside the bodies are still found by parse(), and braces
+        # that don't match give the usual error.
+        self.assertRaises(symbol.MultipleDefinitionsOfFunction, parser.parse,
+                            lexers[2].tokenize("int f() { 1 +; } int f() {}"))
+        for lexer in lexers:
+            toks = lexer.tokenize("int f() {}\nint g() {{ return 2 +")
+            with self.assertRaises(symbol.UnexpectedEndError) as cm:
+                parser.parse(toks)
+            if lexer.output != "list":
+                self.assertEqual(cm.exception.location, (2, 21))
+
+        # A lazy parse finds fewer errors, but compiles the same.
+        self.compareData(lambda text: strict.parse(lexers[2].tokenize(text)),
+                    lambda text: parser.parse(lexers[2].tokenize(text)),
+                    skip=thicc.exception.ThiccError)
+        self.compareData(thicc.compiler.compileC,
+                    lambda text: thicc.compiler.compileC(text, strict=False),
+                    skip=symbol.ParseError)
+
+    def test_nodes(self):
+        lexer = thicc.lexer.Lexer()
+        ast = thicc.parser.Parser().parse(lexer.tokenize(
+                "int main() { int a = 1; for (;;) { a = a ? -a : 2; } }"))
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            self.assertFalse(hasattr(node, "__dict__"), msg=node)
+            stack.extend(node.check())
+
+        # Nodes are equal when their fields are.
+        one = token.IntC("1")
+        self.assertEqual(symbol.ConstantE(one),
+                            symbol.ConstantE(token.IntC("1")))
+        self.assertNotEqual(symbol.ConstantE(one), symbol.ReturnS(one))
+        self.assertNotEqual(symbol.WhileS(symbol.ConstantE(one),
+                                            symbol.BreakS()),
+                            symbol.WhileS(symbol.ConstantE(one),
+                                            symbol.ContinueS()))
+
+        # Block items are in a tuple, so no default list can be shared.
+        empty = symbol.CompoundS()
+        self.assertEqual(empty.items, ())
+        block = symbol.CompoundS([symbol.BreakS(), symbol.ContinueS()])
+        self.assertEqual(list(block), [symbol.BreakS(), symbol.ContinueS()])
+        self.assertEqual(block[-1], symbol.ContinueS())
+        self.assertEqual(block, symbol.CompoundS((symbol.BreakS(),
+                                                    symbol.ContinueS())))
+        self.assertEqual(len(block), 2)
+
+    def test_validate(self):
+        # Duplicates are caught while parsing, with or without the full
+        # validate() pass.
+        lexer = thicc.lexer.Lexer()
+        texts = [("int f() { return 1; } int f() { return 2; }",
+                    symbol.MultipleDefinitionsOfFunction),
+                 ("int main() { int a; int b; int a; }",
+                    symbol.MultipleDeclarationsInScope),
+                 ("int main() { int f(); { int f; } int f = 2; }",
+                    symbol.MultipleDeclarationsInScope),
+                 ("int main() { int f() { return 1; } }",
+                    symbol.IllegalFunctionDefinition),
+                 ("int main() { for (int f(); ; ) ; }",
+                    symbol.InvalidForInit)]
+        for validate in [False, True]:
+            for strict in [False, True]:
+                parser = thicc.parser.Parser(strict, validate)
+                for text, error in texts:
+                    with self.assertRaises(error, msg=text):
+                        parser.parse(lexer.tokenize(text)).parseBodies()
+                ast = parser.parse(lexer.tokenize(
+                        "int f(); int f(); int f() { ; } int main() {}"))
+                self.assertEqual(len(ast.declarations), 4)
+
+        ast = thicc.parser.Parser().parse(lexer.tokenize(
+                                            "int main() { return 1; }"))
+        ast.validate()
+        ast.declarations.append(ast.declarations[0])
+        self.assertRaises(symbol.MultipleDefinitionsOfFunction, ast.validate)
+        ast.declarations[1] = symbol.ReturnS(None)
+        self.assertRaises(symbol.NonDeclarationInProgram, ast.validate)
+
+    def test_cache(self):
+        texts = ["int main() {{ return {0:d}; }}".format(i) for i in range(4)]
+        cache = thicc.cache.ParseCache(maxEntries=2)
+        compiler = thicc.compiler.Compiler(cache=cache)
+        ast = compiler.parse(texts[0])
+        self.assertEqual(ast, thicc.compiler.parse(texts[0]))
+        self.assertIs(compiler.parse(texts[0]), ast)
+        self.assertIs(thicc.compiler.parse(texts[0], cache=cache), ast)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        for text in texts:
+            compiler.parse(text)
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.evictions, 2)
+        self.assertIsNot(compiler.parse(texts[0]), ast)
+
+        # The byte cap counts source text.
+        cache = thicc.cache.ParseCache(maxBytes=len(texts[0])*3)
+        for text in texts:
+            thicc.compiler.parse(text, cache=cache)
+        self.assertEqual((len(cache.entries), cache.evictions), (3, 1))
+        self.assertEqual(cache.size, len(texts[0])*3)
+        self.assertNotEqual(cache.key(texts[0]), cache.key(texts[1]))
+        self.assertEqual(cache.key(texts[0]), cache.key(texts[0].encode()))
+
+        # Errors aren't cached.
+        for i in range(2):
+            self.assertRaises(symbol.ParseError, thicc.compiler.parse,
+                                "int main() { return; }", cache=cache)
+        self.assertEqual(cache.misses, 6)
+
+        # Parsers set up differently get entries of their own, and a lazy
+        # parse only raises body errors when the body is used.
+        lazy = thicc.compiler.Compiler(cache=cache, strict=False)
+        self.assertIsNot(lazy.parse(texts[3]), compiler.parse(texts[3]))
+        self.assertNotEqual(cache.key(texts[3], (True,)),
+                            cache.key(texts[3], (False,)))
+        for i in range(2):
+            ast = lazy.parse("int main() { return; }")
+            self.assertRaises(symbol.ParseError,
+                                lambda: ast.declarations[0].body)
+        self.assertEqual(cache.misses, 9)
+
+        with tempfile.TemporaryDirectory() as d:
+            cache = thicc.cache.ParseCache(directory=d)
+            ast = thicc.compiler.parse(texts[0], cache=cache)
+            thicc.compiler.parse(texts[1], cache=cache)
+            cache = thicc.cache.ParseCache(directory=d)
+            self.assertEqual(thicc.compiler.parse(texts[0], cache=cache), ast)
+            self.assertEqual((cache.hits, cache.diskHits, cache.misses),
+                                (1, 1, 0))
+            self.assertEqual(cache.size, len(texts[0]))
+
+            # A damaged file is dropped and the source parsed again.
+            path = cache.path(cache.key(texts[1], (True, False, False)))
+            with open(path, "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                last = f.read(1)
+                f.seek(-1, os.SEEK_END)
+                f.write(bytes([last[0] ^ 1]))
+            ast = thicc.compiler.parse(texts[1], cache=cache)
+            self.assertEqual(ast, thicc.compiler.parse(texts[1]))
+            self.assertEqual((cache.corrupt, cache.misses), (1, 1))
+            cache.clear()
+            self.assertEqual(thicc.compiler.parse(texts[1], cache=cache), ast)
+            self.assertEqual(cache.diskHits, 2)
+
+
+    def test_arena(self):
+        lexer = thicc.lexer.Lexer()
+        parser = thicc.parser.Parser()
+        parse = lambda text: parser.parse(lexer.tokenize(text))
+        arenaOf = lambda text: thicc.arena.fromAST(parse(text))
+
+        def declarations(text):
+            # The program's declarations, rebuilt one at a time.
+            arena = arenaOf(text)
+            self.assertEqual(arena.root, len(arena)-1)
+            self.assertIs(arena.nodeClass(arena.root), symbol.Program)
+            return [arena.toAST(h) for h in arena.childHandles(arena.root)]
+
+        self.compareData(parse, lambda text: arenaOf(text).toAST(),
+            lambda text: pickle.loads(pickle.dumps(arenaOf(text))).toAST())
+        self.compareData(lambda text: parse(text).declarations, declarations)
+        self.compareData(lambda text: self.generateCode(parse(text)),
+                            lambda text: self.generateCode(arenaOf(text)))
+
+        # Skipped bodies are parsed, missing children are kept, and each
+        # distinct token is stored once.
+        text = "int f();\nint main() { if (1) return 1; return 1; }"
+        ast = thicc.parser.Parser(strict=False).parse(lexer.tokenize(text))
+        arena = thicc.arena.fromAST(ast)
+        self.assertEqual(arena.toAST(), thicc.parser.Parser().parse(
+                                            lexer.tokenize(text)))
+        self.assertEqual(len(arena.values), 3)
+        self.assertIn(-1, arena.children)
+        ast.declarations[0].pars = (token.Identifier("a"),
+                                    token.Identifier("f"))
+        arena = thicc.arena.fromAST(ast)
+        self.assertEqual(arena.toAST(), ast)
+        self.assertEqual(len(arena.values), 4)
+
+        # Code is made from the arrays, without rebuilding any nodes, and
+        # the variables are resolved there too.
+        text = "int main() {\n  int a = 1;\n  for (int i = 0; i < 3; i++) {\n"\
+                "    int a = i;\n    if (a) continue;\n    do { break; }"\
+                " while (a);\n  }\n  return a ? -a : ~(a += 2);\n}\n"
+        arena = arenaOf(text)
+        arena.toAST = None
+        self.assertEqual(self.generateCode(arena),
+                            self.generateCode(parse(text)))
+        frame = thicc.resolver.Resolver().resolveArena(arena,
+                                    arena.childHandles(arena.root)[0])
+        self.assertIsInstance(frame, thicc.resolver.ArenaFrame)
+        self.assertEqual(sorted(set(frame.slots.values())), [-24, -16, -8])
+        for text, error in [
+                ("int main() { return b; }",
+                    thicc.context.UnknownIdentifierError),
+                ("int main() { break; }",
+                    thicc.generator.InvalidBreakContextError)]:
+            self.assertRaises(error, self.generateCode, arenaOf(text))
+        n = 30000
+        text = "int main() {{ int a; return {0:s}a{1:s}; }}".format(
+                                                            "(-"*n, ")"*n)
+        self.assertEqual(self.generateCode(arenaOf(text)),
+                            self.generateCode(parse(text)))
+
+    def test_share(self):
+        lexer = thicc.lexer.Lexer()
+        plain = thicc.parser.Parser()
+        for strict in [True, False]:
+            parser = thicc.parser.Parser(strict=strict, share=True)
+            skip = () if strict else symbol.ParseError
+            self.compareData(lambda text: plain.parse(lexer.tokenize(text)),
+                        lambda text: parser.parse(lexer.tokenize(text)),
+                        skip=skip)
+            self.compareData(lambda text: self.generateCode(
+                                        plain.parse(lexer.tokenize(text))),
+                        lambda text: self.generateCode(
+                                        parser.parse(lexer.tokenize(text))),
+                        skip=skip)
+
+        # Pure subexpressions are stored once; those with side effects and
+        # everything above them are not shared.
+        text = "int main() { int a; a = (a+1)*(a+1); return (a=1) + (a=1); }"
+        ast = thicc.parser.Parser(share=True).parse(lexer.tokenize(text))
+        prod = ast.declarations[0].body[1].expr.expr
+        ret = ast.declarations[0].body[2].value
+        self.assertIs(prod.expr1, prod.expr2)
+        self.assertIsNot(ret.expr1, ret.expr2)
+        self.assertEqual(ret.expr1, ret.expr2)
+
+        table = symbol.NodeTable()
+        one = table.make(symbol.ConstantE, token.IntC("1"))
+        a = table.make(symbol.VarRefE, token.Identifier("a"))
+        sum1 = table.make(symbol.BinaryOpE, token.Add(), a, one)
+        sum2 = table.make(symbol.BinaryOpE, token.Add(), a,
+                            table.make(symbol.ConstantE, token.IntC("1")))
+        self.assertIs(sum1, sum2)
+        self.assertEqual(len(table), 3)
+        other = symbol.NodeTable()
+        copy = other.share(symbol.BinaryOpE(token.Add(),
+                    symbol.VarRefE(token.Identifier("a")),
+                    symbol.ConstantE(token.IntC("1"))))
+        self.assertIn(copy, other)
+        self.assertNotIn(copy, table)
+        self.assertEqual(other.hash(copy), table.hash(sum1))
+        self.assertNotEqual(table.hash(a), table.hash(sum1))
+        assign = table.make(symbol.AssignE, token.Identifier("a"),
+                            token.Assign(), one)
+        self.assertNotIn(assign, table)
+        self.assertNotIn(table.make(symbol.UnaryOpE, token.Neg(), assign),
+                            table)
+
+        # Deep trees compare without recursion, shared ones at once.
+        n = 30000
+        deep = [plain.parseExpression(thicc.cursor.TokenCursor(
+                    lexer.tokenize("~"*n + "1"))) for i in range(2)]
+        self.assertEqual(deep[0], deep[1])
+        deep[1] = symbol.NodeTable().share(deep[1])
+        self.assertEqual(deep[1], symbol.NodeTable().share(deep[0]))
+        # Shared nodes carry their structural hash, which __eq__ checks
+        # first, so unequal shared trees are told apart at their roots.
+        deep[0] = symbol.NodeTable().share(deep[0])
+        self.assertEqual(deep[0]._hash, deep[1]._hash)
+        deep[0]._hash += 1
+        self.assertNotEqual(deep[0], deep[1])
+        # The hash is only good in this process, so it isn't pickled or
+        # copied.
+        self.assertIsNone(plain.parseExpression(thicc.cursor.TokenCursor(
+                            lexer.tokenize("a+1")))._hash)
+        self.assertIsNone(pickle.loads(pickle.dumps(sum1))._hash)
+        self.assertEqual(pickle.loads(pickle.dumps(sum1)), sum1)
+        self.assertIsNone(symbol.copyNode(sum1)._hash)
+
+    def test_serial(self):
+        lexer = thicc.lexer.Lexer()
+        bufferLexer = thicc.lexer.Lexer(output="buffer")
+        parser = thicc.parser.Parser()
+        lazy = thicc.parser.Parser(strict=False)
+        dumps = thicc.serial.dumps
+        loads = thicc.serial.loads
+        parse = lambda text: parser.parse(lexer.tokenize(text))
+        self.compareData(lexer.tokenize,
+                            lambda text: loads(dumps(lexer.tokenize(text))))
+        self.compareData(lambda text: dumps(lexer.tokenize(text)),
+                            lambda text: dumps(bufferLexer.tokenize(text)))
+        self.compareData(parse, lambda text: loads(dumps(parse(text))),
+                        lambda text: pickle.loads(pickle.dumps(parse(text))),
+                        lambda text: copy.deepcopy(parse(text)))
+        self.compareData(lambda text: dumps(parse(text)),
+                        lambda text: dumps(lazy.parse(lexer.tokenize(text))),
+                        skip=symbol.ParseError)
+
+        # Files are written in chunks, and deep trees need no recursion.
+        text = "int f{0:d}() {{\n  int a = {0:d};\n  return (a + 2) * a;\n}}\n"
+        ast = parser.parse(lexer.tokenize("".join([text.format(i)
+                                                for i in range(2000)])))
+        f = io.BytesIO()
+        thicc.serial.dump(ast, f)
+        self.assertEqual(f.getvalue(), thicc.serial.dumps(ast))
+        self.assertLess(len(f.getvalue()), len(pickle.dumps(ast.declarations,
+                                                    pickle.HIGHEST_PROTOCOL)))
+        f.seek(0)
+        self.assertEqual(thicc.serial.load(f), ast)
+        n = 30000
+        deep = parser.parseExpression(thicc.cursor.TokenCursor(
+                    lexer.tokenize("~"*n + "1")))
+        self.assertEqual(thicc.serial.loads(thicc.serial.dumps(deep)), deep)
+
+        # Only whole programs are pickled through the format.  Copies are
+        # shallow and leave skipped bodies alone, and a pickled statement
+        # put back in its function compiles the same.
+        text = "int a(); int main() { int a = 1; int b = 2; return b; }"
+        ast = lazy.parse(lexer.tokenize(text))
+        main = copy.copy(ast.declarations[1])
+        self.assertIs(main.name, ast.declarations[1].name)
+        self.assertIsNotNone(main.parseBody)
+        prog = copy.copy(ast)
+        self.assertIsNot(prog.declarations, ast.declarations)
+        self.assertIs(prog.declarations[0], ast.declarations[0])
+        self.assertIsNotNone(ast.declarations[1].parseBody)
+        code = thicc.generator.Generator_x86_64().generate(ast)
+        body = ast.declarations[1].body
+        body.items = body.items[:2] + (pickle.loads(pickle.dumps(body[2])),)
+        self.assertIsNot(body[2].value.id, body[1].id)
+        self.assertEqual(thicc.generator.Generator_x86_64().generate(ast),
+                            code)
+        # A parsed or decoded Program keeps the NameTable of its tokens.
+        self.assertIs(ast.declarations[0].name.table, ast.names)
+        prog = thicc.serial.loads(thicc.serial.dumps(ast))
+        self.assertIs(prog.declarations[1].name.table, prog.names)
+        self.assertEqual(prog.names.names, ["a", "main", "b"])
+
+        data = thicc.serial.dumps(symbol.ReturnS(None))
+        for bad in [b"XXXX" + data[4:], data[:4] + b"\x02" + data[5:],
+                    data[:-1], data + b"\0", data[:5] + b"\x07" + data[6:]]:
+            self.assertRaises(thicc.serial.SerialError,
+                                thicc.serial.loads, bad)
+
+    def test_printer(self):
+        lexer = thicc.lexer.Lexer()
+        text = "int f();\nint main() {\n  int a = 1;\n  for (;;) a++;\n"\
+                "  if (a) return -a; else ;\n}\n"
+        ast = thicc.parser.Parser().parse(lexer.tokenize(text))
+        lines = ["Program",
+                 "   Function: f()",
+                 "   Function: main()",
+                 "      Declaration(Variable): a",
+                 "         Expression(Constant): 1",
+                 "      Statement(For):",
+                 "         NULL",
+                 "         Expression(Constant): 1",
+                 "         NULL",
+                 "         Statement(Expression):",
+                 "            Expression(IncrementPost): ++",
+                 "               Expression(Variable): a",
+                 "      Statement(Conditional):",
+                 "         Expression(Variable): a",
+                 "         Statement(Return):",
+                 "            Expression(UnaryOp): -",
+                 "               Expression(Variable): a",
+                 "         Statement(Expression):",
+                 "            NULL"]
+        self.assertEqual(str(ast), "\n".join(lines) + "\n")
+        f = io.StringIO()
+        thicc.printer.write(ast, f)
+        self.assertEqual(f.getvalue(), str(ast))
+        self.assertEqual(ast.declarations[1].body[0].__str__(level=2),
+                            "\n".join(lines[3:5]) + "\n")
+
+        f = io.StringIO()
+        thicc.printer.write(ast, f, jsonl=True)
+        entries = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual(entries[0], {"depth": 0, "node": "Program"})
+        self.assertEqual(entries[2], {"depth": 1, "field": "declarations",
+                            "node": "FunctionD", "name": "main", "pars": []})
+        self.assertEqual(entries[4], {"depth": 3, "field": "items",
+                                        "node": "VariableD", "id": "a"})
+        self.assertEqual([e["node"] for e in entries if e["depth"] == 4],
+                            ["ConstantE", "ConstantE", "ExpressionS",
+                             "VarRefE", "ReturnS", "ExpressionS"])
+
+        # A program can be printed as its declarations are parsed.
+        for jsonl in [False, True]:
+            for parser in [thicc.parser.Parser(),
+                            thicc.parser.Parser(strict=False, validate=True),
+                            thicc.parser.Parser(share=True)]:
+                f = io.StringIO()
+                thicc.printer.writeProgram(parser.parseIter(
+                                    lexer.tokenize(text)), f, jsonl)
+                g = io.StringIO()
+                thicc.printer.write(ast, g, jsonl)
+                self.assertEqual(f.getvalue(), g.getvalue())
+        decs = thicc.parser.Parser().parseIter(thicc.lexer.Lexer(
+                    output="stream").tokenize("int f();\nint f() { 1 }"))
+        self.assertEqual(next(decs).name.val, "f")
+        with self.assertRaises(symbol.MissingSemicolonError) as cm:
+            next(decs)
+        self.assertEqual(cm.exception.location, (2, 13))
+
+        # Every node gets a line, however deep the tree.  (Text lines are
+        # as long as the tree is deep, so it isn't very deep.)
+        n = 5000
+        deep = thicc.parser.Parser().parseExpression(thicc.cursor.TokenCursor(
+                    lexer.tokenize("~"*n + "1")))
+        for jsonl in [False, True]:
+            f = io.StringIO()
+            thicc.printer.write(deep, f, jsonl)
+            self.assertEqual(f.getvalue().count("\n"), n+1)
+
+    def test_index(self):
+        lexer = thicc.lexer.Lexer()
+        text = "int f() {\n  int x = 1;\n  while (x) {\n    x++;\n"\
+                "    if (x) break;\n    for (;;) { int y = x; continue; }\n"\
+                "  }\n  return x;\n}\nint g();\n"\
+                "int main() {\n  int x;\n  x = 2;\n  return x;\n}\n"
+        ast = thicc.parser.Parser(strict=False).parse(lexer.tokenize(text))
+        index = thicc.index.ASTIndex(ast)
+        f, g, main = ast.declarations
+        loop = f.body[1]
+
+        self.assertIs(index.parent(ast), None)
+        self.assertIs(index.parent(f), ast)
+        self.assertIs(index.parent(loop), f.body)
+        self.assertIs(index.parent(loop.cond), loop)
+        self.assertEqual(index.nodes(symbol.FunctionD), [f, g, main])
+        self.assertEqual(len(index.nodes(symbol.VarRefE)), 6)
+        self.assertEqual(index.nodes(symbol.DoS), [])
+
+        self.assertEqual([d.__class__ for d in index.defs("f", "x")],
+                            [symbol.VariableD, symbol.IncrementPostE])
+        self.assertEqual(len(index.uses("f", "x")), 5)
+        self.assertIs(index.uses("f", "x")[0], loop.cond)
+        self.assertEqual([d.__class__ for d in index.defs("main", "x")],
+                            [symbol.VariableD, symbol.AssignE])
+        self.assertEqual(len(index.uses("f", "y")), 0)
+        self.assertEqual(len(index.defs("f", "y")), 1)
+        self.assertEqual(index.uses("g", "x"), [])
+
+        breakS, = index.nodes(symbol.BreakS)
+        continueS, = index.nodes(symbol.ContinueS)
+        self.assertIs(index.loop(breakS), loop)
+        self.assertIs(index.loop(continueS).__class__, symbol.ForS)
+
+        # Replacing a body updates only that function.
+        old = f.body
+        body = thicc.parser.Parser().parse(lexer.tokenize(
+                    "int f() { int z; do { z++; break; } while (z);"
+                    " return z; }")).declarations[0].body
+        index.replaceBody(f, body)
+        self.assertIs(f.body, body)
+        self.assertEqual(index.uses("f", "x"), [])
+        self.assertEqual(len(index.uses("f", "z")), 3)
+        self.assertEqual(len(index.defs("main", "x")), 2)
+        self.assertEqual(index.nodes(symbol.ContinueS), [])
+        breakS, = index.nodes(symbol.BreakS)
+        self.assertIs(index.loop(breakS), index.nodes(symbol.DoS)[0])
+        self.assertIs(index.parent(body), f)
+        self.assertNotIn(id(old), index.parents)
+        self.assertEqual(len(index.nodes(symbol.VarRefE)), 4)
+        self.assertEqual(index.nodes(symbol.FunctionD), [f, g, main])
+
+    def test_functions(self):
+        lexer = thicc.lexer.Lexer()
+        text = "int f();\nint g() { return 1; }\nint f();\n"\
+                "int f() { return 2; }\nint main() { int f(); return 0; }\n"
+        for strict in [True, False]:
+            parser = thicc.parser.Parser(strict=strict)
+            ast = parser.parse(lexer.tokenize(text))
+            functions = ast.functions
+            self.assertEqual(len(functions), 3)
+            self.assertNotIn("h", functions)
+            self.assertIsNone(functions.lookup("h"))
+            entry = functions["f"]
+            self.assertEqual(entry.declarations, [ast.declarations[0],
+                                                    ast.declarations[2]])
+            self.assertIs(entry.definition, ast.declarations[3])
+            self.assertEqual(entry.nPars, 0)
+            self.assertEqual(functions["g"].declarations, [])
+            self.assertIs(functions["main"].definition, ast.declarations[4])
+            # Tables made from a tree, e.g. after a round trip, match.
+            copy = thicc.serial.loads(thicc.serial.dumps(ast))
+            self.assertIsNot(copy.functions, functions)
+            self.assertEqual(copy.functions["f"].declarations,
+                                entry.declarations)
+            self.assertIs(copy.functions, copy.functions)
+            self.assertRaises(symbol.MultipleDefinitionsOfFunction,
+                                parser.parse, lexer.tokenize(
+                                    text + "int g() { return 3; }"))
+
+        # Declarations must agree on the number of parameters.
+        table = symbol.FunctionTable()
+        fa = symbol.FunctionD(token.Identifier("f"), [token.Identifier("a")])
+        self.assertEqual(table.add(fa).nPars, 1)
+        fab = symbol.FunctionD(token.Identifier("f"), [token.Identifier("a"),
+                                token.Identifier("b")],
+                                symbol.CompoundS())
+        self.assertRaises(symbol.FunctionDeclarationMismatch, table.add, fab)
+        ast = symbol.Program([fa, fab])
+        self.assertRaises(symbol.FunctionDeclarationMismatch, ast.validate)
+        self.assertRaises(symbol.FunctionDeclarationMismatch,
+                            getattr, ast, "functions")
+
+    def test_resolve(self):
+        lexer = thicc.lexer.Lexer()
+        text = "int main() {\n  int a = 1;\n  {\n    int b = a;\n"\
+                "    int a = a + b;\n    a += b;\n  }\n"\
+                "  for (int i = 0; i < a; i++) {\n    if (i) break;\n"\
+                "    continue;\n  }\n  return a;\n}\n"
+        ast = thicc.parser.Parser().parse(lexer.tokenize(text))
+        func = ast.declarations[0]
+        frame = thicc.resolver.Resolver().resolve(func)
+        body = func.body
+        block = body[1]
+        loop = body[2]
+
+        self.assertEqual(frame.offset(body[0]), -8)
+        self.assertEqual(frame.offset(block[0]), -16)
+        self.assertEqual(frame.offset(block[0].expr), -8)
+        # A variable is in scope from the end of its declaration.
+        self.assertEqual(frame.offset(block[1]), -24)
+        self.assertEqual(frame.offset(block[1].expr.expr1), -8)
+        self.assertEqual(frame.offset(block[1].expr.expr2), -16)
+        self.assertEqual(frame.offset(block[2].expr), -24)
+        self.assertEqual(frame.offset(block[2].expr.expr), -16)
+        self.assertEqual(frame.size(block), 16)
+        # The block's slots are free again after it.
+        self.assertEqual(frame.offset(loop.init), -16)
+        self.assertEqual(frame.offset(loop.cond.expr1), -16)
+        self.assertEqual(frame.offset(loop.cond.expr2), -8)
+        self.assertEqual(frame.offset(loop.post.var), -16)
+        self.assertEqual(frame.size(loop), 8)
+        self.assertEqual(frame.size(loop.body), 0)
+        self.assertIs(frame.loop(loop.body[0].ifS), loop)
+        self.assertIs(frame.loop(loop.body[1]), loop)
+        self.assertEqual(frame.offset(body[3].value), -8)
+
+        # Scope errors are found before any code is made.
+        ast = thicc.parser.Parser().parse(lexer.tokenize(
+                    "int main() { { int b = 1; } return b; }"))
+        self.assertRaises(thicc.context.UnknownIdentifierError,
+                            thicc.resolver.Resolver().resolve,
+                            ast.declarations[0])
+        self.assertRaises(thicc.context.UnknownIdentifierError,
+                            thicc.generator.Generator_x86_64().generate, ast)
+        a = token.Identifier("a")
+        block = symbol.CompoundS([symbol.VariableD(a), symbol.VariableD(a)])
+        self.assertRaises(thicc.context.DuplicateIdentifierError,
+                            thicc.resolver.Resolver().resolve, block)
+        frame = thicc.resolver.Resolver().resolve(
+                    symbol.CompoundS([symbol.BreakS()]))
+        self.assertEqual(list(frame.loops.values()), [None])
+
+        # Names are matched by name, so a statement rebuilt with tokens of
+        # its own (here by a round trip) still finds its variables.
+        ast = thicc.parser.Parser().parse(lexer.tokenize(
+                    "int a(); int main() { int a = 1; int b = 2; "
+                    "a = b; return b; }"))
+        body = ast.declarations[1].body
+        body.items = body.items[:2] + tuple([thicc.serial.loads(
+                        thicc.serial.dumps(item)) for item in body.items[2:]])
+        frame = thicc.resolver.Resolver().resolve(ast.declarations[1])
+        self.assertEqual(frame.offset(body[2].expr), -8)
+        self.assertEqual(frame.offset(body[2].expr.expr), -16)
+        self.assertEqual(frame.offset(body[3].value), -16)
+
+        # A shared expression standing for different variables is copied,
+        # in the Frame: the tree, which may be a cache's, is left alone.
+        text = "int main() { int x = 1; int y = x + 1; "\
+                "{ int x = 2; y = x + 1; } return x + 1; }"
+        plain = thicc.parser.Parser().parse(lexer.tokenize(text))
+        cache = thicc.cache.ParseCache()
+        share = thicc.parser.Parser(share=True)
+        ast = cache.parse(text, lambda text: share.parse(lexer.tokenize(text)))
+        body = ast.declarations[0].body
+        inner = body[2][1]
+        self.assertIs(body[1].expr, inner.expr.expr)
+        self.assertIs(body[1].expr, body[3].value)
+        frame = thicc.resolver.Resolver().resolve(ast.declarations[0])
+        self.assertIs(body[1].expr, inner.expr.expr)
+        self.assertIs(frame.expression(body[1], 'expr'), body[1].expr)
+        copied = frame.expression(inner, 'expr')
+        self.assertIsNot(copied, inner.expr)
+        self.assertEqual(copied, inner.expr)
+        self.assertEqual(frame.offset(body[1].expr.expr1), -8)
+        self.assertEqual(frame.offset(copied.expr.expr1), -24)
+        self.assertEqual(ast, plain)
+        code = thicc.generator.Generator_x86_64().generate(plain)
+        for i in range(2):
+            hit = cache.parse(text, None)
+            self.assertIs(hit, ast)
+            self.assertEqual(thicc.generator.Generator_x86_64().generate(hit),
+                                code)
+        self.assertIs(body[1].expr, inner.expr.expr)
 
 if __name__ == "__main__":
     unittest.main()
@@ -104,6 +104,37 @@ class TestThicc(unittest.TestCase):
         self.runSampleTestsInvalid(path, "m64")
     
 
+    def test_deep_nesting(self):
+        # Code generation far deeper than the recursion limit.
+        n = 30000
+        text = "int main() { int a = 2; return " + "-(a + " * n + "1"\
+                + ")" * n + "; }"
+        code = thicc.compileC(text).split("\n")
+        self.assertEqual(code.count("    pushq   %rax"), n)
+
+        text = "int main() { int a = 2; return " + "a ? 1 : " * n + "0; }"
+        code = thicc.compileC(text)
+        self.assertEqual(code.count("_lbl"), 4*n)
+
+        # Nested blocks and statements, built directly since the parser
+        # still reads statements recursively.
+        tok = thicc.token
+        sym = thicc.symbol
+        a = tok.Identifier("a")
+        stmnt = sym.WhileS(sym.VarRefE(a), sym.BreakS())
+        for i in range(n):
+            stmnt = sym.CompoundS([sym.VariableD(a, sym.VarRefE(a)),
+                                    sym.ConditionalS(sym.VarRefE(a), stmnt,
+                                        sym.ExpressionS(None))])
+        func = sym.FunctionD(tok.Identifier("main"), None,
+                                sym.CompoundS([sym.VariableD(a), stmnt]))
+        code = thicc.generator.Generator_x86_64().generate(
+                                                    sym.Program([func]))
+        code = code.split("\n")
+        self.assertEqual(code.count("    push    %rax"), n+1)
+        self.assertEqual(code.count("    movq    -{0:d}(%rbp), %rax"
+                                        .format(8*(n+1))), 2)
+
     def runSampleTestsValid(self, rootpath, genType, subdir=""):
         path = rootpath+"valid/" + subdir
         files = os.listdir(path)
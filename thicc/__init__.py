@@ -1,2 +1,2 @@
 from . import *
-from .compiler import compileC, parse, lex
+from .compiler import compileC, parse, lex, mapFile
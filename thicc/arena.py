@@ -0,0 +1,185 @@
+from array import array
+from . import token
+from . import symbol
+
+# What each field of a node holds
+NODE = 0        # a child node, or None
+NODES = 1       # a sequence of child nodes
+TOKEN = 2       # an Identifier or Constant token
+OP = 3          # an operator token
+TOKENS = 4      # a sequence of Identifier tokens
+
+# The fields of each node class, in the order the children are stored.  A
+# class has at most one TOKEN, OP, NODES and TOKENS field, and NODES is
+# never mixed with NODE.
+layouts = {
+    symbol.Program: (('declarations', NODES),),
+    symbol.BinaryOpE: (('op', OP), ('expr1', NODE), ('expr2', NODE)),
+    symbol.ConstantE: (('value', TOKEN),),
+    symbol.VarRefE: (('id', TOKEN),),
+    symbol.AssignE: (('id', TOKEN), ('op', OP), ('expr', NODE)),
+    symbol.UnaryOpE: (('op', OP), ('expr', NODE)),
+    symbol.IncrementPreE: (('op', OP), ('var', NODE)),
+    symbol.IncrementPostE: (('op', OP), ('var', NODE)),
+    symbol.ConditionalE: (('cond', NODE), ('true', NODE), ('false', NODE)),
+    symbol.ReturnS: (('value', NODE),),
+    symbol.ExpressionS: (('expr', NODE),),
+    symbol.ConditionalS: (('cond', NODE), ('ifS', NODE), ('elseS', NODE)),
+    symbol.CompoundS: (('items', NODES),),
+    symbol.ForS: (('init', NODE), ('cond', NODE), ('post', NODE),
+                    ('body', NODE)),
+    symbol.WhileS: (('cond', NODE), ('body', NODE)),
+    symbol.DoS: (('cond', NODE), ('body', NODE)),
+    symbol.BreakS: (),
+    symbol.ContinueS: (),
+    symbol.VariableD: (('id', TOKEN), ('expr', NODE)),
+    symbol.FunctionD: (('name', TOKEN), ('pars', TOKENS), ('body', NODE))}
+
+# Node classes by their kind code in an Arena
+nodeClasses = tuple(layouts)
+nodeKinds = {cls: kind for kind, cls in enumerate(nodeClasses)}
+
+
+class Arena():
+    # A Program stored flat.  Nodes are integer handles into parallel
+    # arrays: the node's kind (an index into nodeClasses), where its
+    # children start in the children array and how many there are, the
+    # index of its Identifier or Constant token in the values table, and
+    # the kind code of its operator token.  Missing tokens are -1, as are
+    # missing children (e.g. an if with no else).  Tokens are stored once
+    # per distinct value.  The parameters of the few functions that have
+    # them are kept in pars, by handle, as tuples of value indices.
+    #
+    # Nodes are stored in post-order, so children come before their
+    # parents, a subtree is a run of handles ending at its root, and the
+    # Program is the last node.  The arrays hold no Python objects, so the
+    # garbage collector never looks at them, and an Arena pickles as a
+    # few byte strings and the values table.
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.childStarts = array('I')
+        self.childCounts = array('I')
+        self.payloads = array('i')
+        self.ops = array('h')
+        self.children = array('i')
+        self.values = []
+        self.valueIndex = {}
+        self.pars = {}
+        self.root = -1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def value(self, tok):
+        # The index of tok in the values table, adding it if it is new.
+        key = (tok.kind, tok.val)
+        i = self.valueIndex.get(key)
+        if i is None:
+            i = len(self.values)
+            self.values.append(tok)
+            self.valueIndex[key] = i
+        return i
+
+    def add(self, node, kids):
+        # Store node, whose children (in layout order) are already stored
+        # as the handles kids, and return its handle.
+        payload = -1
+        op = -1
+        for field, what in layouts[node.__class__]:
+            if what == TOKEN:
+                payload = self.value(getattr(node, field))
+            elif what == OP:
+                op = getattr(node, field).kind
+            elif what == TOKENS:
+                pars = getattr(node, field)
+                if pars:
+                    self.pars[len(self.kinds)] = tuple(
+                                        [self.value(tok) for tok in pars])
+        self.kinds.append(nodeKinds[node.__class__])
+        self.childStarts.append(len(self.children))
+        self.childCounts.append(len(kids))
+        self.payloads.append(payload)
+        self.ops.append(op)
+        self.children.extend(kids)
+        return len(self.kinds) - 1
+
+    def childHandles(self, handle):
+        start = self.childStarts[handle]
+        return self.children[start:start+self.childCounts[handle]]
+
+    def nodeClass(self, handle):
+        return nodeClasses[self.kinds[handle]]
+
+    def first(self, handle):
+        # The first handle of the subtree at handle.
+        while True:
+            for child in self.childHandles(handle):
+                if child >= 0:
+                    handle = child
+                    break
+            else:
+                return handle
+
+    def toAST(self, handle=None):
+        # Build the symbol tree at handle (by default the Program).  The
+        # subtree's nodes are made in handle order, so each node's
+        # children are ready before it.
+        if handle is None:
+            handle = self.root
+        first = self.first(handle)
+        nodes = []
+        for h in range(first, handle+1):
+            cls = nodeClasses[self.kinds[h]]
+            kids = [nodes[c-first] if c >= 0 else None
+                    for c in self.childHandles(h)]
+            node = cls.__new__(cls)
+            i = 0
+            for field, what in layouts[cls]:
+                if what == NODE:
+                    value = kids[i]
+                    i += 1
+                elif what == NODES:
+                    # A Program's declarations are a list, a block's items
+                    # a tuple.
+                    value = kids if cls is symbol.Program else tuple(kids)
+                elif what == TOKEN:
+                    value = self.values[self.payloads[h]]
+                elif what == OP:
+                    value = token.kinds[self.ops[h]]()
+                else:
+                    value = tuple([self.values[j]
+                                    for j in self.pars.get(h, ())])
+                setattr(node, field, value)
+            nodes.append(node)
+        return nodes[-1]
+
+
+def fromAST(prog):
+    # Store a Program in a new Arena.  The tree is walked with an explicit
+    # stack, in post-order: a node is stored once all its children are,
+    # their handles being the last ones on the handles stack.  Skipped
+    # function bodies are parsed.
+    arena = Arena()
+    handles = []
+    stack = [(prog, None)]
+    while stack:
+        node, kids = stack.pop()
+        if node is None:
+            handles.append(-1)
+        elif kids is None:
+            kids = []
+            for field, what in layouts[node.__class__]:
+                if what == NODE:
+                    kids.append(getattr(node, field))
+                elif what == NODES:
+                    kids.extend(getattr(node, field))
+            stack.append((node, len(kids)))
+            stack.extend([(kid, None) for kid in reversed(kids)])
+        else:
+            n = len(handles) - kids
+            handle = arena.add(node, handles[n:])
+            del handles[n:]
+            handles.append(handle)
+    arena.root = handles[0]
+    return arena
@@ -0,0 +1,165 @@
+import os
+import zlib
+import hashlib
+import tempfile
+from collections import OrderedDict
+from . import symbol
+from . import serial
+from . import exception
+from . import version
+
+class ParseCache():
+    # A content-addressed cache of parsed programs.  Entries are keyed on
+    # a hash of the thicc version, the settings of the parser and the
+    # source text, so a hit skips lexing, parsing and validation entirely,
+    # a new version never sees an old entry and a program checked one way
+    # is never handed to a parser set up another.
+    #
+    # There are two tiers.  The memory tier is an LRU of Program objects,
+    # capped at maxEntries entries and maxBytes bytes of source text (a
+    # cheap stand-in for the size of the tree).  If a directory is given,
+    # programs are also stored there, one file per key, and read back on a
+    # memory miss.  A file holds a magic string, the SHA-256 of the rest,
+    # the size of the source and the compressed Program in the format of
+    # thicc.serial.  Files that don't check out are counted as corrupt,
+    # deleted and treated as a miss.
+    #
+    # Programs are shared between everyone who gets them from the cache,
+    # so they must not be changed.  Their function bodies are all parsed
+    # before they are cached, so they don't hold on to the source.  A
+    # lazily parsed program with an error in a body is given back without
+    # being cached, so the error comes when the body is used, as it would
+    # without the cache.
+
+    magic = b"THICCAST"
+
+    def __init__(self, maxEntries=256, maxBytes=64*2**20, directory=None):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corrupt = 0
+
+    def key(self, text, settings=()):
+        # settings is a tuple of the parser's settings, e.g. (strict,
+        # validate).
+        h = hashlib.sha256(version.version.encode())
+        h.update(b"\0")
+        h.update(repr(tuple(settings)).encode())
+        h.update(b"\0")
+        if isinstance(text, str):
+            text = text.encode()
+        h.update(text)
+        return h.hexdigest()
+
+    def parse(self, text, parse, settings=()):
+        # The Program for text, from the cache or from parse(text), a
+        # parser set up with settings.
+        key = self.key(text, settings)
+        ast = self.get(key)
+        if ast is None:
+            ast = parse(text)
+            try:
+                ast.parseBodies()
+            except exception.ThiccError:
+                return ast
+            self.put(key, ast, len(text))
+            self.store(key, ast, len(text))
+        return ast
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        ast, size = self.load(key)
+        if ast is not None:
+            self.put(key, ast, size)
+            self.hits += 1
+            self.diskHits += 1
+            return ast
+        self.misses += 1
+        return None
+
+    def put(self, key, ast, size):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        if size > self.maxBytes or self.maxEntries <= 0:
+            return
+        self.entries[key] = (ast, size)
+        self.size += size
+        while len(self.entries) > self.maxEntries or self.size > self.maxBytes:
+            old = self.entries.popitem(last=False)[1]
+            self.size -= old[1]
+            self.evictions += 1
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".ast")
+
+    def store(self, key, ast, size):
+        if self.directory is None:
+            return
+        data = zlib.compress(serial.dumps(ast))
+        data = size.to_bytes(8, "little") + data
+        # Write to a temporary file and rename it, so other processes
+        # never see half a file.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.magic)
+                f.write(hashlib.sha256(data).digest())
+                f.write(data)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def load(self, key):
+        # The Program stored for key and the size of its source, or
+        # (None, 0) if there is none or it is corrupt.
+        if self.directory is None:
+            return None, 0
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except OSError:
+            return None, 0
+        n = len(self.magic)
+        data = raw[n+32:]
+        try:
+            if raw[:n] != self.magic\
+                    or hashlib.sha256(data).digest() != raw[n:n+32]:
+                raise ValueError("Bad cache entry")
+            ast = serial.loads(zlib.decompress(data[8:]))
+            if not isinstance(ast, symbol.Program):
+                raise ValueError("Cache entry is not a Program")
+        except Exception:
+            # A damaged entry can fail in several ways.
+            self.corrupt += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, 0
+        return ast, int.from_bytes(data[:8], "little")
+
+    def clear(self):
+        # Empty the memory tier.  Files on disk are kept.
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {"hits": self.hits, "diskHits": self.diskHits,
+                "misses": self.misses, "evictions": self.evictions,
+                "corrupt": self.corrupt, "entries": len(self.entries),
+                "bytes": self.size}
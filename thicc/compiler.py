@@ -1,39 +1,61 @@
+import mmap
+import contextlib
 from . import lexer
 from . import parser
 from . import generator
 
 class Compiler():
 
-    def __init__(self, genType="m64"):
-        self.lexer = lexer.Lexer()
-        self.parser = parser.Parser()
+    def __init__(self, genType="m64", lexEngine="scalar", cache=None,
+                    strict=True, validate=False):
+        # cache is an optional cache.ParseCache, shared by any number of
+        # Compilers, that parse() and compileC() look programs up in.
+        # Unless strict, function bodies are parsed only when used; with
+        # validate, parsed trees get a full validate() pass (see
+        # parser.Parser).
+        self.lexer = lexer.Lexer(lexEngine, output="stream")
+        self.parser = parser.Parser(strict, validate)
+        self.cache = cache
         if genType == "m32":
             self.generator = generator.Generator_x86()
         else:
             self.generator = generator.Generator_x86_64()
 
     def compileC(self, text):
-        toks = self.lexer.tokenize(text)
-        ast = self.parser.parse(toks)
+        ast = self.parse(text)
         code = self.generator.generate(ast)
         return code
 
     def parse(self, text):
+        if self.cache is not None:
+            parser = self.parser
+            return self.cache.parse(text, self.parseSource,
+                        (parser.strict, parser.validate, parser.share))
+        return self.parseSource(text)
+
+    def parseSource(self, text):
         toks = self.lexer.tokenize(text)
         ast = self.parser.parse(toks)
         return ast
 
-    def lex(self, text):
+    def parseIter(self, text):
+        # The program's declarations one at a time (see
+        # parser.Parser.parseIter), without the cache.
         toks = self.lexer.tokenize(text)
+        return self.parser.parseIter(toks)
+
+    def lex(self, text):
+        toks = list(self.lexer.tokenize(text))
         return toks
 
-def compileC(text, genType="m64"):
-    compiler = Compiler(genType)
+def compileC(text, genType="m64", cache=None, strict=True, validate=False):
+    compiler = Compiler(genType, cache=cache, strict=strict,
+                        validate=validate)
     code = compiler.compileC(text)
     return code
 
-def parse(text):
-    compiler = Compiler()
+def parse(text, cache=None, strict=True, validate=False):
+    compiler = Compiler(cache=cache, strict=strict, validate=validate)
     ast = compiler.parse(text)
     return ast
 
@@ -41,3 +63,16 @@ def lex(text):
     compiler = Compiler()
     tok = compiler.lex(text)
     return tok
+
+@contextlib.contextmanager
+def mapFile(filename):
+    # Memory-map a source file read-only, for passing straight to the lexer.
+    # Empty files can't be mapped and give b"" instead.
+    with open(filename, "rb") as f:
+        try:
+            text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b""
+            return
+        with text:
+            yield text
@@ -0,0 +1,96 @@
+from . import token
+from . import symbol
+
+class TokenCursor():
+    # A read position in a token sequence (a list or a TokenBuffer).  The
+    # parser moves the position along instead of copying the tokens and
+    # popping them off; mark() and reset() save and go back to a position.
+    # The token at the position is kept in tok, and its kind code in kind
+    # (both None past the end), so peeking at it again doesn't index the
+    # sequence.  end may stop the cursor short of the end of toks.  names is
+    # the token.NameTable of a TokenBuffer, None for a list.
+
+    def __init__(self, toks, pos=0, end=None):
+        self.toks = toks
+        self.names = getattr(toks, 'names', None)
+        self.end = len(toks) if end is None else end
+        self.reset(pos)
+
+    def peek(self, k=0):
+        # The token k places after the next one, None past the end.
+        if k == 0:
+            return self.tok
+        i = self.pos + k
+        if i < self.end:
+            return self.toks[i]
+        return None
+
+    def advance(self):
+        # Take the next token.
+        tok = self.tok
+        if tok is None:
+            raise symbol.UnexpectedEndError()
+        self.pos += 1
+        if self.pos < self.end:
+            self.tok = self.toks[self.pos]
+            self.kind = self.tok.kind
+        else:
+            self.tok = self.kind = None
+        return tok
+
+    def expect(self, cls, error):
+        # Take the next token, which must be a cls: otherwise raise error
+        # with it (None at the end of the input).
+        tok = self.tok
+        if tok is not None:
+            self.advance()
+        if not isinstance(tok, cls):
+            raise error(tok)
+        return tok
+
+    def skipBlock(self):
+        # Take a {...} block, from the { at the current token through its
+        # matching }, looking only at token kinds.  Returns a cursor over
+        # the block, to parse it later, and whether the } was found; if
+        # not, the block runs to the end of the input.
+        toks = self.toks
+        kinds = getattr(toks, 'kinds', None)
+        openBrace = token.OpenBrace.kind
+        closedBrace = token.ClosedBrace.kind
+        start = self.pos
+        depth = 0
+        for i in range(start, self.end):
+            kind = kinds[i] if kinds is not None else toks[i].kind
+            if kind == openBrace:
+                depth += 1
+            elif kind == closedBrace:
+                depth -= 1
+                if depth == 0:
+                    self.reset(i+1)
+                    return TokenCursor(toks, start, i+1), True
+        self.reset(self.end)
+        return TokenCursor(toks, start, self.end), False
+
+    def mark(self):
+        return self.pos
+
+    def reset(self, mark):
+        self.pos = mark
+        if mark < self.end:
+            self.tok = self.toks[mark]
+            self.kind = self.tok.kind
+        else:
+            self.tok = self.kind = None
+
+    def locate(self, e):
+        # Point an error at the last token taken, if the tokens know where
+        # they are in the source (e.g. a TokenBuffer).  A list of tokens
+        # doesn't, so its errors are left without a position.
+        if e.offset is not None or self.end == 0\
+                or not hasattr(self.toks, 'starts'):
+            return
+        i = min(max(self.pos-1, 0), self.end-1)
+        e.setPosition(self.toks.starts[i], self.toks.lines)
+
+    def close(self):
+        pass
@@ -1,2 +1,24 @@
 class ThiccError(Exception):
-    pass
+    # Where the error happened, if known: a character offset into the
+    # source and the position.LineIndex of that source.  The line and
+    # column are only worked out when location is asked for.
+    #
+    # Only errors found while reading the source have a position: lexer
+    # errors, and parse errors when the tokens are a TokenBuffer or a
+    # TokenStream, which keep each token's start offset.  Tokens are shared
+    # (one object per name or value) and nodes keep no offsets, so parse
+    # errors from a token list and errors from validate() or the generator
+    # have no location.
+    offset = None
+    lines = None
+
+    def setPosition(self, offset, lines):
+        self.offset = offset
+        self.lines = lines
+        return self
+
+    @property
+    def location(self):
+        if self.offset is None or self.lines is None:
+            return None
+        return self.lines.lineCol(self.offset)
@@ -1,7 +1,8 @@
 from . import token
 from . import symbol
+from . import arena
 from . import exception
-from . import context
+from . import resolver
 
 class GeneratorError(exception.ThiccError):
     pass
@@ -16,6 +17,11 @@ class UnknownExpressionError(GeneratorError):
         self.expression = expr
         self.message = message
 
+class UnknownDeclarationError(GeneratorError):
+    def __init__(self, expr, message="Unknown type of declaration"):
+        self.expression = expr
+        self.message = message
+
 class UnknownIncrementOperatorError(GeneratorError):
     def __init__(self, expr, message="Unknown type of increment operator"):
         self.expression = expr
@@ -45,6 +51,7 @@ class Generator():
 
     def __init__(self):
         self.counter = 0
+        self.names = None
         self.indent = 4*" "
         self.argCol = 8
 
@@ -68,13 +75,38 @@ class Generator():
         return line
 
 
+    # Code is built from plans rather than by recursion.  A plan is a list
+    # of lines of code and (method, arg, ...) tuples.  assemble() runs
+    # through a plan with an explicit stack, calling each tuple when it is
+    # reached and putting the plan it returns, if any, in its place.  The
+    # xxxPlan and xxxCode methods return plans, with a tuple wherever a
+    # child node's code goes, so nesting depth is only limited by memory.
+    # Work that must wait until a child's code is done goes in the plan as
+    # a tuple too.
+    #
+    # Variables are bound to their stack slots before a function's code is
+    # made, by a resolver.Resolver keyed on the ids of the Program's
+    # NameTable; the plans carry its Frame, in which the code for each
+    # variable reference finds its offset.
+    #
+    # A Program kept in an arena.Arena has plans of its own, the arenaXxx
+    # methods, which take the arena and a node handle and read the node's
+    # kind, children, token and operator straight from its arrays, so no
+    # symbol nodes are made.  They put out the same code as the plans for
+    # the symbol tree, the code for each construct being built by the same
+    # xxxCode method from its children's plans.
+
     def generate(self, ast):
+        self.names = None
         if(isinstance(ast, symbol.Program)):
             code = self.generateProgram(ast)
+        elif(isinstance(ast, arena.Arena)):
+            code = self.generateArena(ast)
         elif(isinstance(ast, symbol.Declaration)):
-            code = self.generateDeclaration(ast)
+            code = self.generateDeclaration(ast, None)
         elif(isinstance(ast, symbol.Statement)):
-            code = self.generateStatement(ast)
+            code = self.generateStatement(ast,
+                                        resolver.Resolver().resolve(ast))
         else:
             raise InvalidASTHeadError(ast)
 
@@ -82,248 +114,415 @@ class Generator():
 
         return codeStr
 
-    def generateProgram(self, prog):
+    def assemble(self, plan):
         code = []
-        for decl in prog.declarations:
-            code += self.generateDeclaration(decl, None)
+        stack = plan[::-1]
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                code.append(item)
+            else:
+                more = item[0](*item[1:])
+                if more:
+                    stack.extend(reversed(more))
         return code
 
+    def generateProgram(self, prog):
+        return self.assemble(self.programPlan(prog))
+
+    def generateArena(self, store):
+        return self.assemble(self.arenaPlan(store))
+
     def generateFunction(self, func):
+        return self.assemble(self.functionPlan(func))
+
+    def generateCompoundStatement(self, stmnt, frame, dealloc=True):
+        return self.assemble(self.compoundPlan(stmnt, frame, dealloc))
+
+    def generateDeclaration(self, declaration, frame):
+        return self.assemble(self.declarationPlan(declaration, frame))
 
-        name = func.name.val
+    def generateStatement(self, statement, frame):
+        return self.assemble(self.statementPlan(statement, frame))
+
+    def generateExpression(self, expr, frame):
+        return self.assemble(self.expressionPlan(expr, frame))
+
+    def programPlan(self, prog):
+        self.names = prog.names
+        plan = [(self.declarationPlan, decl, None)
+                    for decl in prog.declarations]
+        return plan
+
+    def arenaPlan(self, store):
+        plan = [(self.arenaDeclarationPlan, store, handle, None)
+                    for handle in store.childHandles(store.root)]
+        return plan
+
+    def functionHead(self, name):
         head1 = [   ".globl _{0:s}".format(name)]
         head2 = [   "_{0:s}:".format(name)]
         prologue = [self.instruct("push", "%rbp"),
                     self.instruct("movq", "%rsp", "%rbp")]
+        return head1 + head2 + prologue
 
-        """
-        if len(func.body) == 0\
-                or not isinstance(func.body[-1], symbol.ReturnS):
-            ret0 = symbol.ReturnS(symbol.ConstantE(token.IntC("0")))
-            func.body.append(ret0)
-        """
+    def functionPlan(self, func):
+
+        if func.body is None:
+            # A declaration alone makes no code.
+            return []
 
-        body = self.generateCompoundStatement(func.body, None, dealloc=False)
+        frame = resolver.Resolver(names=self.names).resolve(func)
+        body = [(self.compoundPlan, func.body, frame, False)]
         
         if len(func.body) == 0\
                 or not isinstance(func.body[-1], symbol.ReturnS):
             ret0 = symbol.ReturnS(symbol.ConstantE(token.IntC("0")))
-            body += self.generateStatement(ret0, None)
+            body.append((self.statementPlan, ret0, frame))
 
-        code = head1 + head2 + prologue + body
-        return code
+        plan = self.functionHead(func.name.val) + body
+        return plan
 
-    def generateCompoundStatement(self, stmnt, superCont, dealloc=True):
+    def arenaFunctionPlan(self, store, handle):
+        body, = store.childHandles(handle)
+        if body < 0:
+            return []
 
-        cont = context.Context(superContext=superCont)
-        code = []
+        frame = resolver.Resolver().resolveArena(store, handle)
+        plan = [(self.arenaCompoundPlan, store, body, frame, False)]
+
+        items = store.childHandles(body)
+        if len(items) == 0\
+                or store.kinds[items[-1]] != arena.nodeKinds[symbol.ReturnS]:
+            plan += self.returnCode(self.constCode("0"))
+
+        name = store.values[store.payloads[handle]].val
+        return self.functionHead(name) + plan
+
+    def compoundPlan(self, stmnt, frame, dealloc=True):
+
+        plan = []
         for item in stmnt:
             if isinstance(item, symbol.Declaration):
-                code += self.generateDeclaration(item, cont)
+                plan.append((self.declarationPlan, item, frame))
             elif isinstance(item, symbol.Statement):
-                code += self.generateStatement(item, cont)
+                plan.append((self.statementPlan, item, frame))
             else:
                 raise InvalidBlockItemError(item)
 
         if dealloc:
-            # Deallocate variables from the stack
-            # ie. Move the stack pointer back by the amount it has changed
-            #     in this block.
-            bytesAdded = "${0:d}".format(cont.vmap.size)
-            deallocCode = [self.instruct("addq", bytesAdded, "%rsp")]
+            plan += self.deallocPlan(stmnt, frame)
 
-            code += deallocCode
+        return plan
 
-        return code
+    def arenaCompoundPlan(self, store, handle, frame, dealloc=True):
+
+        plan = []
+        for item in store.childHandles(handle):
+            cls = arena.nodeClasses[store.kinds[item]]
+            if issubclass(cls, symbol.Declaration):
+                plan.append((self.arenaDeclarationPlan, store, item, frame))
+            elif issubclass(cls, symbol.Statement):
+                plan.append((self.arenaStatementPlan, store, item, frame))
+            else:
+                raise InvalidBlockItemError(item)
+
+        if dealloc:
+            plan += self.deallocPlan(handle, frame)
 
-    def generateDeclaration(self, declaration, cont):
+        return plan
+
+    def deallocPlan(self, block, frame):
+        # Deallocate variables from the stack
+        # ie. Move the stack pointer back by the amount it has changed
+        #     in this block.
+        bytesAdded = "${0:d}".format(frame.size(block))
+        deallocCode = [self.instruct("addq", bytesAdded, "%rsp")]
+        return deallocCode
+
+    def declarationPlan(self, declaration, frame):
         if isinstance(declaration, symbol.VariableD):
-            if declaration.expr is not None:
-                init = self.generateExpression(declaration.expr, cont)
+            expr = frame.expression(declaration, 'expr')
+            if expr is not None:
+                init = [(self.expressionPlan, expr, frame)]
             else:
                 init = [self.instruct("movq","$0","%rax")]
             declare  = [self.instruct("push","%rax")]
-            cont.addVar(declaration.id)
-            code = init+declare
+            plan = init+declare
         elif isinstance(declaration, symbol.FunctionD):
-            code = self.generateFunction(declaration)
+            plan = self.functionPlan(declaration)
         else:
             raise UnknownDeclarationError(declaration)
 
-        return code
+        return plan
+
+    def arenaDeclarationPlan(self, store, handle, frame):
+        cls = arena.nodeClasses[store.kinds[handle]]
+        if cls is symbol.VariableD:
+            expr, = store.childHandles(handle)
+            if expr >= 0:
+                init = [(self.arenaExpressionPlan, store, expr, frame)]
+            else:
+                init = [self.instruct("movq","$0","%rax")]
+            declare  = [self.instruct("push","%rax")]
+            plan = init+declare
+        elif cls is symbol.FunctionD:
+            plan = self.arenaFunctionPlan(store, handle)
+        else:
+            raise UnknownDeclarationError(handle)
+
+        return plan
+
+    def returnCode(self, setValue):
+        epilogue = [self.instruct("movq","%rbp","%rsp"),
+                    self.instruct("pop","%rbp")]
+        returnLine = [self.instruct("ret")]
+        return setValue + epilogue + returnLine
 
-    def generateStatement(self, statement, cont):
+    def statementPlan(self, statement, frame):
         if isinstance(statement, symbol.ReturnS):
-            setValue = self.generateExpression(statement.value, cont)
-            epilogue = [self.instruct("movq","%rbp","%rsp"),
-                        self.instruct("pop","%rbp")]
-            returnLine = [self.instruct("ret")]
-            code = setValue + epilogue + returnLine
+            plan = self.returnCode([(self.expressionPlan,
+                            frame.expression(statement, 'value'), frame)])
         elif isinstance(statement, symbol.ExpressionS):
-            code = self.generateExpression(statement.expr, cont)
+            plan = self.expressionPlan(frame.expression(statement, 'expr'),
+                                        frame)
         elif isinstance(statement, symbol.ConditionalS):
-            code = self.conditionalStmntCode(statement, cont)
+            plan = self.conditionalStmntCode(statement, frame)
         elif isinstance(statement, symbol.CompoundS):
-            code = self.generateCompoundStatement(statement, cont)
+            plan = self.compoundPlan(statement, frame)
         elif isinstance(statement, symbol.WhileS):
-            code = self.whileStmntCode(statement, cont)
+            plan = self.whileStmntCode(statement, frame)
         elif isinstance(statement, symbol.DoS):
-            code = self.doStmntCode(statement, cont)
+            plan = self.doStmntCode(statement, frame)
         elif isinstance(statement, symbol.ForS):
-            code = self.forStmntCode(statement, cont)
+            plan = self.forStmntCode(statement, frame)
         elif isinstance(statement, symbol.ContinueS):
-            code = self.continueStmntCode(statement, cont)
+            plan = self.continueStmntCode(statement, frame)
         elif isinstance(statement, symbol.BreakS):
-            code = self.breakStmntCode(statement, cont)
+            plan = self.breakStmntCode(statement, frame)
         else:
             raise UnknownStatementError(statement)
 
-        return code
+        return plan
+
+    def arenaStatementPlan(self, store, handle, frame):
+        cls = arena.nodeClasses[store.kinds[handle]]
+        if cls is symbol.ReturnS:
+            value, = store.childHandles(handle)
+            plan = self.returnCode([(self.arenaExpressionPlan, store, value,
+                                        frame)])
+        elif cls is symbol.ExpressionS:
+            expr, = store.childHandles(handle)
+            plan = self.arenaExpressionPlan(store, expr, frame)
+        elif cls is symbol.ConditionalS:
+            plan = self.arenaConditionalStmntCode(store, handle, frame)
+        elif cls is symbol.CompoundS:
+            plan = self.arenaCompoundPlan(store, handle, frame)
+        elif cls is symbol.WhileS:
+            plan = self.arenaWhileStmntCode(store, handle, frame)
+        elif cls is symbol.DoS:
+            plan = self.arenaDoStmntCode(store, handle, frame)
+        elif cls is symbol.ForS:
+            plan = self.arenaForStmntCode(store, handle, frame)
+        elif cls is symbol.ContinueS:
+            plan = self.continueStmntCode(handle, frame)
+        elif cls is symbol.BreakS:
+            plan = self.breakStmntCode(handle, frame)
+        else:
+            raise UnknownStatementError(handle)
+
+        return plan
 
-    def generateExpression(self, expr, cont):
+    def expressionPlan(self, expr, frame):
         if expr is None:
-            code = []
+            plan = []
         elif isinstance(expr, symbol.ConstantE):
-            code = self.constExprCode(expr)
+            plan = self.constExprCode(expr)
         elif isinstance(expr, symbol.VarRefE):
-            code = self.varRefCode(expr, cont)
+            plan = self.varRefCode(expr, frame)
         elif isinstance(expr, symbol.IncrementPostE):
-            code = self.incrementPostCode(expr, cont)
+            plan = self.incrementPostCode(expr, frame)
         elif isinstance(expr, symbol.IncrementPreE):
-            code = self.incrementPreCode(expr, cont)
+            plan = self.incrementPreCode(expr, frame)
         elif isinstance(expr, symbol.UnaryOpE):
-            code = self.unaryOpCode(expr, cont)
+            plan = self.unaryOpCode(expr, frame)
         elif isinstance(expr, symbol.BinaryOpE):
-            code = self.binaryOpCode(expr, cont)
+            plan = self.binaryOpCode(expr, frame)
         elif isinstance(expr, symbol.AssignE):
-            code = self.assignOpCode(expr, cont)
+            plan = self.assignOpCode(expr, frame)
         elif isinstance(expr, symbol.ConditionalE):
-            code = self.conditionalExprCode(expr, cont)
+            plan = self.conditionalExprCode(expr, frame)
         else:
             raise UnknownExpressionError(expr)
 
-        return code
+        return plan
+
+    def arenaExpressionPlan(self, store, handle, frame):
+        if handle < 0:
+            return []
+        cls = arena.nodeClasses[store.kinds[handle]]
+        if cls is symbol.ConstantE:
+            plan = self.constCode(store.values[store.payloads[handle]].val)
+        elif cls is symbol.VarRefE:
+            plan = self.varRefCode(handle, frame)
+        elif cls is symbol.IncrementPostE:
+            plan = self.arenaIncrementCode(store, handle, frame, True)
+        elif cls is symbol.IncrementPreE:
+            plan = self.arenaIncrementCode(store, handle, frame, False)
+        elif cls is symbol.UnaryOpE:
+            plan = self.arenaUnaryOpCode(store, handle, frame)
+        elif cls is symbol.BinaryOpE:
+            plan = self.arenaBinaryOpCode(store, handle, frame)
+        elif cls is symbol.AssignE:
+            plan = self.arenaAssignOpCode(store, handle, frame)
+        elif cls is symbol.ConditionalE:
+            plan = self.arenaConditionalExprCode(store, handle, frame)
+        else:
+            raise UnknownExpressionError(handle)
+
+        return plan
 
 class Generator_x86_64(Generator):
 
-    def constExprCode(self, expr):
-        val = expr.value.val
+    # The instructions for each operator are picked by its token kind, in
+    # the xxxInstructions methods, which return None for an operator they
+    # don't know, for the caller to complain about.
+
+    def constCode(self, val):
         code = [self.instruct("movq","${0:s}".format(val),"%rax")]
         return code
 
-    def varRefCode(self, expr, cont):
-        offset = cont.varLoc(expr.id)
+    def constExprCode(self, expr):
+        return self.constCode(expr.value.val)
+
+    def varRefCode(self, expr, frame):
+        offset = frame.offset(expr)
         var = "{0:d}(%rbp)".format(offset)
         code = [self.instruct("movq",var,"%rax")]
         return code
 
-    def incrementPostCode(self, expr, cont):
-        refCode = self.varRefCode(expr.var, cont)
-        offset = cont.varLoc(expr.var.id)
-        var = "{0:d}(%rbp)".format(offset)
-        if isinstance(expr.op, token.Increment):
-            incCode = [self.instruct("incq",var)]
-        elif isinstance(expr.op, token.Decrement):
-            incCode = [self.instruct("decq",var)]
+    def incrementCode(self, op, var, post):
+        # The code of a ++ or -- of the variable at offset var, whose value
+        # before (post) or after the change is left in %rax.
+        slot = "{0:d}(%rbp)".format(var)
+        if op == token.Increment.kind:
+            incCode = [self.instruct("incq",slot)]
+        elif op == token.Decrement.kind:
+            incCode = [self.instruct("decq",slot)]
+        else:
+            return None
+        refCode = [self.instruct("movq",slot,"%rax")]
+        if post:
+            code = refCode + incCode
         else:
+            code = incCode + refCode
+        return code
+
+    def incrementPostCode(self, expr, frame):
+        code = self.incrementCode(expr.op.kind, frame.offset(expr.var), True)
+        if code is None:
             raise UnknownIncrementOperatorError(expr.op)
-        code = refCode + incCode
         return code
 
-    def incrementPreCode(self, expr, cont):
-        offset = cont.varLoc(expr.var.id)
-        var = "{0:d}(%rbp)".format(offset)
-        if isinstance(expr.op, token.Increment):
-            incCode = [self.instruct("incq",var)]
-        elif isinstance(expr.op, token.Decrement):
-            incCode = [self.instruct("decq",var)]
-        else:
+    def incrementPreCode(self, expr, frame):
+        code = self.incrementCode(expr.op.kind, frame.offset(expr.var), False)
+        if code is None:
             raise UnknownIncrementOperatorError(expr.op)
-        refCode = self.varRefCode(expr.var, cont)
-        code = incCode + refCode
         return code
 
+    def arenaIncrementCode(self, store, handle, frame, post):
+        var = store.children[store.childStarts[handle]]
+        code = self.incrementCode(store.ops[handle], frame.offset(var), post)
+        if code is None:
+            raise UnknownIncrementOperatorError(handle)
+        return code
 
-    def unaryOpCode(self, expr, cont):
 
-        codeSet = self.generateExpression(expr.expr, cont)
-        op = expr.op
-        if isinstance(op, token.Not):
+    def unaryOpInstructions(self, op):
+        if op == token.Not.kind:
             codeOp = [  self.instruct("cmpl", "$0", "%eax"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("sete", "%al")]
-        elif isinstance(op, token.Neg):
+        elif op == token.Neg.kind:
             codeOp =  [ self.instruct("neg", "%eax")]
-        elif isinstance(op, token.Complement):
+        elif op == token.Complement.kind:
             codeOp =  [ self.instruct("not", "%eax")]
         else:
+            codeOp = None
+        return codeOp
+
+    def unaryOpCode(self, expr, frame):
+
+        codeSet = [(self.expressionPlan, expr.expr, frame)]
+        codeOp = self.unaryOpInstructions(expr.op.kind)
+        if codeOp is None:
             raise UnknownExpressionError(expr)
         code = codeSet+codeOp
 
         return code
 
-    def binaryOpCode(self, expr, cont):
+    def arenaUnaryOpCode(self, store, handle, frame):
 
-        op = expr.op
-        e1 = expr.expr1
-        e2 = expr.expr2
+        operand = store.children[store.childStarts[handle]]
+        codeSet = [(self.arenaExpressionPlan, store, operand, frame)]
+        codeOp = self.unaryOpInstructions(store.ops[handle])
+        if codeOp is None:
+            raise UnknownExpressionError(handle)
+        code = codeSet+codeOp
 
-        codeSet1 = self.generateExpression(e1, cont)
-        codePush1 = [   self.instruct("pushq", "%rax")]
-        codeSet2 = self.generateExpression(e2, cont)
-        codeSet2 += [   self.instruct("movl", "%eax", "%ecx")]
-        codePop1  = [   self.instruct("popq", "%rax")]
+        return code
 
-        if isinstance(op, token.Add):
+    def binaryOpInstructions(self, op):
+        if op == token.Add.kind:
             codeOp = [  self.instruct("addl", "%ecx", "%eax")]
-        elif isinstance(op, token.Neg):
+        elif op == token.Neg.kind:
             codeOp = [  self.instruct("subl", "%ecx", "%eax")]
-        elif isinstance(op, token.Mult):
+        elif op == token.Mult.kind:
             codeOp = [  self.instruct("imull", "%ecx", "%eax")]
-        elif isinstance(op, token.Div):
+        elif op == token.Div.kind:
             #zero out rdx and divide
             codeOp = [  self.instruct("movl", "$0", "%edx"),
                         self.instruct("idivl", "%ecx")]
-        elif isinstance(op, token.Mod):
+        elif op == token.Mod.kind:
             #zero out rdx and divide
             codeOp =  [ self.instruct("movl", "$0", "%edx"),
                         self.instruct("idivl", "%ecx"),
                         self.instruct("movl", "%edx", "%eax")]
-        elif isinstance(op, token.BitShiftL):
+        elif op == token.BitShiftL.kind:
             codeOp =  [ self.instruct("shll", "%cl", "%eax")]
-        elif isinstance(op, token.BitShiftR):
+        elif op == token.BitShiftR.kind:
             codeOp =  [ self.instruct("shrl", "%cl", "%eax")]
-        elif isinstance(op, token.BitAnd):
+        elif op == token.BitAnd.kind:
             codeOp =  [ self.instruct("andl", "%ecx", "%eax")]
-        elif isinstance(op, token.BitOr):
+        elif op == token.BitOr.kind:
             codeOp =  [ self.instruct("orl", "%ecx", "%eax")]
-        elif isinstance(op, token.BitXor):
+        elif op == token.BitXor.kind:
             codeOp =  [ self.instruct("xorl", "%ecx", "%eax")]
-        elif isinstance(op, token.Equal):
+        elif op == token.Equal.kind:
             codeOp =  [ self.instruct("cmpl", "%eax", "%ecx"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("sete", "%al")]
-        elif isinstance(op, token.NotEqual):
+        elif op == token.NotEqual.kind:
             codeOp =  [ self.instruct("cmpl", "%eax", "%ecx"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("setne", "%al")]
-        elif isinstance(op, token.LessThan):
+        elif op == token.LessThan.kind:
             codeOp =  [ self.instruct("cmpl", "%ecx", "%eax"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("sets", "%al")]
-        elif isinstance(op, token.GreaterThan):
+        elif op == token.GreaterThan.kind:
             codeOp =  [ self.instruct("cmpl", "%eax", "%ecx"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("sets", "%al")]
-        elif isinstance(op, token.LessThanEqual):
+        elif op == token.LessThanEqual.kind:
             codeOp =  [ self.instruct("cmpl", "%eax", "%ecx"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("setns", "%al")]
-        elif isinstance(op, token.GreaterThanEqual):
+        elif op == token.GreaterThanEqual.kind:
             codeOp =  [ self.instruct("cmpl", "%ecx", "%eax"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("setns", "%al")]
-        elif isinstance(op, token.And):
+        elif op == token.And.kind:
             codeOp =  [ self.instruct("cmpl", "$0", "%eax"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("setne", "%al"),
@@ -331,72 +530,116 @@ class Generator_x86_64(Generator):
                         self.instruct("movl", "$0", "%ecx"),
                         self.instruct("setne", "%cl"),
                         self.instruct("andl", "%ecx", "%eax")]
-        elif isinstance(op, token.Or):
+        elif op == token.Or.kind:
             codeOp =  [ self.instruct("orl", "%ecx", "%eax"),
                         self.instruct("cmpl", "$0", "%eax"),
                         self.instruct("movl", "$0", "%eax"),
                         self.instruct("setne", "%al")]
         else:
-            raise UnknownExpressionError(expr)
+            codeOp = None
+        return codeOp
+
+    def binaryCode(self, codeSet1, codeSet2, codeOp):
+        # The code of a binary operation whose operands are made by the
+        # plans codeSet1 and codeSet2.
+        codePush1 = [   self.instruct("pushq", "%rax")]
+        codeSet2 = codeSet2 + [ self.instruct("movl", "%eax", "%ecx")]
+        codePop1  = [   self.instruct("popq", "%rax")]
 
         code = codeSet1+codePush1+codeSet2+codePop1+codeOp
         return code
 
-    def assignOpCode(self, expr, cont):
-        offset = cont.varLoc(expr.id)
-        calc = self.generateExpression(expr.expr, cont)
-        var = "{0:d}(%rbp)".format(offset)
-        if isinstance(expr.op, token.Assign):
+    def binaryOpCode(self, expr, frame):
+
+        codeOp = self.binaryOpInstructions(expr.op.kind)
+        if codeOp is None:
+            raise UnknownExpressionError(expr)
+
+        codeSet1 = [(self.expressionPlan, expr.expr1, frame)]
+        codeSet2 = [(self.expressionPlan, expr.expr2, frame)]
+        return self.binaryCode(codeSet1, codeSet2, codeOp)
+
+    def arenaBinaryOpCode(self, store, handle, frame):
+
+        codeOp = self.binaryOpInstructions(store.ops[handle])
+        if codeOp is None:
+            raise UnknownExpressionError(handle)
+
+        e1, e2 = store.childHandles(handle)
+        codeSet1 = [(self.arenaExpressionPlan, store, e1, frame)]
+        codeSet2 = [(self.arenaExpressionPlan, store, e2, frame)]
+        return self.binaryCode(codeSet1, codeSet2, codeOp)
+
+    def assignInstructions(self, op, var):
+        if op == token.Assign.kind:
             assign = [  self.instruct("movq", "%rax", var)]
-        elif isinstance(expr.op, token.AssignAdd):
+        elif op == token.AssignAdd.kind:
             assign = [  self.instruct("addq", "%rax", var),
                         self.instruct("movq", var, "%rax")]
-        elif isinstance(expr.op, token.AssignSub):
+        elif op == token.AssignSub.kind:
             assign = [  self.instruct("subq", "%rax", var),
                         self.instruct("movq", var, "%rax")]
-        elif isinstance(expr.op, token.AssignMult):
+        elif op == token.AssignMult.kind:
             assign = [  self.instruct("imulq",var),
                         self.instruct("movq", "%rax", var)]
-        elif isinstance(expr.op, token.AssignDiv):
+        elif op == token.AssignDiv.kind:
             assign = [  self.instruct("movq", "%rax", "%rcx"),
                         self.instruct("movq", var, "%rax"),
                         self.instruct("movq", "$0", "%rdx"),
                         self.instruct("idivq", "%rcx"),
                         self.instruct("movq", "%rax", var)]
-        elif isinstance(expr.op, token.AssignMod):
+        elif op == token.AssignMod.kind:
             assign = [  self.instruct("movq", "%rax", "%rcx"),
                         self.instruct("movq", var, "%rax"),
                         self.instruct("movq", "$0", "%rdx"),
                         self.instruct("idivq", "%rcx"),
                         self.instruct("movq", "%rdx", var),
                         self.instruct("movq", "%rdx", "%rax")]
-        elif isinstance(expr.op, token.AssignBShiftL):
+        elif op == token.AssignBShiftL.kind:
             assign = [  self.instruct("movq", "%rax", "%rcx"),
                         self.instruct("shlq", "%cl", var),
                         self.instruct("movq", var, "%rax")]
-        elif isinstance(expr.op, token.AssignBShiftR):
+        elif op == token.AssignBShiftR.kind:
             assign = [  self.instruct("movq", "%rax", "%rcx"),
                         self.instruct("shrq", "%cl", var),
                         self.instruct("movq", var, "%rax")]
-        elif isinstance(expr.op, token.AssignBAnd):
+        elif op == token.AssignBAnd.kind:
             assign = [  self.instruct("andq", "%rax", var),
                         self.instruct("movq", var, "%rax")]
-        elif isinstance(expr.op, token.AssignBOr):
+        elif op == token.AssignBOr.kind:
             assign = [  self.instruct("orq", "%rax", var),
                         self.instruct("movq", var, "%rax")]
-        elif isinstance(expr.op, token.AssignBXor):
+        elif op == token.AssignBXor.kind:
             assign = [  self.instruct("xorq", "%rax", var),
                         self.instruct("movq", var, "%rax")]
         else:
+            assign = None
+        return assign
+
+    def assignOpCode(self, expr, frame):
+        offset = frame.offset(expr)
+        calc = [(self.expressionPlan, expr.expr, frame)]
+        var = "{0:d}(%rbp)".format(offset)
+        assign = self.assignInstructions(expr.op.kind, var)
+        if assign is None:
             raise UnknownExpressionError(expr)
         code = calc + assign
         return code
 
-    def conditionalExprCode(self, expr, cont):
+    def arenaAssignOpCode(self, store, handle, frame):
+        offset = frame.offset(handle)
+        value = store.children[store.childStarts[handle]]
+        calc = [(self.arenaExpressionPlan, store, value, frame)]
+        var = "{0:d}(%rbp)".format(offset)
+        assign = self.assignInstructions(store.ops[handle], var)
+        if assign is None:
+            raise UnknownExpressionError(handle)
+        code = calc + assign
+        return code
 
-        evalCond = self.generateExpression(expr.cond, cont)
-        evalTrue = self.generateExpression(expr.true, cont)
-        evalFalse = self.generateExpression(expr.false, cont)
+    def conditionalCode(self, evalCond, evalTrue, evalFalse):
+        # The code of a ?:, or of an if when evalFalse is not None, from
+        # the plans of its parts.
         falseLabel = self.makeLabel()
         endLabel = self.makeLabel()
 
@@ -412,53 +655,78 @@ class Generator_x86_64(Generator):
 
         return code
 
-    def conditionalStmntCode(self, stmnt, cont):
+    def conditionalExprCode(self, expr, frame):
 
-        evalCond = self.generateExpression(stmnt.cond, cont)
-        evalTrue = self.generateStatement(stmnt.ifS, cont)
-        
-        if stmnt.elseS is not None:
-            evalFalse = self.generateStatement(stmnt.elseS, cont)
-            falseLabel = self.makeLabel()
-            endLabel = self.makeLabel()
+        evalCond = [(self.expressionPlan, expr.cond, frame)]
+        evalTrue = [(self.expressionPlan, expr.true, frame)]
+        evalFalse = [(self.expressionPlan, expr.false, frame)]
 
-            checkCond = [   self.instruct("cmpq", "$0", "%rax"),
-                            self.instruct("je", falseLabel)]
+        return self.conditionalCode(evalCond, evalTrue, evalFalse)
 
-            jmpEnd = [  self.instruct("jmp", endLabel)]
-            lblFalse = [    self.label(falseLabel)]
-            lblEnd = [    self.label(endLabel)]
+    def arenaConditionalExprCode(self, store, handle, frame):
 
-            code = evalCond + checkCond + evalTrue + jmpEnd\
-                    + lblFalse + evalFalse + lblEnd
-        else:
-            endLabel = self.makeLabel()
+        cond, true, false = store.childHandles(handle)
+        evalCond = [(self.arenaExpressionPlan, store, cond, frame)]
+        evalTrue = [(self.arenaExpressionPlan, store, true, frame)]
+        evalFalse = [(self.arenaExpressionPlan, store, false, frame)]
+
+        return self.conditionalCode(evalCond, evalTrue, evalFalse)
+
+    def ifCode(self, evalCond, evalTrue, evalFalse):
+        # The code of an if, with no else if evalFalse is None.
+        if evalFalse is not None:
+            return self.conditionalCode(evalCond, evalTrue, evalFalse)
 
-            checkCond = [   self.instruct("cmpq", "$0", "%rax"),
-                            self.instruct("je", endLabel)]
+        endLabel = self.makeLabel()
 
-            lblEnd = [    self.label(endLabel)]
+        checkCond = [   self.instruct("cmpq", "$0", "%rax"),
+                        self.instruct("je", endLabel)]
+
+        lblEnd = [    self.label(endLabel)]
 
-            code = evalCond + checkCond + evalTrue + lblEnd
+        code = evalCond + checkCond + evalTrue + lblEnd
 
         return code
 
-    def whileStmntCode(self, stmnt, superCont):
-        cont = context.Context(superContext=superCont)
+    def conditionalStmntCode(self, stmnt, frame):
+
+        evalCond = [(self.expressionPlan, frame.expression(stmnt, 'cond'),
+                        frame)]
+        evalTrue = [(self.statementPlan, stmnt.ifS, frame)]
+        
+        if stmnt.elseS is not None:
+            evalFalse = [(self.statementPlan, stmnt.elseS, frame)]
+        else:
+            evalFalse = None
+
+        return self.ifCode(evalCond, evalTrue, evalFalse)
+
+    def arenaConditionalStmntCode(self, store, handle, frame):
+
+        cond, ifS, elseS = store.childHandles(handle)
+        evalCond = [(self.arenaExpressionPlan, store, cond, frame)]
+        evalTrue = [(self.arenaStatementPlan, store, ifS, frame)]
+
+        if elseS >= 0:
+            evalFalse = [(self.arenaStatementPlan, store, elseS, frame)]
+        else:
+            evalFalse = None
+
+        return self.ifCode(evalCond, evalTrue, evalFalse)
+
+    def whileCode(self, stmnt, frame, evalCond, evalStmnt):
+        # The code of the while loop stmnt (a node or a handle) from the
+        # plans of its parts.  Its labels go in the frame first, for the
+        # breaks and continues in evalStmnt.
         startLabel = self.makeLabel()
         endLabel = self.makeLabel()
-        cont.continueLabel = startLabel
-        cont.breakLabel = endLabel
+        frame.labels[frame.key(stmnt)] = (startLabel, endLabel)
 
         lblStart =  [   self.label(startLabel)]
 
-        evalCond = self.generateExpression(stmnt.cond, cont)
-
         checkCond = [   self.instruct("cmpq", "$0", "%rax"),
                         self.instruct("je", endLabel)]
 
-        evalStmnt = self.generateStatement(stmnt.body, cont)
-
         loop =      [   self.instruct("jmp", startLabel)]
 
         lblEnd =    [   self.label(endLabel)]
@@ -467,22 +735,28 @@ class Generator_x86_64(Generator):
 
         return stmnt
 
-    def doStmntCode(self, stmnt, superCont):
-        cont = context.Context(superContext=superCont)
+    def whileStmntCode(self, stmnt, frame):
+        evalCond = [(self.expressionPlan, frame.expression(stmnt, 'cond'),
+                        frame)]
+        evalStmnt = [(self.statementPlan, stmnt.body, frame)]
+        return self.whileCode(stmnt, frame, evalCond, evalStmnt)
+
+    def arenaWhileStmntCode(self, store, handle, frame):
+        cond, body = store.childHandles(handle)
+        evalCond = [(self.arenaExpressionPlan, store, cond, frame)]
+        evalStmnt = [(self.arenaStatementPlan, store, body, frame)]
+        return self.whileCode(handle, frame, evalCond, evalStmnt)
+
+    def doCode(self, stmnt, frame, evalStmnt, evalCond):
         startLabel = self.makeLabel()
         condLabel = self.makeLabel()
         endLabel = self.makeLabel()
-        cont.continueLabel = condLabel
-        cont.breakLabel = endLabel
+        frame.labels[frame.key(stmnt)] = (condLabel, endLabel)
 
         lblStart =  [   self.label(startLabel)]
 
-        evalStmnt = self.generateStatement(stmnt.body, cont)
-
         lblCond =   [   self.label(condLabel)]
 
-        evalCond = self.generateExpression(stmnt.cond, cont)
-        
         checkCond = [   self.instruct("cmpq", "$0", "%rax"),
                         self.instruct("je", endLabel)]
 
@@ -494,65 +768,113 @@ class Generator_x86_64(Generator):
 
         return stmnt
 
-    def forStmntCode(self, stmnt, superCont):
-        cont = context.Context(superContext=superCont)
+    def doStmntCode(self, stmnt, frame):
+        evalStmnt = [(self.statementPlan, stmnt.body, frame)]
+        evalCond = [(self.expressionPlan, frame.expression(stmnt, 'cond'),
+                        frame)]
+        return self.doCode(stmnt, frame, evalStmnt, evalCond)
+
+    def arenaDoStmntCode(self, store, handle, frame):
+        cond, body = store.childHandles(handle)
+        evalStmnt = [(self.arenaStatementPlan, store, body, frame)]
+        evalCond = [(self.arenaExpressionPlan, store, cond, frame)]
+        return self.doCode(handle, frame, evalStmnt, evalCond)
+
+    def forCode(self, stmnt, frame, evalInit, evalCond, evalStmnt, evalPost,
+                dealloc):
         startLabel = self.makeLabel()
         postLabel = self.makeLabel()
         endLabel = self.makeLabel()
-        cont.continueLabel = postLabel
-        cont.breakLabel = endLabel
-
-        if stmnt.init is None:
-            evalInit = []
-        elif isinstance(stmnt.init, symbol.Declaration):
-            evalInit = self.generateDeclaration(stmnt.init, cont)
-        else:
-            evalInit = self.generateExpression(stmnt.init, cont)
+        frame.labels[frame.key(stmnt)] = (postLabel, endLabel)
 
         lblStart =  [   self.label(startLabel)]
 
-        evalCond = self.generateExpression(stmnt.cond, cont)
-
         checkCond = [   self.instruct("cmpq", "$0", "%rax"),
                         self.instruct("je", endLabel)]
 
-        evalStmnt = self.generateStatement(stmnt.body, cont)
-
         lblPost =   [   self.label(postLabel)]
 
+        loop =      [   self.instruct("jmp", startLabel)]
+
+        lblEnd =    [   self.label(endLabel)]
+
+        stmnt = evalInit + lblStart + evalCond + checkCond + evalStmnt\
+                + lblPost + evalPost + loop + lblEnd + dealloc
+
+        return stmnt
+
+    def forStmntCode(self, stmnt, frame):
+        if stmnt.init is None:
+            evalInit = []
+        elif isinstance(stmnt.init, symbol.Declaration):
+            evalInit = [(self.declarationPlan, stmnt.init, frame)]
+        else:
+            evalInit = [(self.expressionPlan,
+                            frame.expression(stmnt, 'init'), frame)]
+
+        evalCond = [(self.expressionPlan, frame.expression(stmnt, 'cond'),
+                        frame)]
+
+        evalStmnt = [(self.statementPlan, stmnt.body, frame)]
+
         if stmnt.post is None:
             evalPost = []
         else:
-            evalPost = self.generateExpression(stmnt.post, cont)
-
-        loop =      [   self.instruct("jmp", startLabel)]
+            evalPost = [(self.expressionPlan,
+                            frame.expression(stmnt, 'post'), frame)]
 
-        lblEnd =    [   self.label(endLabel)]
-        
         if isinstance(stmnt.init, symbol.Declaration):
-            bytesAdded = "${0:d}".format(cont.vmap.size)
-            dealloc = [ self.instruct("addq", bytesAdded, "%rsp")]
+            dealloc = self.deallocPlan(stmnt, frame)
         else:
             dealloc = []
 
-        stmnt = evalInit + lblStart + evalCond + checkCond + evalStmnt\
-                + lblPost + evalPost + loop + lblEnd + dealloc
+        return self.forCode(stmnt, frame, evalInit, evalCond, evalStmnt,
+                            evalPost, dealloc)
 
-        return stmnt
+    def arenaForStmntCode(self, store, handle, frame):
+        init, cond, post, body = store.childHandles(handle)
+        declared = init >= 0 and issubclass(
+                    arena.nodeClasses[store.kinds[init]], symbol.Declaration)
+
+        if init < 0:
+            evalInit = []
+        elif declared:
+            evalInit = [(self.arenaDeclarationPlan, store, init, frame)]
+        else:
+            evalInit = [(self.arenaExpressionPlan, store, init, frame)]
+
+        evalCond = [(self.arenaExpressionPlan, store, cond, frame)]
+
+        evalStmnt = [(self.arenaStatementPlan, store, body, frame)]
+
+        if post < 0:
+            evalPost = []
+        else:
+            evalPost = [(self.arenaExpressionPlan, store, post, frame)]
+
+        if declared:
+            dealloc = self.deallocPlan(handle, frame)
+        else:
+            dealloc = []
+
+        return self.forCode(handle, frame, evalInit, evalCond, evalStmnt,
+                            evalPost, dealloc)
 
-    def breakStmntCode(self, stmnt, cont):
-        if cont.breakLabel is None:
+    def breakStmntCode(self, stmnt, frame):
+        loop = frame.loop(stmnt)
+        if loop is None:
             raise InvalidBreakContextError()
 
-        stmnt =  [   self.instruct("jmp", cont.breakLabel)]
+        stmnt =  [   self.instruct("jmp", frame.labels[frame.key(loop)][1])]
 
         return stmnt
         
-    def continueStmntCode(self, stmnt, cont):
-        if cont.continueLabel is None:
+    def continueStmntCode(self, stmnt, frame):
+        loop = frame.loop(stmnt)
+        if loop is None:
             raise InvalidContinueContextError()
 
-        stmnt =  [   self.instruct("jmp", cont.continueLabel)]
+        stmnt =  [   self.instruct("jmp", frame.labels[frame.key(loop)][0])]
 
         return stmnt
         
@@ -0,0 +1,116 @@
+from . import symbol
+
+class ASTIndex():
+    # Lookups over a Program, built in one pass so that questions about the
+    # tree don't each need a walk over it:
+    #   parent(node)            the node node is a child of
+    #   nodes(cls)              every node of class cls (not subclasses)
+    #   defs(func, name)        declarations, assignments and increments of
+    #                           the variable name in the function func
+    #   uses(func, name)        references to it, including the variables
+    #                           of increments
+    #   loop(jump)              the loop a BreakS or ContinueS is in
+    # Functions and variables are given by name, so variables in different
+    # scopes of a function with the same name are lumped together.
+    # Answers are lists, made in time proportional to their length.  They
+    # are in source order, except that nodes(cls) gives the nodes of
+    # replaced bodies after the others.
+    #
+    # Nodes can't be hashed, so they are keyed by id() and kept alive by
+    # the tree.  Skipped function bodies are parsed.  The tree must not be
+    # changed behind the index's back: replace function bodies with
+    # replaceBody(), which updates the index for that function only.  In a
+    # tree with shared subtrees (see symbol.NodeTable) a shared node has
+    # the parent it was last reached from.
+
+    def __init__(self, prog):
+        self.program = prog
+        self.parents = {}
+        self.byClass = {}
+        self.loops = {}
+        self.functions = {}
+        self.add(prog, None)
+
+    def add(self, tree, parent):
+        # Index tree, a child of parent, from an explicit stack.  Each
+        # entry carries the loop and the function the node is in.
+        parents = self.parents
+        byClass = self.byClass
+        stack = [(tree, parent, None, None)]
+        while stack:
+            node, parent, loop, func = stack.pop()
+            key = id(node)
+            parents[key] = parent
+            cls = node.__class__
+            nodes = byClass.get(cls)
+            if nodes is None:
+                nodes = {}
+                byClass[cls] = nodes
+            nodes[key] = node
+
+            if isinstance(node, symbol.IterationS):
+                loop = node
+            elif isinstance(node, symbol.JumpS):
+                self.loops[key] = loop
+            elif isinstance(node, symbol.FunctionD):
+                if node.body is not None:
+                    func = self.function(node.name.val)
+            elif func is not None:
+                if isinstance(node, symbol.VarRefE):
+                    self.record(func[1], node.id.val, node)
+                elif isinstance(node, (symbol.VariableD, symbol.AssignE)):
+                    self.record(func[0], node.id.val, node)
+                elif isinstance(node, (symbol.IncrementPreE,
+                                        symbol.IncrementPostE)):
+                    self.record(func[0], node.var.id.val, node)
+
+            stack.extend([(child, node, loop, func) for child
+                            in reversed(symbol.nodeChildren(node))])
+
+    def remove(self, tree):
+        # Drop tree from the parents, classes and loops.
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            key = id(node)
+            self.parents.pop(key, None)
+            self.byClass[node.__class__].pop(key, None)
+            self.loops.pop(key, None)
+            stack.extend(symbol.nodeChildren(node))
+
+    def function(self, name):
+        # New def and use tables for the function name.
+        func = ({}, {})
+        self.functions[name] = func
+        return func
+
+    def record(self, table, name, node):
+        nodes = table.get(name)
+        if nodes is None:
+            nodes = []
+            table[name] = nodes
+        nodes.append(node)
+
+    def replaceBody(self, func, body):
+        # Give the FunctionD func the body body (a CompoundS or None),
+        # updating the index.
+        if func.body is not None:
+            self.remove(func.body)
+        self.functions.pop(func.name.val, None)
+        func.body = body
+        self.add(func, self.parents[id(func)])
+
+    def parent(self, node):
+        return self.parents[id(node)]
+
+    def nodes(self, cls):
+        return list(self.byClass.get(cls, {}).values())
+
+    def defs(self, func, name):
+        return list(self.functions.get(func, ({}, {}))[0].get(name, ()))
+
+    def uses(self, func, name):
+        return list(self.functions.get(func, ({}, {}))[1].get(name, ()))
+
+    def loop(self, jump):
+        return self.loops[id(jump)]
@@ -1,6 +1,16 @@
+import re
+import bisect
+from array import array
 from . import token
+from . import tokenbuffer
+from . import position
 from . import exception
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class LexError(exception.ThiccError):
     pass
 
@@ -19,9 +29,14 @@ class LexInvalidPunctuatorError(LexError):
         self.expression = lit
         self.message = message
 
+# Character classes of the numpy engine, and its placeholder kind for runs
+# that aren't a valid identifier or number.
+_SPACE, _ALNUM, _PUNCT, _ILLEGAL = range(4)
+_BADID = -2
+
 class Lexer():
 
-    def __init__(self):
+    def __init__(self, engine="scalar", output="list"):
         self.punct = {';':token.Semicolon, 
                     '(':token.OpenParentheses,
                     ')':token.ClosedParentheses,
@@ -79,17 +94,225 @@ class Lexer():
         self.alnumchars = self.intchars + self.alchars
         self.punctchars = "".join(self.punct)
         self.maxPunctLen = max([len(p) for p in self.punct])
+        self.minKeywordLen = min([len(k) for k in self.keywords])
+        self.maxKeywordLen = max([len(k) for k in self.keywords])
+        self.punctToks = {p: cls() for p, cls in self.punct.items()}
+        self.keywordToks = {k: cls() for k, cls in self.keywords.items()}
+        # Kind lookups accept both str and (ASCII) bytes spellings, so the
+        # regex engine can lex bytes-like input without decoding it.
+        self.punctKinds = {p: cls.kind for p, cls in self.punct.items()}
+        self.keywordKinds = {k: cls.kind for k, cls in self.keywords.items()}
+        self.punctKinds.update({p.encode(): cls.kind
+                                    for p, cls in self.punct.items()})
+        self.keywordKinds.update({k.encode(): cls.kind
+                                    for k, cls in self.keywords.items()})
+        self.punctTrie = self._compilePunctTrie()
+
+        self.engines = {'scalar': self._scanScalar,
+                        'regex': self._scanRegex,
+                        'numpy': self._scanNumpy}
+        if engine not in self.engines:
+            raise ValueError("Unknown lexer engine: {0:s}".format(engine))
+        if engine == 'numpy' and np is None:
+            # NumPy is optional: without it the numpy engine is the regex
+            # engine, which gives the same tokens.
+            engine = 'regex'
+        if output not in ('list', 'buffer', 'stream'):
+            raise ValueError("Unknown lexer output: {0:s}".format(output))
+        self.engine = engine
+        self.output = output
+        self.regex = self._compileRegex()
+        self.regexBytes = self._compileRegex(binary=True)
+        self.lineEnd = re.compile(b"\n")
+        self.blockEnd = re.compile(rb"\*/")
+        if np is not None:
+            self.charClasses = self._compileCharClasses()
+
+    def _compileRegex(self, binary=False):
+        # One master pattern for the regex engine.  Whitespace and comments
+        # are skipped in front of every match, so each match is exactly one
+        # token (or the end of the input).  Punctuators are tried longest
+        # first to get maximal munch.  The bytes pattern spells out the
+        # ASCII characters str.isspace() accepts, since \s is narrower for
+        # bytes.
+        if binary:
+            space = r"[ \t\n\r\x0b\x0c\x1c-\x1f]"
+        else:
+            space = r"\s"
+        skip = r"(?:" + space + r"+|//[^\n]*\n?|/\*.*?(?:\*/|\Z))*"
+        kws = "|".join([re.escape(k) for k in self.keywords])
+        puncts = "|".join([re.escape(p) for p in
+                            sorted(self.punct, key=len, reverse=True)])
+        pattern = (skip
+                + "(?:(?P<punct>" + puncts + ")"
+                + "|(?P<kw>(?:" + kws + ")(?![0-9A-Za-z]))"
+                + "|(?P<id>[A-Za-z][0-9A-Za-z]*)"
+                + "|(?P<int>[0-9]+(?![0-9A-Za-z]))"
+                + "|(?P<badid>[0-9][0-9A-Za-z]*)"
+                + "|(?P<illegal>.)"
+                + r"|(?P<end>\Z))")
+        if binary:
+            pattern = pattern.encode()
+        return re.compile(pattern, re.DOTALL)
 
     def tokenize(self, inputStr):
+        # inputStr may be a str or any bytes-like object (bytes, bytearray,
+        # memoryview, mmap).  Each engine is a scanner yielding
+        # (kind, start, end) triples; the output mode decides how they are
+        # stored.
+        scan = self.engines[self.engine](inputStr)
+        if self.output == 'buffer':
+            return tokenbuffer.TokenBuffer(inputStr, scan)
+        if self.output == 'stream':
+            return tokenbuffer.TokenStream(inputStr, scan)
+
         toks = []
-        start = 0
+        append = toks.append
+        instances = tokenbuffer._instances
+        classes = token.kinds
+        identifier = token.Identifier.kind
+        names = token.NameTable()
+        decode = not isinstance(inputStr, str)
+        for kind, start, end in scan:
+            tok = instances[kind]
+            if tok is None:
+                text = inputStr[start:end]
+                if decode:
+                    text = str(text, 'ascii')
+                if kind == identifier:
+                    tok = names.identifier(text)
+                else:
+                    tok = classes[kind](text)
+            append(tok)
+        return toks
+
+    def _charAt(self, inputStr, i):
+        # The character at i.  In bytes input only ASCII is accepted, so
+        # any other byte is reported as the replacement character.
+        c = inputStr[i]
+        if not isinstance(c, str):
+            c = chr(c) if c < 128 else '\ufffd'
+        return c
+
+    def _isIllegal(self, inputStr, i):
+        # Whether the character at i can't start anything.
+        c = self._charAt(inputStr, i)
+        return not c.isspace() and c not in self.alnumchars\
+                and c not in self.punctchars
+
+    def relex(self, buf, offset, deleted, inserted):
+        # Lex an edited source incrementally.  buf is the TokenBuffer of the
+        # source before the edit, which replaced deleted characters at
+        # offset with the text inserted.  Returns the TokenBuffer of the
+        # edited source.
+        #
+        # A token only depends on the text up to one character past its end
+        # (maximal munch looks no further), and after a token the lexer is
+        # never inside a comment.  So lexing restarts at the end of the last
+        # token that ends before the edit, and stops as soon as it produces
+        # a token past the edit that matches an old token shifted by the
+        # change in length: from there on the old tokens are unchanged.
+        old = buf.source
+        if isinstance(old, str):
+            text = old[:offset] + inserted + old[offset+deleted:]
+        else:
+            text = b"".join([old[:offset], inserted, old[offset+deleted:]])
+        delta = len(inserted) - deleted
+        editEnd = offset + len(inserted)
+
+        r = bisect.bisect_left(buf.ends, offset)
+        restart = buf.ends[r-1] if r > 0 else 0
+
+        new = tokenbuffer.TokenBuffer(text)
+        new.values = buf.values
+        new.names = buf.names
+        new.kinds = buf.kinds[:r]
+        new.starts = buf.starts[:r]
+        new.ends = buf.ends[:r]
+
+        kinds = buf.kinds
+        starts = buf.starts
+        ends = buf.ends
+        n = len(buf)
+        j = r
+        for kind, start, end in self.engines[self.engine](text, restart):
+            if start >= editEnd:
+                oldStart = start - delta
+                while j < n and starts[j] < oldStart:
+                    j += 1
+                if j < n and starts[j] == oldStart\
+                        and ends[j] == end - delta and kinds[j] == kind:
+                    new.kinds.extend(kinds[j:])
+                    if delta == 0:
+                        new.starts.extend(starts[j:])
+                        new.ends.extend(ends[j:])
+                    else:
+                        new.starts.extend(array('I',
+                                            [s + delta for s in starts[j:]]))
+                        new.ends.extend(array('I',
+                                            [e + delta for e in ends[j:]]))
+                    break
+            new.append(kind, start, end)
+
+        return new
+
+    def _scanRegex(self, inputStr, pos=0):
+        punct = self.punctKinds
+        keywords = self.keywordKinds
+        identifier = token.Identifier.kind
+        intc = token.IntC.kind
+        if isinstance(inputStr, str):
+            regex = self.regex
+        else:
+            regex = self.regexBytes
+
+        for m in regex.finditer(inputStr, pos):
+            group = m.lastgroup
+            if group == 'punct':
+                start, end = m.span(group)
+                yield punct[m.group(group)], start, end
+            elif group == 'id':
+                start, end = m.span(group)
+                yield identifier, start, end
+            elif group == 'kw':
+                start, end = m.span(group)
+                yield keywords[m.group(group)], start, end
+            elif group == 'int':
+                start, end = m.span(group)
+                yield intc, start, end
+            elif group == 'end':
+                break
+            elif group == 'badid':
+                # The scalar engine only checks an identifier once its run
+                # ends, so an illegal character right after it wins.
+                lines = position.LineIndex(inputStr)
+                end = m.end()
+                if end < len(inputStr) and self._isIllegal(inputStr, end):
+                    raise LexIllegalCharError(self._charAt(inputStr, end))\
+                            .setPosition(end, lines)
+                text = m.group(group)
+                if not isinstance(text, str):
+                    text = str(text, 'ascii')
+                raise LexInvalidIdentifierError(text).setPosition(
+                                                    m.start(group), lines)
+            else:
+                start = m.start(group)
+                raise LexIllegalCharError(self._charAt(inputStr, start))\
+                        .setPosition(start, position.LineIndex(inputStr))
+
+    def _scanScalar(self, inputStr, pos=0):
+        if not isinstance(inputStr, str):
+            # The character loop works on str.  Decoding as ASCII, with
+            # each other byte replaced by one (illegal) character, keeps
+            # offsets the same as in the bytes.
+            inputStr = str(inputStr, 'ascii', 'replace')
+        start = pos
         readingComment = False
         commentEnd = None
         commentStart = None
         readingExpression = False
-        readingPunct = False
 
-        i = 0
+        i = pos
         while i < len(inputStr):
             #Handle comments
             if readingComment:
@@ -106,11 +329,8 @@ class Lexer():
                 for com in self.comments.keys():
                     if inputStr[i:i+len(com)] == com:
                         if readingExpression:
-                            toks.append(self._tokExp(inputStr[start:i]))
+                            yield self._expKind(inputStr, start, i), start, i
                             readingExpression = False
-                        elif readingPunct:
-                            toks += self._tokPunct(inputStr[start:i])
-                            readingPunct = False
                         commentStart = com
                         commentEnd = self.comments[com]
                         readingComment = True
@@ -122,76 +342,211 @@ class Lexer():
             c = inputStr[i]
             if c.isspace():
                 if readingExpression:
-                    toks.append(self._tokExp(inputStr[start:i]))
+                    yield self._expKind(inputStr, start, i), start, i
                     readingExpression = False
-                elif readingPunct:
-                    toks += self._tokPunct(inputStr[start:i])
-                    readingPunct = False
-            elif readingPunct:
-                if c in self.alnumchars:
-                    toks += self._tokPunct(inputStr[start:i])
-                    readingPunct = False
-                    readingExpression = True
-                    start = i
-                elif c not in self.punctchars:
-                    raise LexIllegalCharError(c)
-            elif readingExpression:
-                if c in self.punctchars:
-                    toks.append(self._tokExp(inputStr[start:i]))
+            elif c in self.punctchars:
+                if readingExpression:
+                    yield self._expKind(inputStr, start, i), start, i
                     readingExpression = False
-                    readingPunct = True
-                    start = i
-                elif c not in self.alnumchars:
-                    raise LexIllegalCharError(c)
+                kind, end = self._tokPunct(inputStr, i)
+                yield kind, i, end
+                i = end
+                continue
+            elif readingExpression:
+                if c not in self.alnumchars:
+                    raise LexIllegalCharError(c).setPosition(i,
+                                            position.LineIndex(inputStr))
             else:
                 if c in self.alnumchars:
                     readingExpression = True
                     start = i
-                elif c in self.punctchars:
-                    readingPunct = True
-                    start = i
                 else:
-                    raise LexIllegalCharError(c)
+                    raise LexIllegalCharError(c).setPosition(i,
+                                            position.LineIndex(inputStr))
             i += 1
         if readingExpression:
-            toks.append(self._tokExp(inputStr[start:]))
-        elif readingPunct:
-            toks += self._tokPunct(inputStr[start:])
+            yield self._expKind(inputStr, start, len(inputStr)), \
+                    start, len(inputStr)
 
+    def _compileCharClasses(self):
+        # Lookup tables from byte value for the numpy engine: the character
+        # class, and the kind code of the one character punctuator (-1 if
+        # there is none).  Bytes past ASCII are illegal, as in the other
+        # engines.
+        classes = np.full(256, _ILLEGAL, dtype=np.uint8)
+        punctKinds = np.full(256, -1, dtype=np.int32)
+        for b in range(128):
+            c = chr(b)
+            if c.isspace():
+                classes[b] = _SPACE
+            elif c in self.alnumchars:
+                classes[b] = _ALNUM
+            elif c in self.punctchars:
+                classes[b] = _PUNCT
+            if c in self.punct:
+                punctKinds[b] = self.punct[c].kind
+        return classes, punctKinds
 
-        return toks
+    def _scanNumpy(self, inputStr, pos=0):
+        # Classify every character at once through a lookup table, blank
+        # out the comments and split the source into runs of one class.
+        # Runs whose kind follows from their class, length and first
+        # character (numbers, identifiers too long or short to be keywords,
+        # single punctuators) get it vectorized too; the rest go through
+        # _tokExp/_tokPunct in a Python loop.  A str that isn't ASCII can't
+        # be viewed as one byte per character, so it goes to the regex
+        # engine instead.
+        if isinstance(inputStr, str):
+            if not inputStr.isascii():
+                yield from self._scanRegex(inputStr, pos)
+                return
+            data = inputStr.encode('ascii')
+        else:
+            data = inputStr
+        n = len(data)
+        if pos >= n:
+            return
+        charClasses, punctKinds = self.charClasses
+        codes = np.frombuffer(data, dtype=np.uint8)[pos:]
+        classes = charClasses[codes]
+
+        # Comment openers are a '/' followed by '/' or '*'.  Any opener not
+        # already inside a comment starts one: no punctuator has a '/'
+        # after its first character, so maximal munch never swallows it.
+        slashes = np.flatnonzero(codes[:-1] == ord('/'))
+        seconds = codes[slashes+1]
+        isOpener = (seconds == ord('/')) | (seconds == ord('*'))
+        covered = 0
+        for start, second in zip(slashes[isOpener].tolist(),
+                                    seconds[isOpener].tolist()):
+            if start < covered:
+                continue
+            if second == ord('/'):
+                m = self.lineEnd.search(data, pos+start+2)
+            else:
+                m = self.blockEnd.search(data, pos+start+2)
+            covered = m.end()-pos if m is not None else n-pos
+            classes[start:covered] = _SPACE
 
-    def _tokPunct(self, puncts):
-        #Lex a string containing only Punctuation characters into
-        #(possibly several) tokens
+        bounds = np.flatnonzero(classes[1:] != classes[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(classes)]))
+        runClasses = classes[starts]
+        nextClasses = np.append(runClasses[1:], _SPACE)
+        keep = runClasses != _SPACE
+        starts = starts[keep]
+        ends = ends[keep]
+        runClasses = runClasses[keep]
+        nextClasses = nextClasses[keep]
 
-        # This seems way too complicated. The issue is how to distinguish
-        # '!' and '!='.  The method is to begin at index = 0 of the string
-        # and look for matches with the LONGEST punctuators. If no matches are
-        # found, try the next shortest punctuators, continue until a match is
-        # found, then increment the index by the length of the match. If no
-        # match is found, raise an error.
-        toks = []
+        isDigit = (codes - ord('0')) < 10
+        digitCount = np.concatenate(([0], np.cumsum(isDigit,
+                                                    dtype=np.uint32)))
+        lengths = ends - starts
+        alnum = runClasses == _ALNUM
+        digitFirst = isDigit[starts]
+        allDigits = digitCount[ends] - digitCount[starts] == lengths
+        kinds = np.full(len(starts), -1, dtype=np.int32)
+        kinds[alnum & digitFirst & allDigits] = token.IntC.kind
+        kinds[alnum & digitFirst & ~allDigits] = _BADID
+        kinds[alnum & ~digitFirst & ((lengths < self.minKeywordLen)
+                            | (lengths > self.maxKeywordLen))] \
+                = token.Identifier.kind
+        single = (runClasses == _PUNCT) & (lengths == 1)
+        kinds[single] = punctKinds[codes[starts[single]]]
+        # Drop the view of the input before any error can be raised, so an
+        # mmap given as input can still be closed.
+        codes = None
 
-        l = len(puncts)
-        i=0
-        while i < l:
-            n = min(l-i, self.maxPunctLen)
-            found = False
-            for k in range(n,0,-1):
-                val = puncts[i:i+k]
-                if val in self.punct.keys():
-                    toks.append(self.punct[val]())
-                    i += k
-                    found = True
-                    break
-            if not found:
-                raise LexInvalidPunctuatorError(puncts)
-        return toks
+        # Keyword lookups need hashable slices, which a bytearray or
+        # memoryview doesn't give.
+        copy = isinstance(data, (bytearray, memoryview))
+        keywords = self.keywordKinds
+        identifier = token.Identifier.kind
+        for start, end, kind, cls, nextCls in zip((starts+pos).tolist(),
+                                                (ends+pos).tolist(),
+                                                kinds.tolist(),
+                                                runClasses.tolist(),
+                                                nextClasses.tolist()):
+            if kind >= 0:
+                yield kind, start, end
+            elif kind == _BADID:
+                # As in the scalar engine, an illegal character ends an
+                # identifier with an error before the identifier is checked.
+                if nextCls == _ILLEGAL:
+                    raise LexIllegalCharError(self._charAt(inputStr, end))\
+                            .setPosition(end, position.LineIndex(inputStr))
+                yield self._expKind(inputStr, start, end), start, end
+            elif cls == _ALNUM:
+                word = data[start:end]
+                if copy:
+                    word = bytes(word)
+                yield keywords.get(word, identifier), start, end
+            elif cls == _PUNCT:
+                while start < end:
+                    kind, tokEnd = self._tokPunct(inputStr, start, end)
+                    yield kind, start, tokEnd
+                    start = tokEnd
+            else:
+                raise LexIllegalCharError(self._charAt(inputStr, start))\
+                        .setPosition(start, position.LineIndex(inputStr))
+
+    def _compilePunctTrie(self):
+        # Each trie node is a pair (kind, children): the kind code of the
+        # punctuator spelled by the path to the node (None if there isn't
+        # one) and a dict from the next character to the child node.  The
+        # dicts are keyed by both the character and its code, so the walk
+        # works on bytes input too.
+        root = {}
+        for p, cls in self.punct.items():
+            children = root
+            for j, c in enumerate(p):
+                kind, grandchildren = children.get(c, (None, {}))
+                if j == len(p)-1:
+                    kind = cls.kind
+                children[c] = children[ord(c)] = (kind, grandchildren)
+                children = grandchildren
+        return root
+
+    def _tokPunct(self, inputStr, start, stop=None):
+        #Lex the punctuator at inputStr[start], returning its kind code and
+        #end offset.  The punctuator ends by stop, if given.
+
+        # The issue is how to distinguish '!' and '!='. Walk the punctuator
+        # trie one character at a time from start, remembering the last
+        # node that completed a punctuator: that is the longest match.
+        # If no punctuator matches, raise an error.
+        children = self.punctTrie
+        kind = None
+        end = start
+        i = start
+        n = len(inputStr) if stop is None else stop
+        while i < n:
+            node = children.get(inputStr[i])
+            if node is None:
+                break
+            i += 1
+            if node[0] is not None:
+                kind = node[0]
+                end = i
+            children = node[1]
+        if kind is None:
+            raise LexInvalidPunctuatorError(self._charAt(inputStr, start))\
+                    .setPosition(start, position.LineIndex(inputStr))
+        return kind, end
+
+    def _expKind(self, inputStr, start, end):
+        exp = inputStr[start:end]
+        if not isinstance(exp, str):
+            exp = str(exp, 'ascii')
+        try:
+            return self._tokExp(exp).kind
+        except LexError as e:
+            raise e.setPosition(start, position.LineIndex(inputStr))
 
     def _tokExp(self, exp):
-        if exp in self.keywords.keys():
-            return self.keywords[exp]()
+        if exp in self.keywordToks:
+            return self.keywordToks[exp]
         elif all([c in self.intchars for c in exp]):
             return token.IntC(exp)
         else:
@@ -199,4 +554,3 @@ class Lexer():
                 return token.Identifier(exp)
             else:
                 raise LexInvalidIdentifierError(exp)
-
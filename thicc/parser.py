@@ -1,10 +1,45 @@
+import functools
 from . import token
+from . import cursor
 from . import symbol
 from . import exception
 
+# Operator associativity
+LEFT = 0
+RIGHT = 1
+
+# States of the expression parser
+_EXPR = 0       # about to read an expression
+_FACTOR = 1     # about to read a factor
+_RESULT = 2     # an expression is done and goes to the frame on top
+
+# Frames on the expression parser's stack, and the factor actions
+_ASSIGN = 0
+_UNARY = 1
+_PARENS = 2
+_BINOP = 3
+_TRUE = 4
+_FALSE = 5
+_INCREMENT = 6
+_CONSTANT = 7
+_VARIABLE = 8
+
 class Parser():
 
-    def __init__(self):
+    def __init__(self, strict=True, validate=False, share=False):
+        # Unless strict, the bodies of the program's functions are skipped
+        # by brace matching and only parsed when first used (see
+        # symbol.FunctionD).  Errors in a body are raised then, so the
+        # source must still be readable, e.g. a mapped file still open.
+        # The parser builds nodes that hold together and checks for
+        # duplicate definitions as it goes; validate also runs the full
+        # ASTNode.validate() pass over the tree, as a debugging check.
+        # With share, each parse's pure expressions are hash-consed in a
+        # symbol.NodeTable, so repeated subexpressions are one object.
+        self.strict = strict
+        self.validate = validate
+        self.share = share
+        self.nodes = None
         self.binOpOrder = [[token.Or],
                             [token.And],
                             [token.BitOr],
@@ -16,84 +51,200 @@ class Parser():
                             [token.BitShiftL, token.BitShiftR],
                             [token.Add, token.Neg],
                             [token.Mult, token.Div, token.Mod]]
+        # Binding power and associativity of each binary operator class,
+        # from its place in binOpOrder: later levels bind tighter.  All of
+        # C's binary operators are left associative.
+        self.binOpPower = {opCls.kind: (level+1, LEFT)
+                            for level, ops in enumerate(self.binOpOrder)
+                            for opCls in ops}
+
+        # Dispatch tables keyed by token kind.  Statements are looked up by
+        # their first token; anything else is an expression statement.
+        self.statementParsers = {
+                            token.Return.kind: self.parseReturnStatement,
+                            token.If.kind: self.parseConditionalStmnt,
+                            token.OpenBrace.kind: self.parseCompoundStatement,
+                            token.For.kind: self.parseForStatement,
+                            token.While.kind: self.parseWhileStatement,
+                            token.Do.kind: self.parseDoStatement,
+                            token.Break.kind: self.parseBreakStatement,
+                            token.Continue.kind: self.parseContinueStatement,
+                            token.Semicolon.kind: self.parseNullStatement}
+        # What starts a factor, by its first token, in a tuple indexed by
+        # kind.  It is built from the token categories, in the order the
+        # factor tests used to run, so e.g. Neg (a UnaryOp and a BinaryOp)
+        # starts a unary expression here.
+        masks = token.masks
+        factorActions = []
+        for cls in token.kinds:
+            if cls is token.OpenParentheses:
+                action = _PARENS
+            elif cls.category & masks[token.IncrementOp]:
+                action = _INCREMENT
+            elif cls.category & masks[token.UnaryOp]:
+                action = _UNARY
+            elif cls.category & masks[token.Constant]:
+                action = _CONSTANT
+            elif cls.category & masks[token.Identifier]:
+                action = _VARIABLE
+            else:
+                action = None
+            factorActions.append(action)
+        self.factorActions = tuple(factorActions)
+        # Kinds in a category, for membership tests that also take the None
+        # kind past the end of the input.
+        self.ternaryKinds = self.kindsOf(token.TernaryA)
+        self.assignKinds = self.kindsOf(token.AssignmentOp)
+        self.incrementKinds = self.kindsOf(token.IncrementOp)
+        # What may follow the name in a variable declaration.
+        self.variableDecKinds = frozenset([token.Assign.kind,
+                                            token.Semicolon.kind])
+
+    def kindsOf(self, category):
+        mask = token.masks[category]
+        return frozenset([cls.kind for cls in token.kinds
+                            if cls.category & mask])
 
     def parse(self, toks):
 
-        reverseTokens = toks[::-1]
-
-        ast = self.parseProgram(reverseTokens)
-
-        ast.validate()
+        # toks is a token list, a TokenBuffer or a TokenCursor, e.g. the
+        # TokenStream of a streaming lexer.  A TokenStream is consumed as
+        # the parse goes.
+        if isinstance(toks, cursor.TokenCursor):
+            tokens = toks
+        else:
+            tokens = cursor.TokenCursor(toks)
+
+        if self.share:
+            self.nodes = symbol.NodeTable()
+        try:
+            ast = self.parseProgram(tokens)
+        except symbol.ParseError as e:
+            tokens.locate(e)
+            raise
+        finally:
+            tokens.close()
+            self.nodes = None
+
+        if self.validate:
+            ast.validate()
 
         return ast
 
+    def parseIter(self, toks):
+        # Like parse(), but a generator of the program's declarations, each
+        # given as soon as it is parsed, so a caller that doesn't keep them
+        # can go through a program of any size in constant memory.  The
+        # parser must not be used for anything else until it is done.
+        if isinstance(toks, cursor.TokenCursor):
+            tokens = toks
+        else:
+            tokens = cursor.TokenCursor(toks)
+
+        if self.share:
+            self.nodes = symbol.NodeTable()
+        try:
+            functions = symbol.FunctionTable()
+            for dec in self.parseDeclarations(tokens, functions):
+                if self.validate:
+                    dec.validate()
+                yield dec
+        except symbol.ParseError as e:
+            tokens.locate(e)
+            raise
+        finally:
+            tokens.close()
+            self.nodes = None
+
     def parseProgram(self, tokens):
 
-        decs = []
-        while len(tokens) > 0:
-            decs.append(self.parseDeclaration(tokens))
+        functions = symbol.FunctionTable()
+        decs = list(self.parseDeclarations(tokens, functions))
 
-        prog = symbol.Program(decs)
+        names = tokens.names
+        if names is None and decs:
+            # A token list keeps no table, but its Identifiers know theirs.
+            first = decs[0]
+            if isinstance(first, symbol.FunctionD):
+                names = first.name.table
+            elif isinstance(first, symbol.VariableD):
+                names = first.id.table
+        prog = symbol.Program(decs, functions, names)
 
         return prog
 
+    def parseDeclarations(self, tokens, functions):
+        # The program's declarations, one at a time.  Functions are added
+        # to the FunctionTable functions, which checks them against those
+        # before.
+        lazy = not self.strict
+        while tokens.tok is not None:
+            dec = self.parseDeclaration(tokens, lazy)
+            if isinstance(dec, symbol.FunctionD):
+                functions.add(dec)
+            yield dec
+
     def parseBlock(self, tokens):
         # return a list of statements.  If the block begins with a brace "{"
         # read statements until "}".  Otherise parse a single statement and
         # return it in a list
 
-        tok = tokens[-1]
-
-        if isinstance(tok, token.OpenBrace):
-            block = self.parseCompoundStatement(tokens)
-        else:
-            block = self.parseStatement(tokens)
+        # A { starts a compound statement in statementParsers.
+        block = self.parseStatement(tokens)
 
         return block
 
     def parseCompoundStatement(self, tokens):
         
-        tok = tokens.pop()
-        if not isinstance(tok, token.OpenBrace):
-            raise symbol.InvalidStatementError(tok)
-
-        if len(tokens) == 0:
-            raise symbol.UnmatchedBraceError()
+        tokens.expect(token.OpenBrace, symbol.InvalidStatementError)
 
         items = []
-        while not isinstance(tokens[-1], token.ClosedBrace):
+        decs = set()
+        closedBrace = token.ClosedBrace.kind
+        while tokens.kind != closedBrace:
+            if tokens.kind is None:
+                raise symbol.UnmatchedBraceError()
             item = self.parseBlockItem(tokens)
+            if isinstance(item, symbol.VariableD):
+                name = item.id.val
+            elif isinstance(item, symbol.FunctionD):
+                if item.defined:
+                    raise symbol.IllegalFunctionDefinition(item)
+                name = item.name.val
+            else:
+                name = None
+            if name is not None:
+                if name in decs:
+                    raise symbol.MultipleDeclarationsInScope(item)
+                decs.add(name)
             items.append(item)
-            if len(tokens)==0:
-                raise symbol.UnmatchedBraceError()
-        tokens.pop()    #Remove }
+        tokens.advance()    #Remove }
 
         stmnt = symbol.CompoundS(items)
 
         return stmnt
 
     def parseBlockItem(self, tokens):
-        tok = tokens[-1]
-        if isinstance(tok, token.Int):
+        if tokens.kind == token.Int.kind:
             item = self.parseDeclaration(tokens)
         else:
             item = self.parseStatement(tokens)
         return item
 
-    def parseDeclaration(self, tokens):
+    def parseDeclaration(self, tokens, lazy=False):
         
-        typetok = tokens[-1]
-        if not isinstance(typetok, token.Int):
-            raise symbol.InvalidDeclarationError(typetok)
-
-        idTok = tokens[-2]
-        if not isinstance(idTok, token.Identifier):
-            raise symbol.InvalidDeclarationError(tok.val)
-
-        tok = tokens[-3]
-        if isinstance(tok, token.OpenParentheses):
-            dec = self.parseFunctionDec(tokens)
-        elif isinstance(tok, token.Assign) or isinstance(tok, token.Semicolon):
+        if tokens.kind != token.Int.kind:
+            raise symbol.InvalidDeclarationError(tokens.tok)
+
+        idTok = tokens.peek(1)
+        if idTok is None or idTok.kind != token.Identifier.kind:
+            raise symbol.InvalidDeclarationError(idTok)
+
+        tok = tokens.peek(2)
+        kind = tok.kind if tok is not None else None
+        if kind == token.OpenParentheses.kind:
+            dec = self.parseFunctionDec(tokens, lazy)
+        elif kind in self.variableDecKinds:
             dec = self.parseVariableDec(tokens)
         else:
             raise symbol.MissingSemicolonError(tok)
@@ -102,119 +253,100 @@ class Parser():
 
     def parseVariableDec(self, tokens):
         
-        typetok = tokens.pop()
-        if not isinstance(typetok, token.Int):
-            raise symbol.InvalidDeclarationError(tok)
-
-        idTok = tokens.pop()
-        if not isinstance(idTok, token.Identifier):
-            raise symbol.InvalidDeclarationError(tok.val)
+        tokens.expect(token.Int, symbol.InvalidDeclarationError)
+        idTok = tokens.expect(token.Identifier, symbol.InvalidDeclarationError)
 
-        tok = tokens[-1]
-        if isinstance(tokens[-1], token.Assign):
-            tokens.pop()
+        if tokens.kind == token.Assign.kind:
+            tokens.advance()
             expr = self.parseExpression(tokens)     
         else:
             expr = None
 
         dec = symbol.VariableD(idTok, expr)
 
-        endTok = tokens.pop()
-        if not isinstance(endTok, token.Semicolon):
-            raise symbol.MissingSemicolonError(tok)
+        tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
         
         return dec
 
-    def parseFunctionDec(self, tokens):
-        tok = tokens.pop()
-        if not isinstance(tok, token.Int):
-            raise symbol.InvalidFunctionError(tok.val)
-
-        ident = tokens.pop()
-        if not isinstance(ident, token.Identifier):
-            raise symbol.InvalidFunctionError(tok.val)
-
-        tok = tokens.pop()
-        if not isinstance(tok, token.OpenParentheses):
-            raise symbol.InvalidFunctionError(tok.val)
-
-        tok = tokens.pop()
-        if not isinstance(tok, token.ClosedParentheses):
-            raise symbol.InvalidFunctionError(tok.val)
-
-        tok = tokens[-1]
-        if isinstance(tok, token.OpenBrace):
+    def parseFunctionDec(self, tokens, lazy=False):
+        tokens.expect(token.Int, symbol.InvalidFunctionError)
+        ident = tokens.expect(token.Identifier, symbol.InvalidFunctionError)
+        tokens.expect(token.OpenParentheses, symbol.InvalidFunctionError)
+        tokens.expect(token.ClosedParentheses, symbol.InvalidFunctionError)
+
+        kind = tokens.kind
+        if kind == token.OpenBrace.kind and lazy:
+            block, closed = tokens.skipBlock()
+            if closed:
+                parseBody = functools.partial(self.parseBody, block,
+                                                block.mark(), self.nodes)
+                return symbol.FunctionD(ident, None, None, parseBody)
+            # Unbalanced braces: parse now for the same error as always.
+            body = self.parseBody(block, block.mark())
+        elif kind == token.OpenBrace.kind:
             body = self.parseCompoundStatement(tokens)
-        elif isinstance(tok, token.Semicolon):
-            tokens.pop()
+        elif kind == token.Semicolon.kind:
+            tokens.advance()
             body = None
         else:
-            raise symbol.InvalidFunctionError(tok)
+            raise symbol.InvalidFunctionError(tokens.tok)
 
         return symbol.FunctionD(ident, None, body)
 
 
+    def parseBody(self, block, start, nodes=None):
+        # Parse a function body skipped by parseFunctionDec, from a cursor
+        # over its tokens starting at start, as parse() would have, sharing
+        # its expressions in the NodeTable nodes if there is one.
+        block.reset(start)
+        outer = self.nodes
+        self.nodes = nodes
+        try:
+            body = self.parseCompoundStatement(block)
+        except symbol.ParseError as e:
+            block.locate(e)
+            raise
+        finally:
+            self.nodes = outer
+        if self.validate:
+            body.validate()
+        return body
+
     def parseStatement(self, tokens):
-        tok = tokens[-1]
-        #Check this is a return statement
-        if isinstance(tok, token.Return):
-            tokens.pop()
-            expr = self.parseExpression(tokens)
-            stmnt = symbol.ReturnS(expr)
-
-            tok = tokens.pop()
-            if not isinstance(tok, token.Semicolon):
-                raise symbol.MissingSemicolonError(tok.val)
-        #Maybe a conditional
-        elif isinstance(tok, token.If):
-            stmnt = self.parseConditionalStmnt(tokens)
-        #Or a compound?
-        elif isinstance(tok, token.OpenBrace):
-            stmnt = self.parseCompoundStatement(tokens)
-        #Try loop stuff!
-        elif isinstance(tok, token.For):
-            stmnt = self.parseForStatement(tokens)
-        elif isinstance(tok, token.While):
-            stmnt = self.parseWhileStatement(tokens)
-        elif isinstance(tok, token.Do):
-            stmnt = self.parseDoStatement(tokens)
-        elif isinstance(tok, token.Break):
-            stmnt = self.parseBreakStatement(tokens)
-        elif isinstance(tok, token.Continue):
-            stmnt = self.parseContinueStatement(tokens)
-        elif isinstance(tok, token.Semicolon):
-            stmnt = self.parseNullStatement(tokens)
+        parse = self.statementParsers.get(tokens.kind)
+        if parse is not None:
+            return parse(tokens)
         #Try just an expression
-        else:
-            expr = self.parseExpression(tokens)
-            stmnt = symbol.ExpressionS(expr)
+        expr = self.parseExpression(tokens)
+        stmnt = symbol.ExpressionS(expr)
 
-            tok = tokens.pop()
-            if not isinstance(tok, token.Semicolon):
-                raise symbol.MissingSemicolonError(tok.val)
+        tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
 
         return stmnt
 
-    def parseConditionalStmnt(self, tokens):
+    def parseReturnStatement(self, tokens):
+        tokens.expect(token.Return, symbol.InvalidStatementError)
+        expr = self.parseExpression(tokens)
+        stmnt = symbol.ReturnS(expr)
+
+        tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
+
+        return stmnt
 
-        tok = tokens.pop()
-        if not isinstance(tok, token.If):
-            raise symbol.InvalidStatementError(tok)
+    def parseConditionalStmnt(self, tokens):
 
-        tok = tokens.pop()
-        if not isinstance(tok, token.OpenParentheses):
-            raise symbol.ExpectedParenthesesError(tok)
+        tokens.expect(token.If, symbol.InvalidStatementError)
+        tokens.expect(token.OpenParentheses, symbol.ExpectedParenthesesError)
         
         cond = self.parseExpression(tokens)
         
-        tok = tokens.pop()
-        if not isinstance(tok, token.ClosedParentheses):
-            raise symbol.UnmatchedParenthesesError(tok)
+        tokens.expect(token.ClosedParentheses,
+                        symbol.UnmatchedParenthesesError)
         
         stmntTrue = self.parseStatement(tokens)
 
-        if len(tokens) > 0 and isinstance(tokens[-1], token.Else):
-            tokens.pop()
+        if tokens.kind == token.Else.kind:
+            tokens.advance()
             stmntFalse = self.parseStatement(tokens)
         else:
             stmntFalse = None
@@ -224,51 +356,27 @@ class Parser():
         return stmnt
 
     def parseNullStatement(self, tokens):
-        tok = tokens.pop()
-        if not isinstance(tok, token.Semicolon):
-            raise symbol.MissingSemicolonError(tok)
+        tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
         return symbol.ExpressionS(None)
 
     def parseBreakStatement(self, tokens):
-        if len(tokens) < 2:
-            raise symbol.InvalidStatementError(tokens[-1])
-        tok1 = tokens.pop()
-        tok2 = tokens.pop()
-        if not isinstance(tok1, token.Break):
-            raise symbol.InvalidStatementError(tok)
-        if not isinstance(tok2, token.Semicolon):
-            raise symbol.MissingSemicolonError(tok)
+        tokens.expect(token.Break, symbol.InvalidStatementError)
+        tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
         return symbol.BreakS()
 
     def parseContinueStatement(self, tokens):
-        if len(tokens) < 2:
-            raise symbol.InvalidStatementError(tokens[-1])
-        tok1 = tokens.pop()
-        tok2 = tokens.pop()
-        if not isinstance(tok1, token.Continue):
-            raise symbol.InvalidStatementError(tok)
-        if not isinstance(tok2, token.Semicolon):
-            raise symbol.MissingSemicolonError(tok)
+        tokens.expect(token.Continue, symbol.InvalidStatementError)
+        tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
         return symbol.ContinueS()
 
     def parseWhileStatement(self, tokens):
-        if len(tokens) < 3:
-            raise symbol.InvalidStatementError(tokens[-1])
-        tok1 = tokens.pop()
-        tok2 = tokens.pop()
-        if not isinstance(tok1, token.While):
-            raise symbol.InvalidStatementError(tok1)
-        if not isinstance(tok2, token.OpenParentheses):
-            raise symbol.ExpectedParenthesesError(tok2)
+        tokens.expect(token.While, symbol.InvalidStatementError)
+        tokens.expect(token.OpenParentheses, symbol.ExpectedParenthesesError)
         
         cond = self.parseExpression(tokens)
 
-        if len(tokens) < 2:
-            raise symbol.InvalidStatementError(tokens[-1])
-
-        tok3 = tokens.pop()
-        if not isinstance(tok3, token.ClosedParentheses):
-            raise symbol.UnmatchedParenthesesError(tok3)
+        tokens.expect(token.ClosedParentheses,
+                        symbol.UnmatchedParenthesesError)
 
         body = self.parseStatement(tokens)
 
@@ -277,81 +385,54 @@ class Parser():
         return stmnt
 
     def parseDoStatement(self, tokens):
-        if len(tokens) < 2:
-            raise symbol.InvalidStatementError(tokens[-1])
-        tok1 = tokens.pop()
-        if not isinstance(tok1, token.Do):
-            raise symbol.InvalidStatementError(tok1)
+        tokens.expect(token.Do, symbol.InvalidStatementError)
         
         body = self.parseStatement(tokens)
 
-        if len(tokens) < 3:
-            raise symbol.InvalidStatementError(tokens[-1])
-        
-        tok2 = tokens.pop()
-        tok3 = tokens.pop()
-        if not isinstance(tok2, token.While):
-            raise symbol.InvalidStatementError(tok2)
-        if not isinstance(tok3, token.OpenParentheses):
-            raise symbol.ExpectedParenthesesError(tok3)
+        tokens.expect(token.While, symbol.InvalidStatementError)
+        tokens.expect(token.OpenParentheses, symbol.ExpectedParenthesesError)
 
         cond = self.parseExpression(tokens)
 
-        if len(tokens) < 2:
-            raise symbol.InvalidStatementError(tokens[-1])
-        
-        tok4 = tokens.pop()
-        tok5 = tokens.pop()
-        if not isinstance(tok4, token.ClosedParentheses):
-            raise symbol.UnmatchedParenthesesError(tok4)
-        if not isinstance(tok5, token.Semicolon):
-            raise symbol.MissingSemicolonError(tok5)
+        tokens.expect(token.ClosedParentheses,
+                        symbol.UnmatchedParenthesesError)
+        tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
 
         stmnt = symbol.DoS(cond, body)
 
         return stmnt
     
     def parseForStatement(self, tokens):
-        tok = tokens.pop()
-        if not isinstance(tok, token.For):
-            raise symbol.InvalidStatementError(tok)
-
-        tok = tokens.pop()
-        if not isinstance(tok, token.OpenParentheses):
-            raise symbol.ExpectedParenthesesError(tok)
+        tokens.expect(token.For, symbol.InvalidStatementError)
+        tokens.expect(token.OpenParentheses, symbol.ExpectedParenthesesError)
 
-        tok = tokens[-1]
+        semicolon = token.Semicolon.kind
 
-        if isinstance(tok, token.Int):
+        if tokens.kind == token.Int.kind:
             init = self.parseDeclaration(tokens)
-        elif isinstance(tok, token.Semicolon):
-            tokens.pop()
+            if not isinstance(init, symbol.VariableD):
+                raise symbol.InvalidForInit(init)
+        elif tokens.kind == semicolon:
+            tokens.advance()
             init = None
         else:
             init = self.parseExpression(tokens)
-            tok = tokens.pop()
-            if not isinstance(tok, token.Semicolon):
-                raise symbol.MissingSemicolonError(tok)
+            tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
 
-        tok = tokens[-1]
-        if isinstance(tok, token.Semicolon):
-            tokens.pop()
+        if tokens.kind == semicolon:
+            tokens.advance()
             cond = symbol.ConstantE(token.IntC("1"))
         else:
             cond = self.parseExpression(tokens)
-            tok = tokens.pop()
-            if not isinstance(tok, token.Semicolon):
-                raise symbol.MissingSemicolonError(tok)
+            tokens.expect(token.Semicolon, symbol.MissingSemicolonError)
         
-        tok = tokens[-1]
-        if isinstance(tok, token.ClosedParentheses):
-            tokens.pop()
+        if tokens.kind == token.ClosedParentheses.kind:
+            tokens.advance()
             post = None
         else:
             post = self.parseExpression(tokens)
-            tok = tokens.pop()
-            if not isinstance(tok, token.ClosedParentheses):
-                raise symbol.UnmatchedParenthesesError(tok)
+            tokens.expect(token.ClosedParentheses,
+                            symbol.UnmatchedParenthesesError)
 
         body = self.parseStatement(tokens)
 
@@ -360,101 +441,139 @@ class Parser():
         return stmnt
 
     def parseExpression(self, tokens):
-        expr = self.parseAssignExpr(tokens)
+        expr = self.parseExpressionStack(tokens)
+        if self.nodes is not None:
+            expr = self.nodes.share(expr)
         return expr
 
-    def parseAssignExpr(self, tokens):
-
+    def parseExpressionStack(self, tokens):
+        # Expressions are parsed with an explicit stack rather than by
+        # recursion, so nesting is only limited by memory.  Each frame is
+        # a (type, a, b) tuple for an expression waiting on a part:
+        #   _ASSIGN (id, op):       the right hand side of an assignment
+        #   _UNARY (op, None):      the operand, a factor
+        #   _PARENS (open, None):   the expression inside
+        #   _BINOP (operands, ops): the next operand, a factor
+        #   _TRUE (cond, None):     the true branch of a ?:
+        #   _FALSE (cond, true):    the false branch of a ?:
+        # When a part is finished (state _RESULT), the frame on top takes
+        # it.  assign says whether the next expression may be an
+        # assignment; only the false branch of a ?: may not.
+        power = self.binOpPower
+        factorActions = self.factorActions
+        ternaryKinds = self.ternaryKinds
+        assignKinds = self.assignKinds
+        identifier = token.Identifier.kind
+        stack = []
+        state = _EXPR
+        assign = True
         expr = None
 
-        #Check if assignmentExpr
-        if len(tokens) >= 3 and isinstance(tokens[-1],token.Identifier)\
-                and isinstance(tokens[-2], token.AssignmentOp):
-            tokId = tokens.pop()
-            tokOp = tokens.pop()
-            expr = self.parseExpression(tokens)
-            expr = symbol.AssignE(tokId, tokOp, expr)
-        
-        #If not, try the rest
-        if expr is None:
-            expr = self.parseConditionalExpr(tokens)
-        return expr
-
-    def parseConditionalExpr(self, tokens):
-
-        expr = self.parseBinOp(tokens, self.binOpOrder)
-
-        if len(tokens)>0 and isinstance(tokens[-1], token.TernaryA):
-            tokens.pop()
-            exprTrue = self.parseExpression(tokens)
-
-            tok = tokens.pop()
-            if not isinstance(tok, token.TernaryB):
-                raise symbol.IncompleteConditionalExpressionError(tok)
-
-            exprFalse = self.parseConditionalExpr(tokens)
-
-            expr = symbol.ConditionalE(expr, exprTrue, exprFalse)
-
-        return expr
-
-    def parseBinOp(self, tokens, opOrder):
-        parseFunc = self.parseBinOp
-        if len(opOrder) == 1:
-            parseFunc = self.parseFactor
-        ops = opOrder[0]
-        table = opOrder[1:]
-
-        expr = parseFunc(tokens, table)
-        if len(tokens) > 0:
-            tok = tokens.pop()
-            while any([isinstance(tok,opCls) for opCls in ops]):
-                el = parseFunc(tokens, table)
-                expr = symbol.BinaryOpE(tok, expr, el)
-                if len(tokens) > 0:
-                    tok = tokens.pop()
+        while True:
+            if state == _EXPR:
+                #Check if assignmentExpr: an Identifier then an AssignmentOp.
+                #Peeking two tokens ahead decides it without backtracking.
+                if assign and tokens.kind == identifier:
+                    tokOp = tokens.peek(1)
+                    if tokOp is not None and tokOp.kind in assignKinds:
+                        tokId = tokens.advance()
+                        tokens.advance()
+                        stack.append((_ASSIGN, tokId, tokOp))
+                        continue
+                stack.append((_BINOP, [], []))
+                state = _FACTOR
+
+            elif state == _FACTOR:
+                tok = tokens.advance()
+                action = factorActions[tok.kind]
+                if action == _CONSTANT:
+                    expr = symbol.ConstantE(tok)
+                    state = _RESULT
+                elif action == _VARIABLE:
+                    expr = symbol.VarRefE(tok)
+                    if tokens.kind in self.incrementKinds:
+                        expr = symbol.IncrementPostE(tokens.advance(), expr)
+                    state = _RESULT
+                elif action == _PARENS:
+                    stack.append((_PARENS, tok, None))
+                    assign = True
+                    state = _EXPR
+                elif action == _UNARY:
+                    stack.append((_UNARY, tok, None))
+                elif action == _INCREMENT:
+                    var = self.parseVariable(tokens)
+                    expr = symbol.IncrementPreE(tok, var)
+                    state = _RESULT
                 else:
-                    tok = None
-                    break
-            if tok is not None:
-                tokens.append(tok)
-        return expr
+                    raise symbol.InvalidExpressionError(tok.val)
 
-    def parseFactor(self, tokens, empty=None):
-        tok = tokens.pop()
-        if isinstance(tok, token.OpenParentheses):
-            fac = self.parseExpression(tokens)
-            tok = tokens.pop()
-            if not isinstance(tok, token.ClosedParentheses):
-                raise symbol.UnmatchedParthenthesesError(tok.val)
-            return fac
-        elif isinstance(tok, token.UnaryOp):
-            if isinstance(tok, token.IncrementOp):
-                var = self.parseVariable(tokens)
-                return symbol.IncrementPreE(tok, var)
             else:
-                fac = self.parseFactor(tokens)
-                return symbol.UnaryOpE(tok, fac)
-        elif isinstance(tok, token.Constant):
-            return symbol.ConstantE(tok)
-        elif isinstance(tok, token.Identifier):
-            tokens.append(tok)
-            var = self.parseVariable(tokens)
-            if len(tokens) > 0:
-                tok = tokens.pop()
-                if isinstance(tok, token.IncrementOp):
-                    return symbol.IncrementPostE(tok, var)
+                if not stack:
+                    return expr
+                frame, a, b = stack[-1]
+
+                if frame == _BINOP:
+                    # Precedence climbing: before pushing an operator, the
+                    # operators on the stack that bind at least as tightly
+                    # (more tightly, if it is right associative) are
+                    # reduced into BinaryOpE nodes.  A Neg here follows a
+                    # factor, so it is a binary minus.
+                    operands = a
+                    ops = b
+                    operands.append(expr)
+                    entry = power.get(tokens.kind)
+                    if entry is not None:
+                        bp, assoc = entry
+                        if assoc == RIGHT:
+                            bp += 1
+                        while ops and ops[-1][1] >= bp:
+                            op = ops.pop()[0]
+                            rhs = operands.pop()
+                            operands[-1] = symbol.BinaryOpE(op,
+                                                    operands[-1], rhs)
+                        ops.append((tokens.advance(), entry[0]))
+                        state = _FACTOR
+                        continue
+                    stack.pop()
+                    while ops:
+                        op = ops.pop()[0]
+                        rhs = operands.pop()
+                        operands[-1] = symbol.BinaryOpE(op, operands[-1], rhs)
+                    expr = operands[0]
+                    if tokens.kind in ternaryKinds:
+                        tokens.advance()
+                        stack.append((_TRUE, expr, None))
+                        assign = True
+                        state = _EXPR
+
+                elif frame == _TRUE:
+                    tokens.expect(token.TernaryB,
+                                symbol.IncompleteConditionalExpressionError)
+                    stack[-1] = (_FALSE, a, expr)
+                    assign = False
+                    state = _EXPR
+
+                elif frame == _FALSE:
+                    stack.pop()
+                    expr = symbol.ConditionalE(a, b, expr)
+
+                elif frame == _PARENS:
+                    stack.pop()
+                    tokens.expect(token.ClosedParentheses,
+                                    symbol.UnmatchedParenthesesError)
+
+                elif frame == _UNARY:
+                    stack.pop()
+                    expr = symbol.UnaryOpE(a, expr)
+
                 else:
-                    tokens.append(tok)
-            return var
-        raise symbol.InvalidExpressionError(tok.val)
+                    stack.pop()
+                    expr = symbol.AssignE(a, b, expr)
 
     def parseVariable(self, tokens):
-        tok = tokens.pop()
-        if isinstance(tok, token.Identifier):
+        tok = tokens.advance()
+        if tok.kind == token.Identifier.kind:
             expr = symbol.VarRefE(tok)
         else:
             raise symbol.InvalidVariableRefError(tok.val)
         return expr
-
-
@@ -0,0 +1,35 @@
+import re
+import bisect
+from array import array
+
+_newline = re.compile(b'\n')
+
+class LineIndex():
+    # Maps character offsets in a source to (line, column), both counted
+    # from 1.  The offsets of the line starts are found with str.find the
+    # first time a position is asked for, so making an index is free.
+    # Bytes-like sources (where offsets and columns count bytes) are
+    # scanned with a regex, as memoryview has no find.
+
+    def __init__(self, source):
+        self.source = source
+        self.lineStarts = None
+
+    def build(self):
+        starts = array('I', [0])
+        if isinstance(self.source, str):
+            find = self.source.find
+            i = find('\n')
+            while i >= 0:
+                starts.append(i+1)
+                i = find('\n', i+1)
+        else:
+            starts.extend([m.end() for m in _newline.finditer(self.source)])
+        self.lineStarts = starts
+
+    def lineCol(self, offset):
+        if self.lineStarts is None:
+            self.build()
+        line = bisect.bisect_right(self.lineStarts, offset)
+        col = offset - self.lineStarts[line-1] + 1
+        return line, col
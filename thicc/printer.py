@@ -0,0 +1,166 @@
+import json
+from . import arena
+from . import symbol
+
+# Trees are printed one node per line, walking them with an explicit stack
+# and handing each line to the output as soon as it is made, so printing
+# takes time linear in the tree and memory independent of the output.
+#
+# As text, each node is its heading, indented three spaces per level,
+# followed by its children one level deeper.  A missing child that is
+# printed is written NULL.  In JSON-lines mode each node is a compact JSON
+# object, in preorder: its depth, the field of its parent it is in (none
+# for the top node), its class name and its tokens' values by field, e.g.
+#   {"depth":3,"field":"expr1","node":"VarRefE","id":"a"}
+# Missing children are left out.
+
+indent = "   "
+
+# The heading of each kind of node and the children printed under it
+def describeProgram(node):
+    return "Program", node.declarations
+
+def describeBinaryOp(node):
+    return "Expression(BinaryOp): " + node.op.val, [node.expr1, node.expr2]
+
+def describeConstant(node):
+    return "Expression(Constant): " + node.value.val, []
+
+def describeVarRef(node):
+    return "Expression(Variable): " + node.id.val, []
+
+def describeAssign(node):
+    return "Expression(Assign): {0:s} {1:s}".format(node.id.val,
+                                                    node.op.val), [node.expr]
+
+def describeUnaryOp(node):
+    return "Expression(UnaryOp): " + node.op.val, [node.expr]
+
+def describeIncrementPre(node):
+    return "Expression(IncrementPre): " + node.op.val, [node.var]
+
+def describeIncrementPost(node):
+    return "Expression(IncrementPost): " + node.op.val, [node.var]
+
+def describeConditionalE(node):
+    return "Expression(Conditional):", [node.cond, node.true, node.false]
+
+def describeReturn(node):
+    return "Statement(Return):", [node.value]
+
+def describeExpressionS(node):
+    return "Statement(Expression):", [node.expr]
+
+def describeConditionalS(node):
+    children = [node.cond, node.ifS]
+    if node.elseS is not None:
+        children.append(node.elseS)
+    return "Statement(Conditional):", children
+
+def describeCompound(node):
+    return "Statement(Compound):", node.items
+
+def describeFor(node):
+    return "Statement(For):", [node.init, node.cond, node.post, node.body]
+
+def describeWhile(node):
+    return "Statement(While):", [node.cond, node.body]
+
+def describeDo(node):
+    return "Statement(Do):", [node.body, node.cond]
+
+def describeBreak(node):
+    return "Statement(Break)", []
+
+def describeContinue(node):
+    return "Statement(Continue)", []
+
+def describeVariable(node):
+    children = [] if node.expr is None else [node.expr]
+    return "Declaration(Variable): " + node.id.val, children
+
+def describeFunction(node):
+    # The body's items go straight under the function.
+    heading = "Function: {0:s}({1:s})".format(node.name.val,
+                                    ", ".join([tok.val for tok in node.pars]))
+    return heading, [] if node.body is None else node.body.items
+
+describers = {
+    symbol.Program: describeProgram,
+    symbol.BinaryOpE: describeBinaryOp,
+    symbol.ConstantE: describeConstant,
+    symbol.VarRefE: describeVarRef,
+    symbol.AssignE: describeAssign,
+    symbol.UnaryOpE: describeUnaryOp,
+    symbol.IncrementPreE: describeIncrementPre,
+    symbol.IncrementPostE: describeIncrementPost,
+    symbol.ConditionalE: describeConditionalE,
+    symbol.ReturnS: describeReturn,
+    symbol.ExpressionS: describeExpressionS,
+    symbol.ConditionalS: describeConditionalS,
+    symbol.CompoundS: describeCompound,
+    symbol.ForS: describeFor,
+    symbol.WhileS: describeWhile,
+    symbol.DoS: describeDo,
+    symbol.BreakS: describeBreak,
+    symbol.ContinueS: describeContinue,
+    symbol.VariableD: describeVariable,
+    symbol.FunctionD: describeFunction}
+
+
+def textLines(tree, level=0):
+    # The lines of tree as text, each ending in a newline.
+    stack = [(tree, level)]
+    while stack:
+        node, level = stack.pop()
+        if node is None:
+            yield level * indent + "NULL\n"
+            continue
+        heading, children = describers[node.__class__](node)
+        yield level * indent + heading + "\n"
+        stack.extend([(child, level+1) for child in reversed(children)])
+
+def jsonLines(tree, level=0, field=None):
+    # The lines of tree in JSON-lines mode, each ending in a newline.  field
+    # is the field of its parent that tree is in, if any.
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    stack = [(tree, level, field)]
+    while stack:
+        node, level, parentField = stack.pop()
+        entry = {"depth": level}
+        if parentField is not None:
+            entry["field"] = parentField
+        entry["node"] = node.__class__.__name__
+        children = []
+        for field, what in arena.layouts[node.__class__]:
+            value = getattr(node, field)
+            if what == arena.NODE:
+                if value is not None:
+                    children.append((value, level+1, field))
+            elif what == arena.NODES:
+                children.extend([(child, level+1, field) for child in value])
+            elif what == arena.TOKENS:
+                entry[field] = [tok.val for tok in value]
+            else:
+                entry[field] = value.val
+        yield encode(entry) + "\n"
+        stack.extend(reversed(children))
+
+def write(tree, f, jsonl=False, level=0):
+    # Print tree to the text stream f, as text or JSON lines.
+    if jsonl:
+        f.writelines(jsonLines(tree, level))
+    else:
+        f.writelines(textLines(tree, level))
+
+def writeProgram(declarations, f, jsonl=False):
+    # Print a Program given as its declarations, e.g. from
+    # parser.Parser.parseIter(), each as soon as it comes.
+    if jsonl:
+        f.write('{"depth":0,"node":"Program"}\n')
+        for dec in declarations:
+            f.writelines(jsonLines(dec, 1, "declarations"))
+    else:
+        f.write("Program\n")
+        for dec in declarations:
+            f.writelines(textLines(dec, 1))
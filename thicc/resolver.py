@@ -0,0 +1,317 @@
+from . import token
+from . import symbol
+from . import arena
+from . import context
+
+# Kind codes of the nodes that refer to variables in an arena.Arena
+_varRefKind = arena.nodeKinds[symbol.VarRefE]
+_assignKind = arena.nodeKinds[symbol.AssignE]
+
+class Frame():
+    # The variables of one function as laid out on the stack, worked out
+    # by a Resolver before any of its code is made.  The tables are keyed
+    # by id() of nodes, which the tree keeps alive:
+    #   slots   the offset from %rbp of each VariableD, and of the
+    #           variable each VarRefE and AssignE refers to
+    #   sizes   the bytes of variables each CompoundS, and each ForS, pushes
+    #           and must pop at its end
+    #   loops   the loop each BreakS and ContinueS is in, or None
+    #   copies  the Resolver's own copies of statements' expressions, by
+    #           (id(statement), field), where the tree's can't be used
+    # labels is left to the code generator, which keeps each loop's
+    # continue and break labels there, by key() of the loop.
+
+    def __init__(self):
+        self.slots = {}
+        self.sizes = {}
+        self.loops = {}
+        self.copies = {}
+        self.labels = {}
+
+    def offset(self, node):
+        return self.slots[id(node)]
+
+    def size(self, block):
+        return self.sizes.get(id(block), 0)
+
+    def loop(self, jump):
+        return self.loops[id(jump)]
+
+    def key(self, node):
+        return id(node)
+
+    def expression(self, parent, field):
+        # The expression to make code for in parent's field field.
+        if self.copies:
+            expr = self.copies.get((id(parent), field))
+            if expr is not None:
+                return expr
+        return getattr(parent, field)
+
+
+class ArenaFrame(Frame):
+    # The Frame of a function kept in an arena.Arena, whose tables are
+    # keyed by node handle instead.  Nothing is shared in an Arena, so
+    # there are no copies.
+
+    def offset(self, node):
+        return self.slots[node]
+
+    def size(self, block):
+        return self.sizes.get(block, 0)
+
+    def loop(self, jump):
+        return self.loops[jump]
+
+    def key(self, node):
+        return node
+
+
+class Resolver():
+    # Binds the variables of a function to stack slots in one pass, so that
+    # code generation needs no scopes.  Variables are pushed in the order
+    # they are declared, from -word(%rbp) down, and popped at the end of
+    # their block, so a variable's slot is fixed by how many variables are
+    # in scope where it is declared.
+    #
+    # The names in scope are kept in one dict from the name's id in names,
+    # a token.NameTable (the Program's, for the generator), to offset.  Each
+    # block saves the bindings its declarations hide and puts them back when
+    # it ends, so looking a name up costs the same at any depth.  A variable
+    # is in scope from the end of its declaration: in int a = a; the second
+    # a is an enclosing block's.  The tree is walked from an explicit stack
+    # of (method, arg, ...) tuples, like the generator's plans.
+    #
+    # In a tree with shared subexpressions (see symbol.NodeTable) the same
+    # VarRefE may stand for different variables in different places.  Where
+    # it does, the statement's expression is copied and the copy, kept in
+    # the Frame, used in its place, so each reference has one slot.  The
+    # tree itself is never changed, so shared trees (e.g. from a
+    # cache.ParseCache) can be resolved.
+    #
+    # resolveArena() does the same for a function in an arena.Arena, from
+    # its arrays.  An expression there is the run of handles ending at its
+    # root, so its references are found with a loop over that run.  Its
+    # names are keyed on their index in the arena's values table, which
+    # holds each name once.
+
+    def __init__(self, word=8, names=None):
+        self.word = word
+        if names is None:
+            names = token.NameTable()
+        self.names = names
+
+    def resolve(self, tree):
+        # The Frame of tree, a FunctionD or a statement, which is taken to
+        # be the outermost scope of a function.
+        return self.walk(Frame(), (self.visit, tree, None))
+
+    def resolveArena(self, store, handle):
+        # The ArenaFrame of the FunctionD or statement at handle in the
+        # arena.Arena store.
+        self.store = store
+        return self.walk(ArenaFrame(), (self.visitHandle, handle, None))
+
+    def walk(self, frame, item):
+        self.frame = frame
+        self.bindings = {}
+        self.stackIndex = -self.word
+        self.scopes = [(None, self.stackIndex, {})]
+        stack = [item]
+        while stack:
+            item = stack.pop()
+            more = item[0](*item[1:])
+            if more:
+                stack.extend(reversed(more))
+        return self.frame
+
+    def visit(self, node, loop):
+        # Resolve node, in the loop loop, up to its statements, and return
+        # the work left for them.  A statement's expressions can be done
+        # straight away, before or after its statements alike, since those
+        # keep their declarations to themselves.  Nodes that aren't block
+        # items are left for the generator to complain about.
+        expression = self.expression
+        if isinstance(node, symbol.CompoundS):
+            self.enter(id(node))
+            work = [(self.visit, item, loop) for item in node]
+            work.append((self.exit,))
+        elif isinstance(node, symbol.ExpressionS):
+            expression(node, 'expr')
+            work = None
+        elif isinstance(node, symbol.VariableD):
+            expression(node, 'expr')
+            self.declare(node.id, id(node))
+            work = None
+        elif isinstance(node, symbol.ReturnS):
+            expression(node, 'value')
+            work = None
+        elif isinstance(node, symbol.ConditionalS):
+            expression(node, 'cond')
+            work = [(self.visit, node.ifS, loop)]
+            if node.elseS is not None:
+                work.append((self.visit, node.elseS, loop))
+        elif isinstance(node, (symbol.WhileS, symbol.DoS)):
+            expression(node, 'cond')
+            work = [(self.visit, node.body, node)]
+        elif isinstance(node, symbol.ForS):
+            self.enter(id(node))
+            if isinstance(node.init, symbol.Declaration):
+                self.visit(node.init, loop)
+            else:
+                expression(node, 'init')
+            expression(node, 'cond')
+            expression(node, 'post')
+            work = [(self.visit, node.body, node), (self.exit,)]
+        elif isinstance(node, symbol.JumpS):
+            self.frame.loops[id(node)] = loop
+            work = None
+        elif isinstance(node, symbol.FunctionD) and node.body is not None:
+            work = [(self.visit, node.body, None)]
+        else:
+            work = None
+        return work
+
+    def visitHandle(self, handle, loop):
+        # visit() for the node at handle in the Arena.
+        store = self.store
+        cls = arena.nodeClasses[store.kinds[handle]]
+        kids = store.childHandles(handle)
+        bind = self.bindHandle
+        if cls is symbol.CompoundS:
+            self.enter(handle)
+            work = [(self.visitHandle, item, loop) for item in kids]
+            work.append((self.exit,))
+        elif cls is symbol.ExpressionS or cls is symbol.ReturnS:
+            bind(kids[0])
+            work = None
+        elif cls is symbol.VariableD:
+            bind(kids[0])
+            payload = store.payloads[handle]
+            self.declare(store.values[payload], handle, payload)
+            work = None
+        elif cls is symbol.ConditionalS:
+            bind(kids[0])
+            work = [(self.visitHandle, kids[1], loop)]
+            if kids[2] >= 0:
+                work.append((self.visitHandle, kids[2], loop))
+        elif cls is symbol.WhileS or cls is symbol.DoS:
+            bind(kids[0])
+            work = [(self.visitHandle, kids[1], handle)]
+        elif cls is symbol.ForS:
+            self.enter(handle)
+            init, cond, post, body = kids
+            if init >= 0 and issubclass(
+                    arena.nodeClasses[store.kinds[init]], symbol.Declaration):
+                self.visitHandle(init, loop)
+            else:
+                bind(init)
+            bind(cond)
+            bind(post)
+            work = [(self.visitHandle, body, handle), (self.exit,)]
+        elif cls is symbol.BreakS or cls is symbol.ContinueS:
+            self.frame.loops[handle] = loop
+            work = None
+        elif cls is symbol.FunctionD and kids[0] >= 0:
+            work = [(self.visitHandle, kids[0], None)]
+        else:
+            work = None
+        return work
+
+    def enter(self, block):
+        # Each scope is the key of its block, the stack index at its start
+        # and the bindings hidden by its declarations, by id.
+        self.scopes.append((block, self.stackIndex, {}))
+
+    def exit(self):
+        block, start, hidden = self.scopes.pop()
+        bindings = self.bindings
+        for ident, offset in hidden.items():
+            if offset is None:
+                del bindings[ident]
+            else:
+                bindings[ident] = offset
+        self.frame.sizes[block] = start - self.stackIndex
+        self.stackIndex = start
+
+    def declare(self, tok, key, ident=None):
+        # Declare the variable named by tok, keyed key in the Frame.  ident
+        # is the name's id, by default its id in names.
+        if not isinstance(tok, token.Identifier):
+            raise context.InvalidIdentifierError(tok.val)
+        if ident is None:
+            ident = self.names.ident(tok)
+        hidden = self.scopes[-1][2]
+        if ident in hidden:
+            raise context.DuplicateIdentifierError(tok.val)
+        hidden[ident] = self.bindings.get(ident)
+        self.bindings[ident] = self.stackIndex
+        self.frame.slots[key] = self.stackIndex
+        self.stackIndex -= self.word
+
+    def expression(self, parent, field):
+        # Resolve the expression in parent's field field, copying it if it
+        # shares a reference already bound to another variable.
+        expr = getattr(parent, field)
+        if expr is None or expr.__class__ is symbol.ConstantE:
+            return
+        if not self.bind(expr):
+            expr = symbol.copyTree(expr)
+            self.frame.copies[(id(parent), field)] = expr
+            self.bind(expr)
+
+    def bind(self, expr):
+        # Give the VarRefEs and AssignEs in expr the slots of their
+        # variables.  False if one of them already has another, in which
+        # case the rest may not have been done.  The common classes are
+        # picked out by hand, which is much quicker than nodeChildren().
+        bindings = self.bindings
+        slots = self.frame.slots
+        names = self.names
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            cls = node.__class__
+            if cls is symbol.VarRefE or cls is symbol.AssignE:
+                tok = node.id
+                if tok.table is names:
+                    offset = bindings.get(tok.ident)
+                else:
+                    offset = bindings.get(names.ident(tok))
+                if offset is None:
+                    raise context.UnknownIdentifierError(tok.val)
+                if slots.setdefault(id(node), offset) != offset:
+                    return False
+                if cls is symbol.AssignE:
+                    stack.append(node.expr)
+            elif cls is symbol.BinaryOpE:
+                stack.append(node.expr1)
+                stack.append(node.expr2)
+            elif cls is symbol.UnaryOpE:
+                stack.append(node.expr)
+            elif cls is symbol.IncrementPreE or cls is symbol.IncrementPostE:
+                stack.append(node.var)
+            elif cls is not symbol.ConstantE:
+                stack.extend(symbol.nodeChildren(node))
+        return True
+
+    def bindHandle(self, handle):
+        # bind() for the expression at handle in the Arena, if there is
+        # one.  Nothing is shared there, so each reference is bound once.
+        if handle < 0:
+            return
+        store = self.store
+        kinds = store.kinds
+        payloads = store.payloads
+        values = store.values
+        bindings = self.bindings
+        slots = self.frame.slots
+        for h in range(store.first(handle), handle+1):
+            kind = kinds[h]
+            if kind == _varRefKind or kind == _assignKind:
+                offset = bindings.get(payloads[h])
+                if offset is None:
+                    raise context.UnknownIdentifierError(
+                                                values[payloads[h]].val)
+                slots[h] = offset
+
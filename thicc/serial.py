@@ -0,0 +1,321 @@
+from . import token
+from . import symbol
+from . import exception
+from . import arena
+
+# A compact binary format for token sequences and symbol trees.
+#
+# Data starts with the magic string, the format version and what follows,
+# STREAM (tokens) or TREE.  All numbers are varints (7 bits per byte, low
+# bits first, the high bit set on all but the last byte).  A token is its
+# kind code, followed for Identifier, Constant and string tokens by a
+# string.
+# A string is an index into a table built as the data is read: the first
+# time a string appears its index is the size of the table, and its length
+# and UTF-8 bytes follow.  The encoder finds the index of an identifier's
+# name from its id in a token.NameTable (a Program's own, when it writes
+# one), so names aren't hashed again.
+#
+# Tokens are written one after another, each as its kind plus 1, ending
+# with a 0.  A tree is written in preorder: each node is its kind code in
+# arena.nodeClasses plus 1 (0 for a missing child), its tokens and the
+# lengths of its sequences in arena.layouts order, then its children.
+#
+# The format depends on the order of token.kinds and arena.layouts:
+# change FORMAT whenever either changes.
+
+magic = b"THCS"
+FORMAT = 1
+
+STREAM = 0
+TREE = 1
+
+# Write out the buffer once it gets this big, when writing to a file
+CHUNK = 1 << 16
+
+# Whether each token kind carries a value
+valued = tuple([not issubclass(cls, token.StatelessToken)
+                for cls in token.kinds])
+
+
+class SerialError(exception.ThiccError):
+    def __init__(self, expr, message="Invalid serialized data"):
+        self.expression = expr
+        self.message = message
+
+
+class Encoder():
+
+    def __init__(self, write=None, names=None):
+        # write, if given, is called with each full chunk of output.
+        self.out = bytearray()
+        self.strings = {}
+        self.idents = {}
+        if names is None:
+            names = token.NameTable()
+        self.names = names
+        self.write = write
+
+    def varint(self, n):
+        out = self.out
+        while n >= 0x80:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def string(self, s):
+        i = self.strings.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.strings[s] = i
+            data = s.encode()
+            self.varint(i)
+            self.varint(len(data))
+            self.out += data
+        else:
+            self.varint(i)
+
+    def identifier(self, tok):
+        # string() for the name of the Identifier tok, keyed on its id.
+        ident = self.names.ident(tok)
+        i = self.idents.get(ident)
+        if i is None:
+            self.string(tok.val)
+            self.idents[ident] = self.strings[tok.val]
+        else:
+            self.varint(i)
+
+    def value(self, tok):
+        if tok.__class__ is token.Identifier:
+            self.identifier(tok)
+        elif valued[tok.kind]:
+            self.string(tok.val)
+
+    def token(self, tok):
+        self.varint(tok.kind)
+        self.value(tok)
+
+    def flush(self):
+        if self.write is not None and len(self.out) >= CHUNK:
+            self.write(self.out)
+            self.out.clear()
+
+    def header(self, what):
+        self.out += magic
+        self.varint(FORMAT)
+        self.varint(what)
+
+    def tokens(self, toks):
+        self.header(STREAM)
+        for tok in toks:
+            self.varint(tok.kind + 1)
+            self.value(tok)
+            self.flush()
+        self.varint(0)
+
+    def tree(self, root):
+        # Preorder from an explicit stack.  Skipped function bodies are
+        # parsed.
+        if root.__class__ is symbol.Program:
+            self.names = root.names
+        self.header(TREE)
+        varint = self.varint
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                varint(0)
+                continue
+            cls = node.__class__
+            varint(arena.nodeKinds[cls] + 1)
+            kids = []
+            for field, what in arena.layouts[cls]:
+                value = getattr(node, field)
+                if what == arena.NODE:
+                    kids.append(value)
+                elif what == arena.NODES:
+                    varint(len(value))
+                    kids.extend(value)
+                elif what == arena.TOKENS:
+                    varint(len(value))
+                    for tok in value:
+                        self.token(tok)
+                else:
+                    self.token(value)
+            stack.extend(reversed(kids))
+            self.flush()
+
+
+class Decoder():
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.strings = []
+        self.tokenTable = {}
+        self.names = token.NameTable()
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        n = 0
+        shift = 0
+        try:
+            while True:
+                b = data[pos]
+                pos += 1
+                n |= (b & 0x7f) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+        except IndexError:
+            raise SerialError(None, "Truncated data")
+        self.pos = pos
+        return n
+
+    def string(self):
+        i = self.varint()
+        if i == len(self.strings):
+            n = self.varint()
+            end = self.pos + n
+            if end > len(self.data):
+                raise SerialError(None, "Truncated data")
+            try:
+                s = str(self.data[self.pos:end], "utf-8")
+            except UnicodeDecodeError:
+                raise SerialError(None, "Invalid string")
+            self.pos = end
+            self.strings.append(s)
+        elif i > len(self.strings):
+            raise SerialError(i, "Invalid string index")
+        return self.strings[i]
+
+    def token(self, kind=None):
+        # Equal tokens are made once, like in a TokenBuffer.
+        if kind is None:
+            kind = self.varint()
+        if kind >= len(token.kinds):
+            raise SerialError(kind, "Invalid token kind")
+        if not valued[kind]:
+            return token.kinds[kind]()
+        s = self.string()
+        if kind == token.Identifier.kind:
+            return self.names.identifier(s)
+        tok = self.tokenTable.get((kind, s))
+        if tok is None:
+            tok = token.kinds[kind](s)
+            self.tokenTable[(kind, s)] = tok
+        return tok
+
+    def header(self):
+        n = len(magic)
+        if self.data[:n] != magic:
+            raise SerialError(None, "Not thicc serialized data")
+        self.pos = n
+        version = self.varint()
+        if version != FORMAT:
+            raise SerialError(version, "Unsupported format version")
+        return self.varint()
+
+    def tokens(self):
+        toks = []
+        while True:
+            kind = self.varint()
+            if kind == 0:
+                return toks
+            toks.append(self.token(kind-1))
+
+    def tree(self):
+        # Nodes waiting for children are kept on a stack as (node, kids,
+        # count); a node is finished when its last child is, and then goes
+        # to the node below it.
+        varint = self.varint
+        stack = []
+        while True:
+            code = varint()
+            if code == 0:
+                node = None
+                if not stack:
+                    raise SerialError(None, "Empty tree")
+            else:
+                if code > len(arena.nodeClasses):
+                    raise SerialError(code-1, "Invalid node kind")
+                cls = arena.nodeClasses[code-1]
+                node = cls.__new__(cls)
+                count = 0
+                for field, what in arena.layouts[cls]:
+                    if what == arena.NODE:
+                        count += 1
+                    elif what == arena.NODES:
+                        count = varint()
+                    elif what == arena.TOKENS:
+                        setattr(node, field, tuple([self.token()
+                                            for i in range(varint())]))
+                    else:
+                        setattr(node, field, self.token())
+                if count:
+                    stack.append((node, [], count))
+                    continue
+                finish(node, [])
+            while True:
+                if not stack:
+                    return node
+                parent, kids, count = stack[-1]
+                kids.append(node)
+                if len(kids) < count:
+                    break
+                stack.pop()
+                finish(parent, kids)
+                node = parent
+
+
+def finish(node, kids):
+    # Give node its children, in layout order.
+    i = 0
+    for field, what in arena.layouts[node.__class__]:
+        if what == arena.NODE:
+            setattr(node, field, kids[i])
+            i += 1
+        elif what == arena.NODES:
+            # A Program's declarations are a list, a block's items a tuple.
+            if node.__class__ is symbol.Program:
+                setattr(node, field, kids)
+            else:
+                setattr(node, field, tuple(kids))
+
+def dumps(obj):
+    # obj is a symbol node, or a sequence or iterable of tokens.
+    encoder = Encoder()
+    if isinstance(obj, symbol.ASTNode):
+        encoder.tree(obj)
+    else:
+        encoder.tokens(obj)
+    return bytes(encoder.out)
+
+def dump(obj, f):
+    # Write obj to the binary file f a chunk at a time.
+    encoder = Encoder(f.write)
+    if isinstance(obj, symbol.ASTNode):
+        encoder.tree(obj)
+    else:
+        encoder.tokens(obj)
+    f.write(encoder.out)
+
+def loads(data):
+    # The node or token list in data.
+    decoder = Decoder(data)
+    what = decoder.header()
+    if what == TREE:
+        obj = decoder.tree()
+    elif what == STREAM:
+        obj = decoder.tokens()
+    else:
+        raise SerialError(what, "Unknown contents")
+    if decoder.pos != len(data):
+        raise SerialError(None, "Trailing data")
+    if obj.__class__ is symbol.Program:
+        obj._names = decoder.names
+    return obj
+
+def load(f):
+    return loads(f.read())
@@ -1,4 +1,3 @@
-import collections
 from . import exception
 from . import token
 
@@ -65,6 +64,11 @@ class TrailingCharactersProgramError(ParseError):
         self.expression = expr
         self.message = message
 
+class UnexpectedEndError(ParseError):
+    def __init__(self, expr="", message="Unexpected end of input"):
+        self.expression = expr
+        self.message = message
+
 class ValidationError(ParseError):
     def __init__(self, expr):
         self.expression = expr
@@ -127,431 +131,437 @@ class MultipleDefinitionsOfFunction(ValidationError):
     pass
 class MultipleDeclarationsInScope(ValidationError):
     pass
+class FunctionDeclarationMismatch(ValidationError):
+    pass
 
 
 class ASTNode():
-    def __init__(self):
-        pass
+    # Nodes keep their children and tokens in slots, named in _fields, and
+    # have no instance __dict__.
+    __slots__ = ()
+    _fields = ()
+
+    def validate(self):
+        # Check the whole tree.  Each node's check() tests the node itself
+        # and returns its children, which are checked in turn from an
+        # explicit stack, so deep trees don't hit the recursion limit.
+        stack = [self]
+        while stack:
+            children = stack.pop().check()
+            stack.extend(reversed(children))
+
+    def check(self):
+        return []
+
+    def __str__(self, level=0):
+        # The tree as indented text, from thicc.printer, which needs this
+        # module.
+        from . import printer
+        return "".join(printer.textLines(self, level))
+
+    def __copy__(self):
+        return copyNode(self)
 
     def __eq__(self, other):
-        if isinstance(other, self.__class__)\
-                and self.__dict__==other.__dict__:
-            return True
-        return False
+        # Compared field by field from an explicit stack.  Subtrees that
+        # are the same object, like those shared by a NodeTable, are equal
+        # without being walked, and shared subtrees (of any tables) with
+        # different structural hashes are unequal.
+        stack = [(self, other)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if isinstance(a, ASTNode):
+                if not isinstance(b, a.__class__):
+                    return False
+                if isinstance(a, Expression):
+                    h = a._hash
+                    if h is not None and b._hash is not None\
+                            and h != b._hash:
+                        return False
+                stack.extend([(getattr(a, field), getattr(b, field))
+                                for field in a._fields])
+            elif type(a) is list or type(a) is tuple:
+                if type(b) is not type(a) or len(b) != len(a):
+                    return False
+                stack.extend(zip(a, b))
+            elif a != b:
+                return False
+        return True
 
 class Expression(ASTNode):
-    def __init__(self):
-        self.terminal = False
-    
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression"
-        return out
+    # _hash is the structural hash of a node shared by a NodeTable, None
+    # for other nodes.  It is set in __new__, so that nodes made without
+    # __init__ (by thicc.serial, arenas, copies and pickles) have it too.
+    # It is only good in the process that made it, so it isn't pickled or
+    # copied.
+    __slots__ = ('_hash',)
+
+    def __new__(cls, *args):
+        node = object.__new__(cls)
+        node._hash = None
+        return node
+
+    def __getstate__(self):
+        return None, {field: getattr(self, field) for field in self._fields}
 
 class BlockItem(ASTNode):
-    pass
+    __slots__ = ()
 
 class Declaration(BlockItem):
-    def __init__(self):
-        self.terminal = False
-
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Declaration"
-        return out
+    __slots__ = ()
 
 class Statement(BlockItem):
-    def __init__(self):
-        self.terminal = False
-
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement"
-        return out
+    __slots__ = ()
 
 
 class Program(ASTNode):
-    def __init__(self, declarations):
-        self.terminal = False
+    # functions is the FunctionTable of the declarations, made by the
+    # parser, and names the token.NameTable of the tokens they were parsed
+    # from.  Programs made some other way get them when they are first
+    # asked for.
+    __slots__ = ('declarations', '_functions', '_names')
+    _fields = ('declarations',)
+
+    def __init__(self, declarations, functions=None, names=None):
         if declarations is None:
             self.declarations = []
         else:
             self.declarations = declarations
-
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Program" + "\n"
-        for d in self.declarations:
-            out += d.__str__(level=level+1)
-        return out
-
-    def validate(self):
-        funcDefs = []
+        self._functions = functions
+        self._names = names
+
+    def __reduce__(self):
+        # Pickles (and so multiprocessing) and deep copies of whole programs
+        # use the compact format of thicc.serial, which parses skipped
+        # function bodies.  serial needs this module, so it is imported
+        # here.  Other nodes pickle as usual.
+        from . import serial
+        return (serial.loads, (serial.dumps(self),))
+
+    @property
+    def functions(self):
+        functions = getattr(self, '_functions', None)
+        if functions is None:
+            functions = FunctionTable()
+            for d in self.declarations:
+                if isinstance(d, FunctionD):
+                    functions.add(d)
+            self._functions = functions
+        return functions
+
+    @property
+    def names(self):
+        names = getattr(self, '_names', None)
+        if names is None:
+            names = token.NameTable()
+            self._names = names
+        return names
+
+    def check(self):
+        # A new table, to check the declarations as they are now.
+        functions = FunctionTable()
         for d in self.declarations:
             if not isinstance(d, Declaration):
                 raise NonDeclarationInProgram(d)
-            if isinstance(d, FunctionD) and d.body is not None:
-                if d.name in funcDefs:
-                    raise MultipleDefinitionsOfFunction(d)
-                funcDefs.append(d.name)
-            d.validate()
+            if isinstance(d, FunctionD):
+                functions.add(d)
+        return self.declarations
+
+    def parseBodies(self):
+        # Parse any function bodies that were skipped.
+        for d in self.declarations:
+            if isinstance(d, FunctionD):
+                d.body
 
 #
 # Expressions
 #
 
 class BinaryOpE(Expression):
+    __slots__ = ('op', 'expr1', 'expr2')
+    _fields = __slots__
+
     def __init__(self, opTok, expr1, expr2):
-        super().__init__()
         self.op = opTok
         self.expr1 = expr1
         self.expr2 = expr2
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(BinaryOp): " + self.op.val + '\n'
-        out += self.expr1.__str__(level=level+1)
-        out += self.expr2.__str__(level=level+1)
-        return out
-
-    def validate(self):
+    def check(self):
         if not isinstance(self.op, token.BinaryOp):
             raise NonBinaryOperatorInExpression(self.op)
         if not isinstance(self.expr1, Expression):
             raise BinaryOperandNotExpression(self.expr1)
-        self.expr1.validate()
         if not isinstance(self.expr2, Expression):
             raise BinaryOperandNotExpression(self.expr1)
-        self.expr2.validate()
+        return [self.expr1, self.expr2]
 
 class ConstantE(Expression):
+    __slots__ = ('value',)
+    _fields = __slots__
+
     def __init__(self, tok):
-        super().__init__()
-        self.terminal = True
         self.value = tok
-    
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(Constant): " + self.value.val + '\n'
-        return out
 
-    def validate(self):
+    def check(self):
         if not isinstance(self.value, token.Constant):
             raise NotConstant(self.op)
+        return []
 
 class VarRefE(Expression):
+    __slots__ = ('id',)
+    _fields = __slots__
+
     def __init__(self, idTok):
-        super().__init__()
         self.id = idTok
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(Variable): " + self.id.val + '\n'
-        return out
-    def validate(self):
+
+    def check(self):
         if not isinstance(self.id, token.Identifier):
             raise VariableIDNotIdentifier(self.id)
+        return []
 
 class AssignE(Expression):
+    __slots__ = ('id', 'op', 'expr')
+    _fields = __slots__
+
     def __init__(self, idTok, opTok, expr):
-        super().__init__()
         self.id = idTok
         self.op = opTok
         self.expr = expr
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(Assign): {0:s} {1:s}\n".format(
-                                            self.id.val, self.op.val)
-        out += self.expr.__str__(level=level+1)
-        return out
-    def validate(self):
+
+    def check(self):
         if not isinstance(self.id, token.Identifier):
             raise VariableIDNotIdentifier(self.id)
         if not isinstance(self.op, token.AssignmentOp):
             raise NotAssignmentOperator(self.op)
         if not isinstance(self.expr, Expression):
             raise AssignOperandNotExpression(self.expr)
-        self.expr.validate()
+        return [self.expr]
 
 class UnaryOpE(Expression):
+    __slots__ = ('op', 'expr')
+    _fields = __slots__
+
     def __init__(self, opTok, expr):
-        super().__init__()
         self.op = opTok
         self.expr = expr
-    
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(UnaryOp): " + self.op.val + '\n'
-        out += self.expr.__str__(level=level+1)
-        return out
 
-    def validate(self):
+    def check(self):
         if not isinstance(self.op, token.UnaryOp):
             raise NotUnaryOperator(self.op)
         if not isinstance(self.expr, Expression):
             raise UnaryOperandNotExpression(self.expr)
-        self.expr.validate()
+        return [self.expr]
 
 class IncrementPreE(Expression):
+    __slots__ = ('op', 'var')
+    _fields = __slots__
+
     def __init__(self, opTok, var):
-        super().__init__()
         self.op = opTok
         self.var = var
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(IncrementPre): " + self.op.val + '\n'
-        out += self.var.__str__(level=level+1)
-        return out
-    def validate(self):
+
+    def check(self):
         if not isinstance(self.op, token.IncrementOp):
             raise NotIncrementOperator(self.op)
         if not isinstance(self.var, VarRefE):
             raise IncrementOperandNotVariableRef(self.var)
-        self.var.validate()
+        return [self.var]
 
 class IncrementPostE(Expression):
+    __slots__ = ('op', 'var')
+    _fields = __slots__
+
     def __init__(self, opTok, var):
-        super().__init__()
         self.op = opTok
         self.var = var
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(IncrementPost): " + self.op.val + '\n'
-        out += self.var.__str__(level=level+1)
-        return out
-    def validate(self):
+
+    def check(self):
         if not isinstance(self.op, token.IncrementOp):
             raise NotIncrementOperator(self.op)
         if not isinstance(self.var, VarRefE):
             raise IncrementOperandNotVariableRef(self.var)
-        self.var.validate()
+        return [self.var]
 
 class ConditionalE(Expression):
+    __slots__ = ('cond', 'true', 'false')
+    _fields = __slots__
+
     def __init__(self, condExpr, trueExpr, falseExpr):
         self.cond = condExpr
         self.true = trueExpr
         self.false = falseExpr
-    
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Expression(Conditional): " + '\n'
-        out += self.cond.__str__(level=level+1)
-        out += self.true.__str__(level=level+1)
-        out += self.false.__str__(level=level+1)
-        return out
 
-    def validate(self):
+    def check(self):
         if not isinstance(self.cond, Expression):
             raise ConditionNotExpression(self.cond)
-        self.cond.validate()
         if not isinstance(self.true, Expression):
             raise TernaryIfNotExpression(self.true)
-        self.true.validate()
         if not isinstance(self.false, Expression):
             raise TernaryElseNotExpression(self.false)
-        self.false.validate()
+        return [self.cond, self.true, self.false]
 
 #
 # Statements
 #
 
 class ReturnS(Statement):
+    __slots__ = ('value',)
+    _fields = __slots__
+
     def __init__(self, expr):
-        super().__init__()
         self.value = expr
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(Return):" + '\n'
-        out += self.value.__str__(level=level+1)
-        return out
-
-    def validate(self):
+    def check(self):
         if not isinstance(self.value, Expression):
             raise ReturnValueNotExpression(self.value)
-        self.value.validate()
+        return [self.value]
 
 class ExpressionS(Statement):
+    __slots__ = ('expr',)
+    _fields = __slots__
+
     def __init__(self, expr=None):
-        super().__init__()
         self.expr = expr
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(Expression):"+'\n'
+    def check(self):
+        # A null statement has no expression.
         if self.expr is None:
-            out += self.expr.__str__(level=level+1)
-        else:
-            out += buf + "   " + "NULL\n"
-        return out
-
-    def validate(self):
+            return []
         if not isinstance(self.expr, Expression):
             raise NotExpression(self.expr)
-        self.expr.validate()
+        return [self.expr]
 
 class ConditionalS(Statement):
+    __slots__ = ('cond', 'ifS', 'elseS')
+    _fields = __slots__
+
     def __init__(self, condExpr, ifStmnt, elseStmnt=None):
-        super().__init__()
         self.cond = condExpr
         self.ifS = ifStmnt
         self.elseS = elseStmnt
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(Conditional):"+'\n'
-        out += self.ifS.__str__(level=level+1)
-        if elseS is not None:
-            out += self.elseS.__str__(level=level+1)
-        return out
-
-    def validate(self):
+    def check(self):
         if not isinstance(self.cond, Expression):
             raise ConditionNotExpression(self.cond)
-        self.cond.validate()
         if not isinstance(self.ifS, Statement):
             raise IfBlockNotStatement(self.ifS)
-        self.ifS.validate()
         if self.elseS is not None:
             if not isinstance(self.elseS, Statement):
                 raise ElseBlockNotStatement(self.elseS)
-            self.elseS.validate()
+            return [self.cond, self.ifS, self.elseS]
+        return [self.cond, self.ifS]
 
-class CompoundS(Statement, collections.UserList):
-    def __init__(self, items=[]):
-        super().__init__()
-        self.data = items
+class CompoundS(Statement):
+    # The block items are kept in a tuple, and the statement can be used
+    # as a sequence of them.
+    __slots__ = ('items',)
+    _fields = __slots__
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(Compound):"+'\n'
-        for item in self.data:
-            out += item.__str__(level=level+1)
-        return out
+    def __init__(self, items=()):
+        self.items = tuple(items)
 
-    def validate(self):
-        decs = []
-        for bi in self.data:
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, i):
+        return self.items[i]
+
+    def check(self):
+        decs = set()
+        for bi in self.items:
             if not isinstance(bi, Statement)\
                     and not isinstance(bi, Declaration):
                 raise NonBlockItemInCompoundStatement(bi)
-            if isinstance(bi, FunctionD) and bi.body is not None:
+            if isinstance(bi, FunctionD) and bi.defined:
                 raise IllegalFunctionDefinition(bi)
             if isinstance(bi, VariableD):
-                if bi.id in decs:
+                if bi.id.val in decs:
                     raise MultipleDeclarationsInScope(bi)
-                decs.append(bi.id)
+                decs.add(bi.id.val)
             if isinstance(bi, FunctionD):
-                if bi.name in decs:
+                if bi.name.val in decs:
                     raise MultipleDeclarationsInScope(bi)
-                decs.append(bi.name)
-            bi.validate()
+                decs.add(bi.name.val)
+        return self.items
 
 class IterationS(Statement):
-    pass
+    __slots__ = ()
 
 class ForS(IterationS):
+    __slots__ = ('init', 'cond', 'post', 'body')
+    _fields = __slots__
+
     def __init__(self, init, cond, post, body):
-        super().__init__()
         self.init = init
         self.cond = cond
         self.post = post
         self.body = body
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(For):"+'\n'
-        out += self.init.__str__(level=level+1)
-        out += self.cond.__str__(level=level+1)
-        out += self.post.__str__(level=level+1)
-        out += self.body.__str__(level=level+1)
-        return out
-
-    def validate(self):
+    def check(self):
         if self.init is not None and not isinstance(self.init, Expression)\
                 and not isinstance(self.init, VariableD):
             raise InvalidForInit(self.cond)
-        if self.init is not None:
-            self.init.validate()
         if not isinstance(self.cond, Expression):
             raise ConditionNotExpression(self.cond)
-        self.cond.validate()
         if self.post is not None and not isinstance(self.post, Expression):
             raise InvalidForPost(self.post)
-        if self.post is not None:
-            self.post.validate()
         if not isinstance(self.body, Statement):
             raise IterBodyNotStatement(self.body)
-        self.body.validate()
+        return [node for node in (self.init, self.cond, self.post, self.body)
+                if node is not None]
 
 
 class WhileS(IterationS):
+    __slots__ = ('cond', 'body')
+    _fields = __slots__
+
     def __init__(self, cond, body):
-        super().__init__()
         self.cond = cond
         self.body = body
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(While):"+'\n'
-        out += self.cond.__str__(level=level+1)
-        out += self.body.__str__(level=level+1)
-        return out
-
-    def validate(self):
+    def check(self):
         if not isinstance(self.cond, Expression):
             raise ConditionNotExpression(self.cond)
-        self.cond.validate()
         if not isinstance(self.body, Statement):
             raise IterBodyNotStatement(self.body)
-        self.body.validate()
+        return [self.cond, self.body]
 
 class DoS(IterationS):
+    __slots__ = ('cond', 'body')
+    _fields = __slots__
+
     def __init__(self, cond, body):
-        super().__init__()
         self.cond = cond
         self.body = body
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(Do):"+'\n'
-        out += self.body.__str__(level=level+1)
-        out += self.cond.__str__(level=level+1)
-        return out
-
-    def validate(self):
+    def check(self):
         if not isinstance(self.cond, Expression):
             raise ConditionNotExpression(self.cond)
-        self.cond.validate()
         if not isinstance(self.body, Statement):
             raise IterBodyNotStatement(self.body)
-        self.body.validate()
+        return [self.cond, self.body]
 
 class JumpS(Statement):
-    pass
+    __slots__ = ()
 
 class BreakS(JumpS):
-    def __init__(self):
-        super().__init__()
-
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(Break)" + '\n'
-        return out
+    __slots__ = ()
+    _fields = __slots__
 
-    def validate(self):
-        pass
+    def check(self):
+        return []
 
 class ContinueS(JumpS):
-    def __init__(self):
-        super().__init__()
+    __slots__ = ()
+    _fields = __slots__
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Statement(Continue)" + '\n'
-        return out
-
-    def validate(self):
-        pass
+    def check(self):
+        return []
 
 
 
@@ -560,52 +570,261 @@ class ContinueS(JumpS):
 #
 
 class VariableD(Declaration):
+    __slots__ = ('id', 'expr')
+    _fields = __slots__
+
     def __init__(self, idTok, expr=None):
-        super().__init__()
         self.id = idTok
         self.expr = expr
 
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Declaration(Variable): " + self.id.val+'\n'
-        if self.expr is not None:
-            out += self.expr.__str__(level=level+1)
-        return out
-
-    def validate(self):
+    def check(self):
         if not isinstance(self.id, token.Identifier):
             raise VariableIDNotIdentifier(self.id)
         if self.expr is not None:
             if not isinstance(self.expr, Expression):
                 raise VariableInitializerNotExpression(self.expr)
-            self.expr.validate()
+            return [self.expr]
+        return []
 
 class FunctionD(Declaration):
-    def __init__(self, name, pars, body=None):
-        super().__init__()
+    # The body may be left unparsed: parseBody is then a function that
+    # parses (and validates) it, called the first time body is used.
+    __slots__ = ('name', 'pars', '_body', 'parseBody')
+    _fields = ('name', 'pars', 'body')
+
+    def __init__(self, name, pars, body=None, parseBody=None):
         self.name = name
         if pars is None:
-            self.pars = []
+            self.pars = ()
         else:
-            self.pars = pars
-        self.body = body
-
-    def __str__(self, level=0):
-        buf = level * "   "
-        out = buf + "Function: " + self.name.val + '('\
-                + ', '.join([tok.val for tok in self.pars]) + ')\n'
-        for item in self.body:
-            out += item.__str__(level=level+1)
-        return out
-
-    def validate(self):
+            self.pars = tuple(pars)
+        self._body = body
+        self.parseBody = parseBody
+
+    @property
+    def body(self):
+        if self.parseBody is not None:
+            self._body = self.parseBody()
+            self.parseBody = None
+        return self._body
+
+    @body.setter
+    def body(self, body):
+        self._body = body
+        self.parseBody = None
+
+    @property
+    def defined(self):
+        # Whether this is a definition, without parsing the body.
+        return self._body is not None or self.parseBody is not None
+
+    def __getstate__(self):
+        # Pickles and deep copies get the parsed body.
+        state = {'name': self.name, 'pars': self.pars, '_body': self.body,
+                    'parseBody': None}
+        return None, state
+
+    def check(self):
         if not isinstance(self.name, token.Identifier):
             raise FunctionNameNotIdentifier(self.name)
         for p in self.pars:
             if not isinstance(p, token.Identifier):
                 raise FunctionParameterNotIdentifier(p)
-        if self.body is not None:
-            if not isinstance(self.body, CompoundS):
-                raise FunctionBodyNotCompoundStatement(self.expr)
-            self.body.validate()
+        # A body still to be parsed is checked when it is.
+        if self.parseBody is None and self._body is not None:
+            if not isinstance(self._body, CompoundS):
+                raise FunctionBodyNotCompoundStatement(self._body)
+            return [self._body]
+        return []
+
 
+class FunctionEntry():
+    # What a FunctionTable knows about one function.
+    __slots__ = ('name', 'nPars', 'declarations', 'definition')
+
+    def __init__(self, name, nPars):
+        self.name = name
+        self.nPars = nPars
+        self.declarations = []
+        self.definition = None
+
+class FunctionTable():
+    # A program's functions by name: for each, its parameter count, the
+    # FunctionDs that declare it and the one that defines it.  Redefinitions
+    # and declarations that disagree on the number of parameters are caught
+    # as the functions are added, so each check is one dictionary lookup.
+    # The language has no call expressions yet, so there are no call sites
+    # to record.
+
+    def __init__(self):
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        return self.entries[name]
+
+    def lookup(self, name):
+        # The FunctionEntry for name, or None.
+        return self.entries.get(name)
+
+    def add(self, func):
+        name = func.name.val
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = FunctionEntry(name, len(func.pars))
+            self.entries[name] = entry
+        elif len(func.pars) != entry.nPars:
+            raise FunctionDeclarationMismatch(func)
+        if func.defined:
+            if entry.definition is not None:
+                raise MultipleDefinitionsOfFunction(func)
+            entry.definition = func
+        else:
+            entry.declarations.append(func)
+        return entry
+
+
+class NodeTable():
+    # Hash-consing of pure expressions: constants, variable references and
+    # the unary, binary and conditional operators over them.  A table keeps
+    # one node for each distinct such subtree, so repeated subexpressions
+    # are stored once, and two of its nodes are equal exactly when they
+    # are the same object.  Expressions with side effects (assignments and
+    # increments) and everything above them are never shared, nor are
+    # statements and declarations.
+    #
+    # A node's key is its class, its tokens' values and the identities of
+    # its children, which are already the table's own nodes.  Each node's
+    # structural hash, built from its class, its tokens and its children's
+    # hashes, is worked out once when the node is added and kept on the
+    # node, where ASTNode.__eq__ uses it to tell unequal shared trees apart
+    # straight away.  Shared nodes must not be changed.
+
+    pure = (ConstantE, VarRefE, UnaryOpE, BinaryOpE, ConditionalE)
+
+    def __init__(self):
+        self.nodes = {}
+        self.hashes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return id(node) in self.hashes
+
+    def hash(self, node):
+        # The structural hash of one of the table's nodes.
+        return self.hashes[id(node)]
+
+    def intern(self, node):
+        # The table's node equal to node, adding node if there is none yet.
+        # node's children must already be the table's nodes; if any of
+        # them isn't, or node isn't pure, node itself is returned.
+        if node.__class__ not in self.pure:
+            return node
+        key = [node.__class__]
+        parts = [node.__class__.__name__]
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, token.Token):
+                key.append((value.kind, value.val))
+                parts.append((value.kind, value.val))
+            elif id(value) in self.hashes:
+                key.append(id(value))
+                parts.append(self.hashes[id(value)])
+            else:
+                return node
+        key = tuple(key)
+        shared = self.nodes.get(key)
+        if shared is None:
+            shared = node
+            self.nodes[key] = node
+            node._hash = hash(tuple(parts))
+            self.hashes[id(node)] = node._hash
+        return shared
+
+    def make(self, cls, *args):
+        # Like cls(*args), but shared where possible.
+        return self.intern(cls(*args))
+
+    def share(self, tree):
+        # Replace the pure expressions in tree by the table's nodes, in
+        # place, and return the new root (which is tree unless tree is
+        # itself a pure expression).  The tree is walked in post-order
+        # from an explicit stack.  Skipped function bodies are left alone.
+        results = []
+        stack = [(tree, None)]
+        while stack:
+            node, kids = stack.pop()
+            if kids is None:
+                kids = nodeChildren(node)
+                stack.append((node, len(kids)))
+                stack.extend([(kid, None) for kid in reversed(kids)])
+                continue
+            n = len(results) - kids
+            if kids:
+                replaceChildren(node, results[n:])
+                del results[n:]
+            results.append(self.intern(node))
+        return results[0]
+
+
+def nodeChildren(node):
+    # The child nodes of node, in field order.  A function whose body has
+    # not been parsed has none.
+    if isinstance(node, FunctionD) and node.parseBody is not None:
+        return []
+    kids = []
+    for field in node._fields:
+        value = getattr(node, field)
+        if isinstance(value, ASTNode):
+            kids.append(value)
+        elif isinstance(value, (list, tuple)):
+            kids.extend([v for v in value if isinstance(v, ASTNode)])
+    return kids
+
+def replaceChildren(node, kids):
+    # Put kids in place of node's child nodes, in the order nodeChildren()
+    # gives them.
+    kids = iter(kids)
+    for field in node._fields:
+        value = getattr(node, field)
+        if isinstance(value, ASTNode):
+            setattr(node, field, next(kids))
+        elif isinstance(value, list):
+            value[:] = [next(kids) if isinstance(v, ASTNode) else v
+                        for v in value]
+        elif isinstance(value, tuple):
+            setattr(node, field, tuple([next(kids) if isinstance(v, ASTNode)
+                                        else v for v in value]))
+
+def copyNode(node):
+    # A copy of node with the same children and tokens.  Lists are copied,
+    # so replaceChildren() on the copy leaves node alone.  The copy isn't a
+    # NodeTable's, so it gets no structural hash.
+    cls = node.__class__
+    new = cls.__new__(cls)
+    for klass in cls.__mro__:
+        for field in getattr(klass, '__slots__', ()):
+            if field != '_hash' and hasattr(node, field):
+                value = getattr(node, field)
+                if isinstance(value, list):
+                    value = list(value)
+                setattr(new, field, value)
+    return new
+
+def copyTree(tree):
+    # A copy of tree sharing none of its nodes, only its tokens.
+    top = copyNode(tree)
+    stack = [top]
+    while stack:
+        node = stack.pop()
+        kids = [copyNode(kid) for kid in nodeChildren(node)]
+        replaceChildren(node, kids)
+        stack.extend(kids)
+    return top
@@ -1,293 +1,401 @@
 
-class Token():
+import sys
 
-    def __init__(self):
-        self.val = None
+class Token():
+    __slots__ = ()
+    val = None
+    kind = None
+    category = 0
+    # Only Identifiers made by a NameTable have these (see there).
+    ident = None
+    table = None
 
     def __str__(self):
         return str(self.val)
 
     def __eq__(self, other):
+        if other is self:
+            return True
         if isinstance(other, self.__class__)\
                 and self.val==other.val:
             return True
         return False
 
+class StatelessToken(Token):
+    # Tokens whose value is fixed by their class. Every instance of such a
+    # class is the same shared object, created on first use.
+    __slots__ = ()
+
+    def __new__(cls):
+        inst = cls.__dict__.get('_instance')
+        if inst is None:
+            inst = super().__new__(cls)
+            cls._instance = inst
+        return inst
+
 #
 # Top-level Grammar Elements
 #
 
-class Keyword(Token):
-    pass
+class Keyword(StatelessToken):
+    __slots__ = ()
 
 class Identifier(Token):
-    def __init__(self, val):
-        self.val = val
+    # ident is the name's id in table, the NameTable that made the token.
+    # Copies made by pickling belong to no table.
+    __slots__ = ('val', 'ident', 'table')
+    def __init__(self, val, ident=None, table=None):
+        self.val = sys.intern(val)
+        self.ident = ident
+        self.table = table
+
+    def __reduce__(self):
+        return (Identifier, (self.val,))
 
 class Constant(Token):
+    __slots__ = ('val',)
     def __init__(self, val):
-        self.val = val
+        self.val = sys.intern(val)
 
 class StringLtrl(Token):
-    pass
+    __slots__ = ('val',)
+    def __init__(self, val):
+        self.val = val
 
-class Punctuator(Token):
-    pass
+class Punctuator(StatelessToken):
+    __slots__ = ()
 
 #
 # Keywords
 #
 
 class Return(Keyword):
-    def __init__(self):
-        self.val = 'return'
+    __slots__ = ()
+    val = 'return'
 
 class Int(Keyword):
-    def __init__(self):
-        self.val = 'int'
+    __slots__ = ()
+    val = 'int'
 
 class If(Keyword):
-    def __init__(self):
-        self.val = 'if'
+    __slots__ = ()
+    val = 'if'
 
 class Else(Keyword):
-    def __init__(self):
-        self.val = 'else'
+    __slots__ = ()
+    val = 'else'
 
 class For(Keyword):
-    def __init__(self):
-        self.val = 'for'
+    __slots__ = ()
+    val = 'for'
 
 class While(Keyword):
-    def __init__(self):
-        self.val = 'while'
+    __slots__ = ()
+    val = 'while'
 
 class Do(Keyword):
-    def __init__(self):
-        self.val = 'do'
+    __slots__ = ()
+    val = 'do'
 
 class Break(Keyword):
-    def __init__(self):
-        self.val = 'break'
+    __slots__ = ()
+    val = 'break'
 
 class Continue(Keyword):
-    def __init__(self):
-        self.val = 'continue'
+    __slots__ = ()
+    val = 'continue'
 
 #
 # Constants
 #
 
 class IntC(Constant):
-    pass
+    __slots__ = ()
 
 #
 # Punctuators
 #
 
 class Semicolon(Punctuator):
-    def __init__(self):
-        self.val = ';'
+    __slots__ = ()
+    val = ';'
 
 class Brace(Punctuator):
-    pass
+    __slots__ = ()
 
 class OpenBrace(Brace):
-    def __init__(self):
-        self.val = '}'
+    __slots__ = ()
+    val = '}'
 
 class ClosedBrace(Brace):
-    def __init__(self):
-        self.val = '}'
+    __slots__ = ()
+    val = '}'
 
 class Parentheses(Punctuator):
-    pass
+    __slots__ = ()
 
 class OpenParentheses(Parentheses):
-    def __init__(self):
-        self.val = '('
+    __slots__ = ()
+    val = '('
 
 class ClosedParentheses(Parentheses):
-    def __init__(self):
-        self.val = ')'
+    __slots__ = ()
+    val = ')'
 
 class Comma(Punctuator):
-    def __init__(self):
-        self.val = ','
+    __slots__ = ()
+    val = ','
 
 # Operators
 
 class Operator(Punctuator):
-    pass
+    __slots__ = ()
 
 class UnaryOp(Operator):
-    pass
+    __slots__ = ()
 
 class BinaryOp(Operator):
-    pass
+    __slots__ = ()
 
 class TernaryOp(Operator):
-    pass
+    __slots__ = ()
 
 class AssignmentOp(Operator):
-    pass
+    __slots__ = ()
 
 # Assignment Operators
 
 class Assign(AssignmentOp):
-    def __init__(self):
-        self.val = '='
+    __slots__ = ()
+    val = '='
 
 class CompoundAssignmentOp(AssignmentOp):
-    pass
+    __slots__ = ()
 
 class AssignAdd(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '+='
+    __slots__ = ()
+    val = '+='
 
 class AssignSub(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '-='
+    __slots__ = ()
+    val = '-='
 
 class AssignMult(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '*='
+    __slots__ = ()
+    val = '*='
 
 class AssignDiv(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '/='
+    __slots__ = ()
+    val = '/='
 
 class AssignMod(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '%='
+    __slots__ = ()
+    val = '%='
 
 class AssignBShiftL(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '<<='
+    __slots__ = ()
+    val = '<<='
 
 class AssignBShiftR(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '>>='
+    __slots__ = ()
+    val = '>>='
 
 class AssignBAnd(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '&='
+    __slots__ = ()
+    val = '&='
 
 class AssignBOr(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '|='
+    __slots__ = ()
+    val = '|='
 
 class AssignBXor(CompoundAssignmentOp):
-    def __init__(self):
-        self.val = '^='
+    __slots__ = ()
+    val = '^='
 
 # Unary Operations
 
 class Not(UnaryOp):
-    def __init__(self):
-        self.val = '!'
+    __slots__ = ()
+    val = '!'
 
 class Neg(UnaryOp,BinaryOp):
-    def __init__(self):
-        self.val = '-'
+    __slots__ = ()
+    val = '-'
 
 class Complement(UnaryOp):
-    def __init__(self):
-        self.val = '~'
+    __slots__ = ()
+    val = '~'
 
 class IncrementOp(UnaryOp):
-    pass
+    __slots__ = ()
 
 class Increment(IncrementOp):
-    def __init__(self):
-        self.val = "++"
+    __slots__ = ()
+    val = "++"
 
 class Decrement(IncrementOp):
-    def __init__(self):
-        self.val = "--"
+    __slots__ = ()
+    val = "--"
         
 #Binary Operations
 
 class Add(BinaryOp):
-    def __init__(self):
-        self.val = '+'
+    __slots__ = ()
+    val = '+'
 
 class Mult(BinaryOp):
-    def __init__(self):
-        self.val = '*'
+    __slots__ = ()
+    val = '*'
 
 class Div(BinaryOp):
-    def __init__(self):
-        self.val = '/'
+    __slots__ = ()
+    val = '/'
 
 class Mod(BinaryOp):
-    def __init__(self):
-        self.val = '%'
+    __slots__ = ()
+    val = '%'
 
 class BitShiftL(BinaryOp):
-    def __init__(self):
-        self.val = '<<'
+    __slots__ = ()
+    val = '<<'
 
 class BitShiftR(BinaryOp):
-    def __init__(self):
-        self.val = '>>'
+    __slots__ = ()
+    val = '>>'
 
 class LessThan(BinaryOp):
-    def __init__(self):
-        self.val = '<'
+    __slots__ = ()
+    val = '<'
 
 class LessThanEqual(BinaryOp):
-    def __init__(self):
-        self.val = '<='
+    __slots__ = ()
+    val = '<='
 
 class GreaterThan(BinaryOp):
-    def __init__(self):
-        self.val = '>'
+    __slots__ = ()
+    val = '>'
 
 class GreaterThanEqual(BinaryOp):
-    def __init__(self):
-        self.val = '>='
+    __slots__ = ()
+    val = '>='
 
 class Equal(BinaryOp):
-    def __init__(self):
-        self.val = '=='
+    __slots__ = ()
+    val = '=='
 
 class NotEqual(BinaryOp):
-    def __init__(self):
-        self.val = '!='
+    __slots__ = ()
+    val = '!='
 
 class BitAnd(BinaryOp):
-    def __init__(self):
-        self.val = '&'
+    __slots__ = ()
+    val = '&'
 
 class BitOr(BinaryOp):
-    def __init__(self):
-        self.val = '|'
+    __slots__ = ()
+    val = '|'
 
 class BitXor(BinaryOp):
-    def __init__(self):
-        self.val = '^'
+    __slots__ = ()
+    val = '^'
 
 class And(BinaryOp):
-    def __init__(self):
-        self.val = '&&'
+    __slots__ = ()
+    val = '&&'
 
 class Or(BinaryOp):
-    def __init__(self):
-        self.val = '||'
+    __slots__ = ()
+    val = '||'
 
 # Ternary Operator
 
 class TernaryA(TernaryOp):
-    pass
+    __slots__ = ()
 
 class TernaryB(TernaryOp):
-    pass
+    __slots__ = ()
 
 class QuestionMark(TernaryA):
-    def __init__(self):
-        self.val = '?'
+    __slots__ = ()
+    val = '?'
 
 class Colon(TernaryB):
+    __slots__ = ()
+    val = ':'
+
+#
+# Identifier names
+#
+
+class NameTable():
+    # Identifier names numbered in the order they are first seen, one table
+    # per compilation: a Program keeps the table of the tokens it was
+    # parsed from.  There is one Identifier token per name, carrying the
+    # name's id, so tables of names (e.g. the resolver's scopes) key on
+    # small integers and the names themselves are only needed again for
+    # messages and labels.  An id only means something in its own table:
+    # ident() gives tokens from anywhere else the id of their name here.
+
     def __init__(self):
-        self.val = ':'
+        self.tokens = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def identifier(self, name):
+        # The Identifier token for name.
+        tok = self.tokens.get(name)
+        if tok is None:
+            tok = Identifier(name, len(self.names), self)
+            self.tokens[name] = tok
+            self.names.append(tok.val)
+        return tok
+
+    def ident(self, tok):
+        # The id of tok's name in this table.
+        if tok.table is self:
+            return tok.ident
+        return self.identifier(tok.val).ident
+
+    def name(self, ident):
+        return self.names[ident]
+
+
+#
+# Kind codes
+#
+# Every concrete token class has a small integer kind code, used by compact
+# token representations such as lexer.TokenBuffer.
+
+kinds = (Identifier, IntC, StringLtrl,
+        Return, Int, If, Else, For, While, Do, Break, Continue,
+        Semicolon, OpenBrace, ClosedBrace, OpenParentheses,
+        ClosedParentheses, Comma,
+        Assign, AssignAdd, AssignSub, AssignMult, AssignDiv, AssignMod,
+        AssignBShiftL, AssignBShiftR, AssignBAnd, AssignBOr, AssignBXor,
+        Not, Neg, Complement, Increment, Decrement,
+        Add, Mult, Div, Mod, BitShiftL, BitShiftR, LessThan, LessThanEqual,
+        GreaterThan, GreaterThanEqual, Equal, NotEqual, BitAnd, BitOr,
+        BitXor, And, Or,
+        QuestionMark, Colon)
+
+for _kind, _cls in enumerate(kinds):
+    _cls.kind = _kind
+
+#
+# Categories
+#
+# The abstract token classes get one bit each.  A concrete class's category
+# is the mask of every abstract class it derives from (e.g. Neg is both a
+# UnaryOp and a BinaryOp), so a category test is an AND of two ints.
+
+categories = (Keyword, Identifier, Constant, Punctuator, Brace, Parentheses,
+            Operator, UnaryOp, BinaryOp, TernaryOp, TernaryA, TernaryB,
+            AssignmentOp, CompoundAssignmentOp, IncrementOp)
+
+masks = {cls: 1 << bit for bit, cls in enumerate(categories)}
+
+for _cls in kinds:
+    _cls.category = sum([mask for cat, mask in masks.items()
+                            if issubclass(_cls, cat)])
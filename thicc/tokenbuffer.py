@@ -0,0 +1,229 @@
+from array import array
+from collections import deque
+from . import token
+from . import position
+from . import symbol
+from . import cursor
+
+# The shared instance for each stateless kind, None for kinds with a value.
+_instances = tuple([cls() if issubclass(cls, token.StatelessToken) else None
+                    for cls in token.kinds])
+
+class TokenBuffer():
+    # A compact token stream.  Tokens are stored as parallel arrays of kind
+    # codes and start/end offsets into the source.  Token objects are only
+    # made when the buffer is indexed: stateless tokens are the shared
+    # instances, and Identifier/Constant tokens are built from the source
+    # text and kept in a per-kind side table so each distinct value is
+    # stored once.  Identifiers go in the buffer's token.NameTable.  The
+    # source may be a str or bytes-like; token text is decoded one token
+    # at a time.  Line and column numbers are looked up from the start
+    # offsets only when asked for.
+
+    def __init__(self, source, triples=None):
+        self.source = source
+        self.kinds = array('H')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.values = {}
+        self.names = token.NameTable()
+        self.lines = position.LineIndex(source)
+        if triples is not None:
+            self.extend(triples)
+
+    def append(self, kind, start, end):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def extend(self, triples):
+        kinds = self.kinds.append
+        starts = self.starts.append
+        ends = self.ends.append
+        for kind, start, end in triples:
+            kinds(kind)
+            starts(start)
+            ends(end)
+
+    def text(self, i):
+        text = self.source[self.starts[i]:self.ends[i]]
+        if not isinstance(text, str):
+            text = str(text, 'ascii')
+        return text
+
+    def location(self, i):
+        return self.lines.lineCol(self.starts[i])
+
+    def value(self, i):
+        kind = self.kinds[i]
+        text = self.text(i)
+        if kind == token.Identifier.kind:
+            return self.names.identifier(text)
+        table = self.values.get(kind)
+        if table is None:
+            table = {}
+            self.values[kind] = table
+        tok = table.get(text)
+        if tok is None:
+            tok = token.kinds[kind](text)
+            table[text] = tok
+        return tok
+
+    def _token(self, i):
+        tok = _instances[self.kinds[i]]
+        if tok is None:
+            tok = self.value(i)
+        return tok
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._token(j) for j in range(*i.indices(len(self)))]
+        tok = _instances[self.kinds[i]]
+        if tok is None:
+            tok = self.value(i)
+        return tok
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self._token(i)
+
+
+class TokenStream(cursor.TokenCursor):
+    # Lexer output that makes tokens only as they are needed, so lexing
+    # overlaps parsing and the whole token list never exists.  It is a
+    # TokenCursor, so the Parser reads it directly; iterating gives the
+    # remaining tokens in order.  Only the tokens peeked at are held, plus
+    # the last few taken so reset() can go back up to lookahead tokens.
+    # start is the source offset of the last token taken, for locating
+    # errors.  Blocks skipped with skipBlock() are kept as TokenBuffers.
+
+    def __init__(self, source, triples, lookahead=3):
+        self.source = source
+        self.scan = iter(triples)
+        self.window = deque()
+        self.taken = deque(maxlen=lookahead)
+        self.pos = 0
+        self.start = None
+        self.lines = position.LineIndex(source)
+        self.names = token.NameTable()
+        self.decode = not isinstance(source, str)
+        self._next()
+
+    def _fill(self, k):
+        # Lex ahead until k tokens are waiting or the source is used up.
+        window = self.window
+        identifier = token.Identifier.kind
+        while len(window) < k:
+            triple = next(self.scan, None)
+            if triple is None:
+                break
+            kind, start, end = triple
+            tok = _instances[kind]
+            if tok is None:
+                text = self.source[start:end]
+                if self.decode:
+                    text = str(text, 'ascii')
+                if kind == identifier:
+                    tok = self.names.identifier(text)
+                else:
+                    tok = token.kinds[kind](text)
+            window.append((tok, start, end))
+
+    def _next(self):
+        # Lex the next token, if needed, to keep tok and kind up to date.
+        if not self.window:
+            self._fill(1)
+        if self.window:
+            self.tok = self.window[0][0]
+            self.kind = self.tok.kind
+        else:
+            self.tok = self.kind = None
+
+    def peek(self, k=0):
+        if k >= len(self.window):
+            self._fill(k+1)
+            if k >= len(self.window):
+                return None
+        return self.window[k][0]
+
+    def advance(self):
+        tok = self.tok
+        if tok is None:
+            raise symbol.UnexpectedEndError()
+        item = self.window.popleft()
+        self.taken.append(item)
+        self.pos += 1
+        self.start = item[1]
+        self._next()
+        return tok
+
+    def skipBlock(self):
+        # As TokenCursor.skipBlock.  The tokens already lexed ahead are
+        # used first, then the rest of the block comes straight from the
+        # scanner into a TokenBuffer, without making tokens.
+        block = TokenBuffer(self.source)
+        block.lines = self.lines
+        block.names = self.names
+        openBrace = token.OpenBrace.kind
+        closedBrace = token.ClosedBrace.kind
+        depth = 0
+        closed = False
+        window = self.window
+        while window and not closed:
+            tok, start, end = window.popleft()
+            kind = tok.kind
+            block.append(kind, start, end)
+            if kind == openBrace:
+                depth += 1
+            elif kind == closedBrace:
+                depth -= 1
+                closed = depth == 0
+        if not closed:
+            append = block.append
+            for kind, start, end in self.scan:
+                append(kind, start, end)
+                if kind == openBrace:
+                    depth += 1
+                elif kind == closedBrace:
+                    depth -= 1
+                    if depth == 0:
+                        closed = True
+                        break
+        # The skipped tokens can't be gone back to.
+        self.taken.clear()
+        self.pos += len(block)
+        if len(block):
+            self.start = block.starts[-1]
+        self._next()
+        return cursor.TokenCursor(block), closed
+
+    def reset(self, mark):
+        back = self.pos - mark
+        if back < 0 or back > len(self.taken):
+            raise ValueError("TokenStream can only go back {0:d} tokens"
+                                .format(self.taken.maxlen))
+        for i in range(back):
+            self.window.appendleft(self.taken.pop())
+        self.pos = mark
+        self.start = self.taken[-1][1] if self.taken else None
+        self._next()
+
+    def locate(self, e):
+        if e.offset is None and self.start is not None:
+            e.setPosition(self.start, self.lines)
+
+    def close(self):
+        # Stop lexing, releasing the scanner's hold on the source.
+        close = getattr(self.scan, 'close', None)
+        if close is not None:
+            close()
+        self.window.clear()
+        self.taken.clear()
+        self.tok = self.kind = None
+
+    def __iter__(self):
+        while self.tok is not None:
+            yield self.advance()